@@ -3,6 +3,7 @@
 Simple Dice Roller MCP Server - Provides comprehensive dice rolling functionality for games and simulations
 """
 import os
+import argparse
 import sys
 import logging
 import random
@@ -330,10 +331,24 @@ async def roll_initiative(modifier: str = "0", combatants: str = "1") -> str:
 
 # === SERVER STARTUP ===
 if __name__ == "__main__":
-    logger.info("Starting Dice Roller MCP server...")
+    # stdio by default; --transport sse (or MCP_TRANSPORT=sse) serves many
+    # clients from one process on host:port
+    parser = argparse.ArgumentParser(description="Dice Roller MCP server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse"],
+        default=os.getenv("MCP_TRANSPORT", "stdio"),
+    )
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", "8000")))
+    cli_args = parser.parse_args()
+
+    mcp.settings.host = cli_args.host
+    mcp.settings.port = cli_args.port
+    logger.info(f"Starting Dice Roller MCP server ({cli_args.transport})...")
     
     try:
-        mcp.run(transport='stdio')
+        mcp.run(transport=cli_args.transport)
     except Exception as e:
         logger.error(f"Server error: {e}", exc_info=True)
         sys.exit(1)
\ No newline at end of file
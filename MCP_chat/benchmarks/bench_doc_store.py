@@ -0,0 +1,92 @@
+"""
+Benchmark the document store with 100k documents.
+
+Builds a SQLite store in a temporary directory, then measures opening it
+again, listing ids, and random reads and edits, next to the in-memory
+store that mcp_server.py used before. Opening the SQLite store loads no
+document bodies, while the memory store has to hold the whole corpus.
+
+Run from the MCP_chat directory:
+
+    python benchmarks/bench_doc_store.py
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doc_store import MemoryDocumentStore, SQLiteDocumentStore  # noqa: E402
+
+DOCS = 100_000
+DOC_BYTES = 2048
+READS = 5000
+EDITS = 1000
+
+WORDS = "the report condenser tower budget plan outlook testimony equipment schedule".split()
+
+
+def make_doc(i: int) -> str:
+    return f"doc {i} " + " ".join(random.Random(i).choices(WORDS, k=DOC_BYTES // 7))
+
+
+def percentiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered)
+    p95 = ordered[int(len(ordered) * 0.95)]
+    return f"p50 {p50 * 1e6:8.1f} us  p95 {p95 * 1e6:8.1f} us"
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def measure(label: str, open_store):
+    start = time.perf_counter()
+    store = open_store()
+    opened = time.perf_counter() - start
+
+    ids = []
+    listed = timed(lambda: ids.extend(store.list_ids()))
+
+    rng = random.Random(0)
+    reads = [timed(lambda: store.get(rng.choice(ids))) for _ in range(READS)]
+    edits = [timed(lambda: store.replace(rng.choice(ids), "tower", "TOWER")) for _ in range(EDITS)]
+
+    print(f"{label}")
+    print(f"  open:  {opened * 1000:9.1f} ms")
+    print(f"  list:  {listed * 1000:9.1f} ms ({len(ids)} ids)")
+    print(f"  read:  {percentiles(reads)}")
+    print(f"  edit:  {percentiles(edits)}")
+    store.close()
+
+
+def main():
+    corpus = [(f"doc-{i:06d}.md", make_doc(i)) for i in range(DOCS)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "documents.db")
+        build = SQLiteDocumentStore(path)
+        build_time = timed(lambda: build.put_many(corpus))
+        build.close()
+        print(f"{DOCS} documents of ~{DOC_BYTES} bytes, {READS} reads, {EDITS} edits")
+        print(f"sqlite build: {build_time:.1f} s, file {os.path.getsize(path) / 2**20:.0f} MiB\n")
+
+        measure("sqlite", lambda: SQLiteDocumentStore(path))
+
+        def open_memory():
+            # Stands for loading the corpus into a dict at startup, leaving
+            # out where it would come from
+            store = MemoryDocumentStore()
+            store.put_many(corpus)
+            return store
+
+        measure("memory (built at open)", open_memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark 10k edits to a single 10MB document.
+
+The document is filler text with a unique marker every ~800 characters. Each edit
+replaces one marker, either at its offset (as an edit anchored on an
+offset from search_documents would) or by searching the whole document
+for it. Both stores keep the document as a piece table and reindex only
+the edited words. The SQLite store also appends each edit to its journal
+instead of rewriting the body. The baseline is what edit_doument did
+before: str.replace over the whole text, then recounting the terms of
+the old and new text for the index. Last, a rewrite of BATCH_EDITS
+markers is timed as that many separate searched edits and as one batch,
+which finds all of them in a single pass.
+
+Every edit is timed as the edit_doument tool makes it, including the
+summary and the document size it returns. Reading a chunk and a range of
+lines near the end of the document are timed the same way.
+
+Run from the MCP_chat directory:
+
+    python benchmarks/bench_edits.py
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doc_index import term_counts  # noqa: E402
+from doc_store import MemoryDocumentStore, SQLiteDocumentStore  # noqa: E402
+
+DOC_CHARS = 10 * 2**20
+MARKER_EVERY = 800
+EDITS = 10_000
+SEARCH_EDITS = 200
+BASELINE_EDITS = 10
+BATCH_EDITS = 30
+READS = 100
+CHUNK_CHARS = 16384
+
+WORDS = "the report condenser tower budget plan outlook testimony equipment schedule".split()
+DOC_ID = "big.md"
+
+
+def marker(i: int) -> str:
+    return f"m{i:06d}x"
+
+
+def make_doc() -> tuple[str, list[int]]:
+    """The document, and the offset of each marker in it."""
+    rng = random.Random(0)
+    parts = []
+    offsets = []
+    position = 0
+    i = 0
+    while position < DOC_CHARS:
+        filler = " ".join(rng.choices(WORDS, k=MARKER_EVERY // 7)) + " "
+        offsets.append(position + len(filler))
+        parts += [filler, marker(i), "\n"]
+        position += len(filler) + len(marker(i)) + 1
+        i += 1
+    return "".join(parts), offsets
+
+
+def percentiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered)
+    p95 = ordered[int(len(ordered) * 0.95)]
+    return f"p50 {p50 * 1e6:9.1f} us  p95 {p95 * 1e6:9.1f} us"
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def tool_edit(store, old: str, new: str, offset=None) -> dict:
+    """What edit_doument does for an edit: the edit, its summary and the
+    document's new size."""
+    edit = store.replace(DOC_ID, old, new, offset)
+    return {**edit.summary(), **store.metadata(DOC_ID)}
+
+
+def tool_batch(store, edits) -> dict:
+    edit = store.replace_many(DOC_ID, edits)
+    return {**edit.summary(), **store.metadata(DOC_ID)}
+
+
+def tool_reads(store, offsets: list[int]):
+    """A chunk read, which checks the chunk count first, and a line range
+    read near the end of the document."""
+    chunks = -(-store.metadata(DOC_ID)["chars"] // CHUNK_CHARS)
+    store.read_range(DOC_ID, (chunks - 1) * CHUNK_CHARS, CHUNK_CHARS)
+    store.read_lines(DOC_ID, len(offsets) - 10, 5)
+
+
+def edit_plan(offsets: list[int]) -> list[tuple[int, int]]:
+    """(marker, offset) pairs. Replacements keep the marker's length, so
+    every offset stays valid however the edits are ordered."""
+    rng = random.Random(1)
+    return [(i, offsets[i]) for i in rng.sample(range(len(offsets)), min(EDITS, len(offsets)))]
+
+
+def measure(label: str, store, doc: str, offsets: list[int]):
+    store.put(DOC_ID, doc)
+    plan = edit_plan(offsets)
+    expected = list(doc)
+    anchored = []
+    for i, offset in plan:
+        new = marker(i).upper()
+        anchored.append(timed(lambda: tool_edit(store, marker(i), new, offset)))
+        expected[offset:offset + len(new)] = new
+    # Markers not edited yet, found by searching the whole document
+    unedited = random.Random(2).sample(
+        sorted(set(range(len(offsets))) - {i for i, _ in plan}), SEARCH_EDITS + 2 * BATCH_EDITS
+    )
+    searched = []
+    for i in unedited[:SEARCH_EDITS]:
+        new = marker(i).upper()
+        searched.append(timed(lambda: tool_edit(store, marker(i), new)))
+        expected[offsets[i]:offsets[i] + len(new)] = new
+    one_by_one = unedited[SEARCH_EDITS:SEARCH_EDITS + BATCH_EDITS]
+    separate = sum(timed(lambda: tool_edit(store, marker(i), marker(i).upper())) for i in one_by_one)
+    batch = unedited[SEARCH_EDITS + BATCH_EDITS:]
+    batched = timed(lambda: tool_batch(store, [(marker(i), marker(i).upper(), None) for i in batch]))
+    for i in one_by_one + batch:
+        expected[offsets[i]:offsets[i] + len(marker(i))] = marker(i).upper()
+    reads = [timed(lambda: tool_reads(store, offsets)) for _ in range(READS)]
+    flushed = timed(store.flush)
+    assert store.get(DOC_ID) == "".join(expected), f"{label}: document does not match"
+    print(label)
+    print(f"  anchored edit:  {percentiles(anchored)}  ({len(anchored)} edits, {sum(anchored):.1f} s)")
+    print(f"  searched edit:  {percentiles(searched)}  ({len(searched)} edits)")
+    print(f"  {BATCH_EDITS} edits:       {separate * 1000:9.1f} ms one by one, {batched * 1000:.1f} ms as one batch")
+    print(f"  chunk + lines:  {percentiles(reads)}  ({READS} reads of the edited document)")
+    print(f"  flush:          {flushed * 1000:9.1f} ms")
+
+
+def measure_baseline(doc: str):
+    times = []
+    for i in range(BASELINE_EDITS):
+        def edit():
+            new = doc.replace(marker(i), marker(i).upper())
+            term_counts(doc)
+            term_counts(new)
+        times.append(timed(edit))
+    print("baseline (str.replace, reindex whole document)")
+    print(f"  edit:           {percentiles(times)}  ({BASELINE_EDITS} edits)")
+
+
+def main():
+    doc, offsets = make_doc()
+    print(f"document of {len(doc) / 2**20:.1f}M characters, {len(offsets)} markers\n")
+    measure_baseline(doc)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteDocumentStore(os.path.join(tmp, "documents.db"))
+        measure("sqlite", store, doc, offsets)
+        store.close()
+    measure("memory", MemoryDocumentStore(), doc, offsets)
+
+
+if __name__ == "__main__":
+    main()
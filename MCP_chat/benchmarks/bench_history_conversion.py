@@ -0,0 +1,65 @@
+"""
+Benchmark per-turn history conversion cost in Gemini._convert_messages.
+
+Simulates a tool-heavy session: every turn appends a user query, a model
+function call, a function response and a model answer, then converts the
+whole history the way Gemini.chat does before each request. With the
+per-message cache the per-turn cost should stay flat as history grows;
+the uncached column clears the cache before each call for comparison.
+
+Run from the MCP_chat directory:
+
+    python benchmarks/bench_history_conversion.py
+"""
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.simplefilter("ignore", FutureWarning)
+
+from core.gemini import Gemini  # noqa: E402
+
+TURNS = 1000
+REPORT_EVERY = 100
+
+
+def append_turn(messages: list, i: int):
+    messages.append({"role": "user", "parts": [{"text": f"Question {i} about @report.pdf"}]})
+    messages.append({
+        "role": "model",
+        "parts": [{"function_call": {"name": "read_doc_contents", "args": {"doc_id": f"doc_{i}.md"}}}],
+    })
+    messages.append({
+        "role": "user",
+        "parts": [{"function_response": {"name": "read_doc_contents", "response": f"Body of document {i}. " * 20}}],
+    })
+    messages.append({"role": "model", "parts": [{"text": f"Answer {i}"}]})
+
+
+def main():
+    gemini = Gemini(model="gemini-2.0-flash", api_key="benchmark")
+    messages: list = []
+
+    print(f"{'turns':>6} {'parts':>7} {'cached ms/turn':>15} {'uncached ms/turn':>17}")
+    for i in range(1, TURNS + 1):
+        append_turn(messages, i)
+
+        start = time.perf_counter()
+        gemini._convert_messages(messages)
+        cached = time.perf_counter() - start
+
+        if i % REPORT_EVERY == 0:
+            saved = gemini._content_cache.copy()
+            gemini._content_cache.clear()
+            start = time.perf_counter()
+            gemini._convert_messages(messages)
+            uncached = time.perf_counter() - start
+            gemini._content_cache = saved
+
+            print(f"{i:>6} {len(messages):>7} {cached * 1000:>15.3f} {uncached * 1000:>17.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark search_documents' index over 100k documents.
+
+Documents draw their words from a Zipf-distributed vocabulary, so queries
+mix common words matching most of the corpus with rare ones matching a
+handful of documents. Measures index build time, query latency by how
+common the query words are, and the cost of keeping the index current
+on edits, for the SQLite and in-memory stores.
+
+Run from the MCP_chat directory:
+
+    python benchmarks/bench_search.py
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doc_store import MemoryDocumentStore, SQLiteDocumentStore  # noqa: E402
+
+DOCS = 100_000
+WORDS_PER_DOC = 60
+VOCABULARY = 50_000
+QUERIES = 200
+EDITS = 500
+
+RARE = (5_000, VOCABULARY)
+MID = (200, 5_000)
+COMMON = (0, 200)
+
+# Word rank ranges the two query words are drawn from
+QUERY_KINDS = {
+    "rare words (rank 5k-50k)": (RARE, RARE),
+    "mid words (rank 200-5k)": (MID, MID),
+    "common words (rank 0-200)": (COMMON, COMMON),
+    "rare + common word": (RARE, COMMON),
+}
+
+
+def make_corpus() -> list[tuple[str, str]]:
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(VOCABULARY)]
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY)]
+    words = rng.choices(vocabulary, weights, k=DOCS * WORDS_PER_DOC)
+    return [
+        (f"doc-{i:06d}.md", " ".join(words[i * WORDS_PER_DOC:(i + 1) * WORDS_PER_DOC]))
+        for i in range(DOCS)
+    ]
+
+
+def percentiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered)
+    p95 = ordered[int(len(ordered) * 0.95)]
+    return f"p50 {p50 * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms"
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def measure(label: str, store, corpus):
+    print(label)
+    build = timed(lambda: store.put_many(corpus))
+    print(f"  index build:  {build:8.1f} s")
+    rng = random.Random(1)
+    for kind, ranges in QUERY_KINDS.items():
+        queries = [" ".join(f"w{rng.randrange(*words)}" for words in ranges) for _ in range(QUERIES)]
+        times = [timed(lambda: store.search(query, 10)) for query in queries]
+        print(f"  {kind:<26} {percentiles(times)}")
+    edits = []
+    for _ in range(EDITS):
+        # Replace a word the document has, so every edit changes the index
+        doc_id, body = rng.choice(corpus)
+        word = rng.choice(body.split())
+        edits.append(timed(lambda: store.replace(doc_id, word, f"w{rng.randrange(VOCABULARY)}")))
+    print(f"  {'edit with index update':<26} {percentiles(edits)}")
+
+
+def main():
+    corpus = make_corpus()
+    print(f"{DOCS} documents of {WORDS_PER_DOC} words, vocabulary of {VOCABULARY}, {QUERIES} two-word queries per kind\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteDocumentStore(os.path.join(tmp, "documents.db"))
+        measure("sqlite", store, corpus)
+        store.close()
+    measure("memory", MemoryDocumentStore(), corpus)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark CLI cold start: import cost and wall-clock time to first prompt.
+
+1. Runs `python -X importtime -c "import main"` and prints the modules
+   with the largest cumulative import time. google.generativeai should
+   not be among them; main.py imports it in a thread once the prompt is
+   up, while the user types.
+2. Starts `python main.py` in a pseudo-terminal and times how long it
+   takes for the "> " prompt to appear. For comparison, it also times an
+   eager variant that imports google.generativeai before main runs, the
+   way main.py started before the import was deferred.
+
+No API call is made, so any GEMINI_API_KEY value works. Unix only,
+because of the pseudo-terminal. Run from the MCP_chat directory:
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import pty
+import select
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 3
+TOP_MODULES = 15
+PROMPT_TIMEOUT = 60
+
+ENV = {**os.environ, "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "benchmark"}
+
+EAGER = (
+    "import google.generativeai, runpy, sys; "
+    "sys.argv = ['main.py']; runpy.run_path('main.py', run_name='__main__')"
+)
+
+
+def import_breakdown():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=ENV, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time:   self [us] | cumulative | imported package
+        self_field, cumulative_field, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative_field), int(self_field), depth, name.strip()))
+
+    total = next((row[0] for row in rows if row[3] == "main"), 0)
+    print(f"import main: {total / 1000:.0f} ms cumulative")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative_us, self_us, depth, name in sorted(rows, reverse=True)[:TOP_MODULES]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {'  ' * depth}{name}")
+    loaded = any(row[3] == "google.generativeai" for row in rows)
+    print(f"google.generativeai imported by 'import main': {loaded}")
+
+
+def time_to_prompt(args) -> float:
+    """Seconds from spawning the CLI until it prints its prompt."""
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(ROOT)
+        os.execve(sys.executable, [sys.executable, *args], ENV)
+
+    start = time.perf_counter()
+    output = b""
+    try:
+        while b"> " not in output:
+            if time.perf_counter() - start > PROMPT_TIMEOUT:
+                raise TimeoutError(f"No prompt after {PROMPT_TIMEOUT}s:\n{output.decode(errors='replace')}")
+            ready, _, _ = select.select([fd], [], [], 0.5)
+            if ready:
+                try:
+                    output += os.read(fd, 4096)
+                except OSError:
+                    raise RuntimeError(f"CLI exited before prompting:\n{output.decode(errors='replace')}")
+        return time.perf_counter() - start
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+        os.close(fd)
+
+
+def main():
+    import_breakdown()
+    print()
+    for label, args in (("deferred SDK import", ["main.py"]), ("eager SDK import", ["-c", EAGER])):
+        times = [time_to_prompt(args) for _ in range(RUNS)]
+        print(f"time to first prompt, {label + ':':<21} median {statistics.median(times) * 1000:7.0f} ms "
+              f"(min {min(times) * 1000:.0f}, max {max(times) * 1000:.0f}, {RUNS} runs)")
+
+
+if __name__ == "__main__":
+    main()
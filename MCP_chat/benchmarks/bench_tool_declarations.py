@@ -0,0 +1,105 @@
+"""
+Benchmark per-turn cost of turning the tool catalog into Gemini declarations.
+
+Builds a catalog of a few hundred tool schemas shaped like real MCP tools
+(nested objects, arrays of objects, enums, titles and defaults that have
+to be stripped, and some sub-schemas sent as JSON strings). It then
+compares three cases:
+
+- uncached: the declaration cache is cleared before every turn, which is
+  what every chat() call did before the cache existed
+- same catalog list: ToolManager hands back the same list object until
+  the catalog changes, so the whole result is reused
+- rebuilt catalog list: a new list holding equal tools, so every tool is
+  hashed and looked up in the per-tool cache
+
+Run from the MCP_chat directory:
+
+    python benchmarks/bench_tool_declarations.py
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.simplefilter("ignore", FutureWarning)
+
+from core.gemini import Gemini  # noqa: E402
+
+TOOLS = 300
+TURNS = 50
+
+
+def make_tool(i: int) -> dict:
+    filter_schema = {
+        "type": "object",
+        "title": "Filter",
+        "properties": {
+            "field": {"type": "string", "title": "Field", "description": "Field to filter on"},
+            "op": {"type": "string", "enum": ["eq", "ne", "lt", "gt", "contains"], "default": "eq"},
+            "value": {"type": "string", "title": "Value"},
+        },
+        "required": ["field", "value"],
+        "additionalProperties": False,
+    }
+    return {
+        "name": f"tool_{i}",
+        "description": f"Tool number {i}: searches records and returns matching rows.",
+        "input_schema": {
+            "type": "object",
+            "title": f"tool_{i}Arguments",
+            "properties": {
+                "query": {"type": "string", "title": "Query", "description": "Search text"},
+                "limit": {"type": "integer", "minimum": 1, "maximum": 100, "default": 10},
+                "sort": {"type": "string", "enum": ["asc", "desc"], "title": "Sort"},
+                "filters": {"type": "array", "items": filter_schema, "title": "Filters"},
+                "options": json.dumps({
+                    "type": "object",
+                    "properties": {
+                        "include_deleted": {"type": "boolean", "default": False},
+                        "fields": {"type": "array", "items": {"type": "string"}},
+                    },
+                }),
+            },
+            "required": ["query"],
+            "$schema": "http://json-schema.org/draft-07/schema#",
+        },
+    }
+
+
+def time_turns(gemini: Gemini, make_catalog, clear: bool) -> float:
+    total = 0.0
+    for _ in range(TURNS):
+        tools = make_catalog()
+        if clear:
+            gemini._declaration_cache.clear()
+            gemini._last_declarations = None
+        start = time.perf_counter()
+        gemini._convert_tools_to_gemini_format(tools)
+        total += time.perf_counter() - start
+    return total / TURNS
+
+
+def main():
+    gemini = Gemini(model="gemini-2.0-flash", api_key="benchmark")
+    catalog = [make_tool(i) for i in range(TOOLS)]
+
+    # The schema cleaner logs every stringified sub-schema it parses
+    with contextlib.redirect_stdout(io.StringIO()):
+        uncached = time_turns(gemini, lambda: catalog, clear=True)
+        gemini._convert_tools_to_gemini_format(catalog)
+        same_list = time_turns(gemini, lambda: catalog, clear=False)
+        rebuilt = time_turns(gemini, lambda: [dict(t) for t in catalog], clear=False)
+
+    print(f"{TOOLS} tools, average over {TURNS} turns")
+    print(f"uncached:              {uncached * 1000:8.3f} ms/turn")
+    print(f"same catalog list:     {same_list * 1000:8.3f} ms/turn")
+    print(f"rebuilt catalog list:  {rebuilt * 1000:8.3f} ms/turn")
+
+
+if __name__ == "__main__":
+    main()
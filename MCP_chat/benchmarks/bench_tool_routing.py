@@ -0,0 +1,82 @@
+"""
+Benchmark tool dispatch lookup with 20 servers exposing 500 tools.
+
+Compares the routing table used by ToolManager._find_client_with_tool
+with the previous approach of scanning every client's tool list in
+order. The fake clients answer list_tools from memory, so the scan
+numbers leave out the stdio round-trip per server that the real scan
+also paid.
+
+Run from the MCP_chat directory:
+
+    python benchmarks/bench_tool_routing.py
+"""
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.tools import ToolManager  # noqa: E402
+
+SERVERS = 20
+TOOLS_PER_SERVER = 25
+LOOKUPS = 10000
+
+
+class FakeClient:
+    """Stands in for MCPClient with an in-memory tool catalog."""
+
+    def __init__(self, index: int):
+        self.tools_version = 1
+        self._tools = [
+            SimpleNamespace(
+                name=f"server{index}_tool{j}",
+                description=f"Tool {j} of server {index}",
+                inputSchema={"type": "object", "properties": {"arg": {"type": "string"}}},
+            )
+            for j in range(TOOLS_PER_SERVER)
+        ]
+
+    async def list_tools(self):
+        return self._tools
+
+
+async def linear_scan(clients, tool_name):
+    for client in clients:
+        tools = await client.list_tools()
+        if next((t for t in tools if t.name == tool_name), None):
+            return client
+    return None
+
+
+async def main():
+    clients = {f"client_{i}": FakeClient(i) for i in range(SERVERS)}
+    names = [
+        f"server{i % SERVERS}_tool{(i * 7) % TOOLS_PER_SERVER}" for i in range(LOOKUPS)
+    ]
+
+    start = time.perf_counter()
+    await ToolManager._get_routing_table(clients)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in names:
+        await linear_scan(list(clients.values()), name)
+    scan = (time.perf_counter() - start) / LOOKUPS
+
+    start = time.perf_counter()
+    for name in names:
+        await ToolManager._find_client_with_tool(clients, name)
+    routed = (time.perf_counter() - start) / LOOKUPS
+
+    print(f"{SERVERS} servers, {SERVERS * TOOLS_PER_SERVER} tools, {LOOKUPS} lookups")
+    print(f"routing table build:  {build * 1000:.3f} ms")
+    print(f"linear scan:          {scan * 1e6:.2f} us/lookup")
+    print(f"routing table lookup: {routed * 1e6:.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
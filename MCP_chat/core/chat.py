@@ -1,18 +1,86 @@
+import asyncio
+import uuid
+from contextlib import aclosing, nullcontext, suppress
 from core.gemini import Gemini
 from mcp_client import MCPClient
 from core.tools import ToolManager
-from typing import Dict, Any, List
+from core.context import ContextBudget
+from core.limiter import ModelCallLimiter, ModelOverloadedError
+from core.metrics import metrics
+from typing import Dict, Any, List, AsyncIterator, Optional
 
 
 class Chat:
-    def __init__(self, gemini_service: Gemini, clients: dict[str, MCPClient]):
+    def __init__(
+        self,
+        gemini_service: Gemini,
+        clients: dict[str, MCPClient],
+        context_budget: Optional[ContextBudget] = None,
+        query_timeout: Optional[float] = None,
+        model_limiter: Optional[ModelCallLimiter] = None,
+    ):
         self.gemini_service: Gemini = gemini_service
         self.clients: dict[str, MCPClient] = clients
         self.messages: list[Dict[str, Any]] = []
+        self.context_budget: Optional[ContextBudget] = context_budget
+        # Index of the first message added by the query being run
+        self._turn_start: int = 0
+        # Lets the Gemini service keep one live chat session for this conversation
+        self.session_id: str = uuid.uuid4().hex
+        # Seconds a whole query may take, tool loop included
+        self.query_timeout: Optional[float] = query_timeout
+        # Event loop time the running query must finish by
+        self._deadline: Optional[float] = None
+        # Shared with other conversations when several run in one process
+        self.model_limiter: Optional[ModelCallLimiter] = model_limiter
 
     async def _process_query(self, query: str):
         self.messages.append({"role": "user", "parts": [{"text": query}]})
 
+    async def _compact_history(self):
+        """Compact older messages if the history is over the context budget."""
+        if self.context_budget is None:
+            return
+        before = list(self.messages)
+        try:
+            with metrics.span("turn", "chat", "compaction"):
+                self._turn_start = await self.context_budget.compact(
+                    self.messages, protect_from=self._turn_start
+                )
+        except Exception as e:
+            print(f"[ERROR] Chat: Error compacting history: {type(e).__name__}: {e}")
+        # The live chat session still holds the old messages; rebuild it
+        # from the compacted history on the next request
+        if len(before) != len(self.messages) or any(
+            new is not old for new, old in zip(self.messages, before)
+        ):
+            self.gemini_service.close_session(self.session_id)
+
+    def _start_deadline(self):
+        self._deadline = None
+        if self.query_timeout is not None:
+            self._deadline = asyncio.get_running_loop().time() + self.query_timeout
+
+    def _deadline_exceeded(self) -> Optional[str]:
+        """If the query is past its deadline, end the turn and return a message."""
+        if self._deadline is None or asyncio.get_running_loop().time() < self._deadline:
+            return None
+        message = f"❌ Query deadline of {self.query_timeout:.0f}s exceeded before the answer was complete."
+        # A closing model message keeps the history alternating for the next query
+        self.messages.append({"role": "model", "parts": [{"text": message}]})
+        return message
+
+    def _time_left(self) -> Optional[float]:
+        """Seconds until the query deadline, or None if there is none."""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - asyncio.get_running_loop().time())
+
+    def _model_slot(self):
+        if self.model_limiter is None:
+            return nullcontext()
+        return self.model_limiter.slot()
+
     def _has_function_calls(self, response) -> bool:
         """Check if the response contains function calls."""
         if hasattr(response, 'parts'):
@@ -23,9 +91,41 @@ class Chat:
                         return True
         return False
 
+    def _api_error_message(self, e: Exception) -> str:
+        """Turn a Gemini API exception into a message for the user."""
+        error_msg = str(e)
+        error_type = type(e).__name__
+
+        if "quota" in error_msg.lower() or "billing" in error_msg.lower():
+            return f"❌ Error: {error_msg}\n\nPlease check your Google AI Studio account and ensure you have sufficient quota."
+        elif "rate" in error_msg.lower() or "limit" in error_msg.lower():
+            return f"❌ Rate Limit Error: {error_msg}\n\nPlease wait a moment and try again."
+        elif "connection" in error_msg.lower() or "network" in error_msg.lower():
+            return f"❌ Connection Error: {error_msg}\n\nPlease check your internet connection and try again."
+        elif "permission" in error_msg.lower() or "api key" in error_msg.lower():
+            return f"❌ Authentication Error: {error_msg}\n\nPlease check your GEMINI_API_KEY in the .env file."
+        else:
+            return f"❌ API Error ({error_type}): {error_msg}"
+
     async def run(
         self,
         query: str,
+    ) -> str:
+        self._turn_start = len(self.messages)
+        self._start_deadline()
+        try:
+            with metrics.span("turn", "chat", "query"):
+                return await self._run(query)
+        except (asyncio.CancelledError, ModelOverloadedError):
+            # Drop the partial turn so the history never ends with a
+            # function call that has no matching response. An overloaded
+            # query can then be retried as is.
+            del self.messages[self._turn_start:]
+            raise
+
+    async def _run(
+        self,
+        query: str,
     ) -> str:
         final_text_response = ""
 
@@ -37,31 +137,39 @@ class Chat:
             print(f"[DEBUG] Traceback:\n{traceback.format_exc()}")
             return f"❌ Error processing query: {str(e)}"
 
+        # Text the model wrote alongside tool calls, returned with the answer
+        # as run_stream would have streamed it
+        earlier_text: list[str] = []
         while True:
+            deadline_message = self._deadline_exceeded()
+            if deadline_message:
+                return "\n".join(earlier_text + [deadline_message])
+
+            await self._compact_history()
+
             try:
                 tools = await ToolManager.get_all_tools(self.clients)
-                
-                response = self.gemini_service.chat(
-                    messages=self.messages,
-                    tools=tools,
-                )
+
+                async def generate():
+                    async with self._model_slot():
+                        with metrics.span("turn", "chat", "generation"):
+                            return await self.gemini_service.chat_async(
+                                messages=self.messages,
+                                tools=tools,
+                                session_id=self.session_id,
+                            )
+
+                # A stalled model call must not outlive the query deadline
+                response = await asyncio.wait_for(generate(), timeout=self._time_left())
+            except ModelOverloadedError:
+                raise
             except Exception as e:
-                error_msg = str(e)
-                error_type = type(e).__name__
-                print(f"[ERROR] Chat.run: Error calling Gemini API: {error_type}: {error_msg}")
+                if isinstance(e, asyncio.TimeoutError) and (deadline_message := self._deadline_exceeded()):
+                    return "\n".join(earlier_text + [deadline_message])
+                print(f"[ERROR] Chat.run: Error calling Gemini API: {type(e).__name__}: {e}")
                 import traceback
                 print(f"[DEBUG] Traceback:\n{traceback.format_exc()}")
-                
-                if "quota" in error_msg.lower() or "billing" in error_msg.lower():
-                    return f"❌ Error: {error_msg}\n\nPlease check your Google AI Studio account and ensure you have sufficient quota."
-                elif "rate" in error_msg.lower() or "limit" in error_msg.lower():
-                    return f"❌ Rate Limit Error: {error_msg}\n\nPlease wait a moment and try again."
-                elif "connection" in error_msg.lower() or "network" in error_msg.lower():
-                    return f"❌ Connection Error: {error_msg}\n\nPlease check your internet connection and try again."
-                elif "permission" in error_msg.lower() or "api key" in error_msg.lower():
-                    return f"❌ Authentication Error: {error_msg}\n\nPlease check your GEMINI_API_KEY in the .env file."
-                else:
-                    return f"❌ API Error ({error_type}): {error_msg}"
+                return self._api_error_message(e)
 
             try:
                 self.gemini_service.add_assistant_message(self.messages, response)
@@ -75,16 +183,15 @@ class Chat:
             if self._has_function_calls(response):
                 try:
                     text_content = self.gemini_service.text_from_message(response)
-                    if text_content:
-                        print(text_content)
                 except Exception as e:
                     print(f"[ERROR] Chat.run: Error extracting text from message: {type(e).__name__}: {e}")
                     text_content = ""
                 
                 try:
-                    tool_result_parts = await ToolManager.execute_tool_requests(
-                        self.clients, response
-                    )
+                    with metrics.span("turn", "chat", "tools"):
+                        tool_result_parts = await ToolManager.execute_tool_requests(
+                            self.clients, response, deadline=self._deadline
+                        )
                 except Exception as e:
                     print(f"[ERROR] Chat.run: Error executing tool requests: {type(e).__name__}: {e}")
                     tool_result_parts = []
@@ -102,6 +209,8 @@ class Chat:
                         # Break and return what we have
                         final_text_response = text_content or "No response generated."
                         break
+                    if text_content:
+                        earlier_text.append(text_content)
                 else:
                     # No tool results, break and return the text response
                     final_text_response = text_content or "No response generated."
@@ -116,4 +225,142 @@ class Chat:
                     final_text_response = "Error extracting response text."
                 break
 
-        return final_text_response
+        return "\n".join(earlier_text + [final_text_response])
+
+    async def run_stream(
+        self,
+        query: str,
+    ) -> AsyncIterator[str]:
+        """Run a query, yielding response text as the model generates it."""
+        self._turn_start = len(self.messages)
+        self._start_deadline()
+        try:
+            with metrics.span("turn", "chat", "query"):
+                async with aclosing(self._run_stream(query)) as stream:
+                    async for text in stream:
+                        yield text
+        except (asyncio.CancelledError, GeneratorExit, ModelOverloadedError):
+            del self.messages[self._turn_start:]
+            raise
+
+    async def _generate_stream(self, tools) -> AsyncIterator[Any]:
+        """Stream response parts from Gemini for the current history.
+
+        The model slot is held by a task that queues the parts as they
+        arrive and gives the slot back as soon as the model is done, so a
+        slow reader does not keep other conversations waiting for it.
+        """
+        parts: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def produce():
+            async with self._model_slot():
+                with metrics.span("turn", "chat", "generation"):
+                    async for part in self.gemini_service.chat_stream(
+                        messages=self.messages,
+                        tools=tools,
+                        session_id=self.session_id,
+                    ):
+                        parts.put_nowait(part)
+
+        async def generate():
+            try:
+                # A stalled model call must not outlive the query deadline
+                await asyncio.wait_for(produce(), timeout=self._time_left())
+            finally:
+                parts.put_nowait(done)
+
+        task = asyncio.create_task(generate())
+        try:
+            while (part := await parts.get()) is not done:
+                yield part
+            # Raises whatever ended the generation early
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+
+    async def _run_stream(
+        self,
+        query: str,
+    ) -> AsyncIterator[str]:
+        try:
+            await self._process_query(query)
+        except Exception as e:
+            print(f"[ERROR] Chat.run_stream: Error processing query: {type(e).__name__}: {e}")
+            yield f"❌ Error processing query: {str(e)}"
+            return
+
+        has_output = False
+        while True:
+            deadline_message = self._deadline_exceeded()
+            if deadline_message:
+                yield ("\n" if has_output else "") + deadline_message
+                return
+
+            await self._compact_history()
+
+            parts = []
+            try:
+                tools = await ToolManager.get_all_tools(self.clients)
+
+                turn_started = False
+                # Closed as soon as the reader stops, which stops the model
+                async with aclosing(self._generate_stream(tools)) as stream:
+                    async for part in stream:
+                        parts.append(part)
+                        text = getattr(part, "text", "")
+                        if not text:
+                            continue
+                        if has_output and not turn_started:
+                            # Separate text from consecutive tool-loop turns
+                            yield "\n"
+                        turn_started = True
+                        has_output = True
+                        yield text
+            except ModelOverloadedError:
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and (deadline_message := self._deadline_exceeded()):
+                    yield ("\n" if has_output else "") + deadline_message
+                    return
+                print(f"[ERROR] Chat.run_stream: Error calling Gemini API: {type(e).__name__}: {e}")
+                import traceback
+                print(f"[DEBUG] Traceback:\n{traceback.format_exc()}")
+                yield self._api_error_message(e)
+                return
+
+            response = self.gemini_service.message_from_parts(parts)
+
+            try:
+                self.gemini_service.add_assistant_message(self.messages, response)
+            except Exception as e:
+                print(f"[ERROR] Chat.run_stream: Error adding assistant message: {type(e).__name__}: {e}")
+
+            if not self._has_function_calls(response):
+                break
+
+            try:
+                with metrics.span("turn", "chat", "tools"):
+                    tool_result_parts = await ToolManager.execute_tool_requests(
+                        self.clients, response, deadline=self._deadline
+                    )
+            except Exception as e:
+                print(f"[ERROR] Chat.run_stream: Error executing tool requests: {type(e).__name__}: {e}")
+                tool_result_parts = []
+
+            if not tool_result_parts:
+                break
+
+            try:
+                self.gemini_service.add_user_message(
+                    self.messages, tool_result_parts
+                )
+            except Exception as e:
+                print(f"[ERROR] Chat.run_stream: Error adding tool results to messages: {type(e).__name__}: {e}")
+                break
+
+        if not has_output:
+            yield "No response generated."
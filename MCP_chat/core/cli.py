@@ -1,3 +1,5 @@
+import asyncio
+import signal
 from typing import List, Optional
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import Completer, Completion
@@ -9,6 +11,7 @@ from prompt_toolkit.document import Document
 from prompt_toolkit.buffer import Buffer
 
 from core.cli_chat import CliChat
+from core.metrics import metrics
 
 
 class CommandAutoSuggest(AutoSuggest):
@@ -111,8 +114,9 @@ class UnifiedCompleter(Completer):
 
 
 class CliApp:
-    def __init__(self, agent: CliChat):
+    def __init__(self, agent: CliChat, stream: bool = True):
         self.agent = agent
+        self.stream = stream
         self.resources = []
         self.prompts = []
 
@@ -177,8 +181,7 @@ class CliApp:
         )
 
     async def initialize(self):
-        await self.refresh_resources()
-        await self.refresh_prompts()
+        await asyncio.gather(self.refresh_resources(), self.refresh_prompts())
 
     async def refresh_resources(self):
         try:
@@ -196,6 +199,53 @@ class CliApp:
         except Exception as e:
             print(f"Error refreshing prompts: {e}")
 
+    def _print_stats(self, user_input: str) -> bool:
+        """Handle /stats and /stats json. Returns False for any other input."""
+        words = user_input.split()
+        if not words or words[0] != "/stats" or words[1:] not in ([], ["json"]):
+            return False
+        if words[1:] == ["json"]:
+            print(metrics.to_json())
+        else:
+            print(f"\n{metrics.format_table()}\n")
+        return True
+
+    async def _print_stream(self, user_input: str) -> bool:
+        """Print the response to a query token by token as it streams in."""
+        print()
+        async for text in self.agent.run_stream(user_input):
+            print(text, end="", flush=True)
+        print("\n")
+        return True
+
+    async def _run_cancellable(self, coro):
+        """Run a query so that Ctrl-C cancels it instead of exiting the CLI.
+
+        Returns None if the query was cancelled with Ctrl-C.
+        """
+        task = asyncio.ensure_future(coro)
+        loop = asyncio.get_running_loop()
+        interrupted = False
+
+        def _interrupt():
+            nonlocal interrupted
+            interrupted = True
+            task.cancel()
+
+        try:
+            loop.add_signal_handler(signal.SIGINT, _interrupt)
+        except (NotImplementedError, RuntimeError):
+            # Signal handlers are not available on Windows event loops
+            return await task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not interrupted:
+                raise
+            return None
+        finally:
+            loop.remove_signal_handler(signal.SIGINT)
+
     async def run(self):
         while True:
             try:
@@ -203,7 +253,23 @@ class CliApp:
                 if not user_input.strip():
                     continue
 
-                response = await self.agent.run(user_input)
+                if self._print_stats(user_input):
+                    continue
+
+                if self.stream:
+                    completed = await self._run_cancellable(
+                        self._print_stream(user_input)
+                    )
+                    if completed is None:
+                        print("\n⏹ Request cancelled.\n")
+                    continue
+
+                response = await self._run_cancellable(
+                    self.agent.run(user_input)
+                )
+                if response is None:
+                    print("\n⏹ Request cancelled.\n")
+                    continue
                 print(f"\n{response}\n")
 
             except KeyboardInterrupt:
@@ -1,8 +1,11 @@
-from typing import List, Tuple, Dict, Any
+import asyncio
+from typing import List, Tuple, Dict, Any, Optional
 from mcp.types import Prompt, PromptMessage
 
 from core.chat import Chat
 from core.gemini import Gemini
+from core.context import ContextBudget
+from core.limiter import ModelCallLimiter
 from mcp_client import MCPClient
 
 
@@ -12,10 +15,28 @@ class CliChat(Chat):
         doc_client: MCPClient,
         clients: dict[str, MCPClient],
         gemini_service: Gemini,
+        context_budget: Optional[ContextBudget] = None,
+        query_timeout: Optional[float] = None,
+        max_concurrent_reads: int = 8,
+        inline_bytes_budget: int = 32768,
+        model_limiter: Optional[ModelCallLimiter] = None,
     ):
-        super().__init__(clients=clients, gemini_service=gemini_service)
+        super().__init__(
+            clients=clients,
+            gemini_service=gemini_service,
+            context_budget=context_budget,
+            query_timeout=query_timeout,
+            model_limiter=model_limiter,
+        )
 
         self.doc_client: MCPClient = doc_client
+        # Mentioned docs are read concurrently, at most this many at a time
+        self.max_concurrent_reads = max_concurrent_reads
+        # Mentioned docs are inlined in mention order until this many bytes
+        # are used; the rest are only referenced for the model to read
+        self.inline_bytes_budget = inline_bytes_budget
+        # (doc id list it was built from, set of those ids)
+        self._doc_index: Optional[Tuple[list[str], frozenset[str]]] = None
 
     async def list_prompts(self) -> list[Prompt]:
         return await self.doc_client.list_prompts()
@@ -26,26 +47,81 @@ class CliChat(Chat):
     async def get_doc_content(self, doc_id: str) -> str:
         return await self.doc_client.read_resource(f"docs://documents/{doc_id}")
 
+    async def get_doc_metadata(self, doc_id: str) -> dict[str, Any]:
+        return await self.doc_client.read_resource(f"docs://documents/{doc_id}/metadata")
+
     async def get_prompt(
         self, command: str, doc_id: str
     ) -> list[PromptMessage]:
         return await self.doc_client.get_prompt(command, {"doc_id": doc_id})
 
-    async def _extract_resources(self, query: str) -> str:
-        mentions = [word[1:] for word in query.split() if word.startswith("@")]
-
+    async def _doc_id_set(self) -> frozenset[str]:
+        """Set of known doc ids, rebuilt only when the client refetches the list."""
         doc_ids = await self.list_docs_ids()
-        mentioned_docs: list[Tuple[str, str]] = []
+        if self._doc_index is None or self._doc_index[0] is not doc_ids:
+            self._doc_index = (doc_ids, frozenset(doc_ids))
+        return self._doc_index[1]
+
+    async def _read_docs(self, doc_ids: list[str], reader=None) -> list[Any]:
+        """Read docs concurrently with reader, get_doc_content by default;
+        a doc that fails to read comes back as None."""
+        semaphore = asyncio.Semaphore(self.max_concurrent_reads)
+        reader = reader or self.get_doc_content
+
+        async def read(doc_id: str) -> Any:
+            async with semaphore:
+                try:
+                    return await reader(doc_id)
+                except Exception as e:
+                    print(f"[ERROR] CliChat: Error reading document '{doc_id}': {type(e).__name__}: {e}")
+                    return None
+
+        return await asyncio.gather(*(read(doc_id) for doc_id in doc_ids))
 
-        for doc_id in doc_ids:
-            if doc_id in mentions:
-                content = await self.get_doc_content(doc_id)
-                mentioned_docs.append((doc_id, content))
-
-        return "".join(
-            f'\n<document id="{doc_id}">\n{content}\n</document>\n'
-            for doc_id, content in mentioned_docs
+    async def _extract_resources(self, query: str) -> str:
+        known_ids = await self._doc_id_set()
+        # dict keeps the first mention order and drops repeats
+        mentions = dict.fromkeys(
+            word[1:] for word in query.split() if word.startswith("@")
         )
+        doc_ids = [doc_id for doc_id in mentions if doc_id in known_ids]
+        if not doc_ids:
+            return ""
+
+        # Sizes come first so only documents that fit in what is left of
+        # the budget, in mention order, are transferred. Without metadata,
+        # the document is read to find out.
+        infos = await self._read_docs(doc_ids, self.get_doc_metadata)
+        to_read = []
+        reserved = 0
+        for doc_id, info in zip(doc_ids, infos):
+            if info is None:
+                to_read.append(doc_id)
+            elif reserved + info["bytes"] <= self.inline_bytes_budget:
+                reserved += info["bytes"]
+                to_read.append(doc_id)
+        contents = dict(zip(to_read, await self._read_docs(to_read)))
+
+        blocks = []
+        remaining = self.inline_bytes_budget
+        for doc_id, info in zip(doc_ids, infos):
+            content = contents.get(doc_id)
+            if content is not None:
+                size = len(content.encode("utf-8"))
+                if size <= remaining:
+                    remaining -= size
+                    blocks.append(f'\n<document id="{doc_id}">\n{content}\n</document>\n')
+                    continue
+            elif info is None:
+                continue
+            else:
+                size = info["bytes"]
+            details = f' lines="{info["lines"]}" chunks="{info["chunks"]}"' if info else ""
+            blocks.append(
+                f'\n<document id="{doc_id}" size="{size} bytes"{details} '
+                f'content="not included; read it, or the parts you need, with the read_doc_contents tool" />\n'
+            )
+        return "".join(blocks)
 
     async def _process_command(self, query: str) -> bool:
         if not query.startswith("/"):
@@ -0,0 +1,168 @@
+import re
+import json
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+
+DOCUMENT_BLOCK = re.compile(r'<document id="([^"]*)">.*?</document>', re.DOTALL)
+
+DROPPED_TOOL_RESULT = "[Tool result removed to save context. Call the tool again if you need it.]"
+
+
+class ContextBudget:
+    """Keeps a conversation's estimated token count under a budget.
+
+    Once the history is over budget, older messages are compacted in
+    order of increasing loss:
+
+    1. Tool results are replaced with a short placeholder and inlined
+       <document> blocks with a reference to the document id.
+    2. If that is not enough, whole turns before the current one are
+       summarized by the optional summarizer, or dropped without one.
+
+    The newest keep_recent messages are never touched. Compacted messages
+    are replaced with new dicts rather than edited in place, so caches
+    keyed on message identity stay valid.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 100_000,
+        keep_recent: int = 6,
+        chars_per_token: int = 4,
+        summarizer: Optional[Callable[[List[Dict[str, Any]]], Awaitable[str]]] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.chars_per_token = chars_per_token
+        self.summarizer = summarizer
+        # id(message) -> (message, estimated tokens)
+        self._token_cache: Dict[int, tuple[Dict[str, Any], int]] = {}
+
+    def _count_tokens(self, message: Any) -> int:
+        if not isinstance(message, dict):
+            return len(str(message)) // self.chars_per_token + 4
+        chars = 0
+        for part in message.get("parts", []):
+            if isinstance(part, dict) and isinstance(part.get("text"), str):
+                chars += len(part["text"])
+            else:
+                chars += len(json.dumps(part, default=str))
+        # A few tokens of per-message framing
+        return chars // self.chars_per_token + 4
+
+    def estimate_tokens(self, message: Dict[str, Any]) -> int:
+        """Estimated token count of a message, cached per message object."""
+        entry = self._token_cache.get(id(message))
+        if entry is not None and entry[0] is message:
+            return entry[1]
+        tokens = self._count_tokens(message)
+        self._token_cache[id(message)] = (message, tokens)
+        return tokens
+
+    def total_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Estimated token count of a whole history."""
+        total = sum(self.estimate_tokens(message) for message in messages)
+        # Forget messages that have left the history
+        if len(self._token_cache) > 2 * len(messages):
+            live = {id(message) for message in messages}
+            self._token_cache = {
+                key: entry for key, entry in self._token_cache.items() if key in live
+            }
+        return total
+
+    def _compact_part(self, part: Any) -> Any:
+        if not isinstance(part, dict):
+            return part
+        for key in ("function_response", "functionResponse"):
+            if key in part:
+                response = part[key]
+                if response.get("response") == {"result": DROPPED_TOOL_RESULT}:
+                    return part
+                return {
+                    key: {
+                        "name": response.get("name", ""),
+                        "response": {"result": DROPPED_TOOL_RESULT},
+                    }
+                }
+        text = part.get("text")
+        if isinstance(text, str) and "<document" in text:
+            compacted = DOCUMENT_BLOCK.sub(
+                r'<document id="\1" content="removed to save context; read it again with a tool if needed" />',
+                text,
+            )
+            if compacted != text:
+                return {**part, "text": compacted}
+        return part
+
+    def _compact_message(self, message: Any) -> Any:
+        """Returns a lighter copy of message, or message itself if nothing changed."""
+        if not isinstance(message, dict) or "parts" not in message:
+            return message
+        parts = [self._compact_part(part) for part in message["parts"]]
+        if all(new is old for new, old in zip(parts, message["parts"])):
+            return message
+        return {**message, "parts": parts}
+
+    def _is_turn_start(self, message: Any) -> bool:
+        """True for a user message that starts a turn, not one carrying tool results."""
+        if not isinstance(message, dict) or message.get("role") != "user":
+            return False
+        return not any(
+            isinstance(part, dict)
+            and ("function_response" in part or "functionResponse" in part)
+            for part in message.get("parts", [])
+        )
+
+    def _prepend_text(self, message: Dict[str, Any], text: str) -> Dict[str, Any]:
+        return {**message, "parts": [{"text": text}] + list(message.get("parts", []))}
+
+    async def compact(
+        self, messages: List[Dict[str, Any]], protect_from: Optional[int] = None
+    ) -> int:
+        """Compacts messages in place if they are over budget.
+
+        Messages from protect_from onwards are only ever lightened, never
+        removed. Returns the index that the message at protect_from has
+        after compaction, so callers can keep tracking it.
+        """
+        if protect_from is None:
+            protect_from = len(messages)
+
+        total = self.total_tokens(messages)
+        if total <= self.max_tokens:
+            return protect_from
+
+        # Step 1: lighten older messages, oldest first, until under budget
+        recent = max(0, len(messages) - self.keep_recent)
+        for i in range(recent):
+            if total <= self.max_tokens:
+                return protect_from
+            compacted = self._compact_message(messages[i])
+            if compacted is not messages[i]:
+                total += self.estimate_tokens(compacted) - self.estimate_tokens(messages[i])
+                messages[i] = compacted
+        if total <= self.max_tokens:
+            return protect_from
+
+        # Step 2: summarize or drop whole turns, cutting at a turn boundary
+        limit = min(recent, protect_from)
+        cut = 0
+        removed = 0
+        for i in range(1, limit + 1):
+            removed += self.estimate_tokens(messages[i - 1])
+            if i < len(messages) and self._is_turn_start(messages[i]):
+                cut = i
+                if total - removed <= self.max_tokens:
+                    break
+        if cut == 0:
+            return protect_from
+
+        note = "[Earlier conversation omitted to stay within the context budget.]"
+        if self.summarizer is not None:
+            try:
+                summary = await self.summarizer(messages[:cut])
+                note = f"Summary of the earlier conversation:\n{summary}"
+            except Exception as e:
+                print(f"[ERROR] ContextBudget.compact: Error summarizing history: {type(e).__name__}: {e}")
+
+        messages[:cut + 1] = [self._prepend_text(messages[cut], note)]
+        return protect_from - cut
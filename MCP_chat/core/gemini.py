@@ -1,20 +1,84 @@
-import google.generativeai as genai
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
 import json
+import time
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+from core.metrics import metrics
 
-# Try to import protobuf types for proper Part creation
-try:
-    from google.generativeai import protos
-    HAS_PROTOS = True
-except ImportError:
-    HAS_PROTOS = False
+# google.generativeai pulls in protobuf and grpc and takes most of a second
+# to import, so it is loaded by load_sdk on first use rather than here.
+genai: Any = None
+content_types: Any = None
+protos: Any = None
+_sdk_lock = threading.Lock()
+
+
+def load_sdk():
+    """Import the Gemini SDK if it has not been imported yet.
+
+    Safe to call from a worker thread, so the import can overlap with
+    other startup work.
+    """
+    global genai, content_types, protos
+    with _sdk_lock:
+        if genai is None:
+            import google.generativeai as sdk
+            from google.generativeai import protos as sdk_protos
+            from google.generativeai.types import content_types as sdk_content_types
+
+            content_types = sdk_content_types
+            protos = sdk_protos
+            genai = sdk
+    return genai
 
 
 class Gemini:
-    def __init__(self, model: str, api_key: str):
-        genai.configure(api_key=api_key)
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        content_cache_size: int = 10000,
+        model_cache_size: int = 16,
+        declaration_cache_size: int = 4096,
+    ):
         self.model = model
-        self.client = genai.GenerativeModel(model)
+        self._api_key = api_key
+        self._configured = False
+        self._client = None
+        # Configuration fingerprint -> GenerativeModel, least recently used first
+        self.model_cache_size = model_cache_size
+        self._models: OrderedDict[str, Any] = OrderedDict()
+        # Tool hash -> cleaned function declaration (None if the tool is invalid)
+        self.declaration_cache_size = declaration_cache_size
+        self._declaration_cache: Dict[str, Optional[Dict[str, Any]]] = {}
+        # (tools list, its length, declarations, declarations key) of the last call
+        self._last_declarations: Optional[tuple] = None
+        # session_id -> live ChatSession and how much of the history it holds
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        # id(message) -> (message, converted Content), least recently used first
+        self.content_cache_size = content_cache_size
+        self._content_cache: OrderedDict[int, tuple[Dict[str, Any], Any]] = OrderedDict()
+
+    def _sdk(self):
+        """The Gemini SDK, imported and configured on first use."""
+        sdk = genai if genai is not None else load_sdk()
+        if not self._configured:
+            sdk.configure(api_key=self._api_key)
+            self._configured = True
+        return sdk
+
+    async def load_sdk_async(self):
+        """Import the SDK in a worker thread so the event loop keeps running."""
+        if genai is None:
+            await asyncio.to_thread(load_sdk)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._sdk().GenerativeModel(self.model)
+        return self._client
 
     def add_user_message(self, messages: list, message):
         """Add a user message to the conversation history."""
@@ -207,6 +271,45 @@ class Gemini:
             return "\n".join(text_parts)
         return str(message)
 
+    def _inline_schema_refs(self, schema: Any, defs: Optional[Dict[str, Any]] = None) -> Any:
+        """Replace "$ref": "#/$defs/..." with the definition it points to.
+        Gemini does not resolve references, so nested models such as a
+        list of objects would otherwise lose their fields."""
+        if isinstance(schema, list):
+            return [self._inline_schema_refs(item, defs) for item in schema]
+        if not isinstance(schema, dict):
+            return schema
+        if defs is None:
+            defs = schema.get("$defs", {})
+        ref = schema.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/$defs/"):
+            name = ref[len("#/$defs/"):]
+            if name in defs:
+                # Recursive models are left unresolved rather than expanded forever
+                inner = {key: value for key, value in defs.items() if key != name}
+                resolved = self._inline_schema_refs(defs[name], inner)
+                return {**resolved, **{key: value for key, value in schema.items() if key != "$ref"}}
+        return {key: self._inline_schema_refs(value, defs) for key, value in schema.items() if key != "$defs"}
+
+    def _collapse_nullable(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn "anyOf": [X, {"type": "null"}], as pydantic writes an
+        Optional[X] field, into X marked nullable. Gemini has no anyOf, so
+        the field would otherwise lose its type."""
+        for key in ("anyOf", "oneOf"):
+            options = schema.get(key)
+            if not isinstance(options, list):
+                continue
+            types = [option for option in options if isinstance(option, dict)]
+            non_null = [option for option in types if option.get("type") != "null"]
+            if len(non_null) != 1 or len(types) != len(options):
+                continue
+            rest = {name: value for name, value in schema.items() if name != key}
+            collapsed = {**non_null[0], **rest}
+            if len(non_null) < len(types):
+                collapsed["nullable"] = True
+            return collapsed
+        return schema
+
     def _clean_schema_for_gemini(self, schema: Any) -> Dict[str, Any]:
         """Remove fields from JSON Schema that Gemini doesn't support."""
         try:
@@ -238,10 +341,12 @@ class Gemini:
                 print(f"[WARNING] _clean_schema_for_gemini: Schema is not a dict after parsing. Type: {type(schema).__name__}, Value: {str(schema)[:100]}")
                 return {}
             
+            schema = self._collapse_nullable(schema)
+
             # Fields that Gemini supports in function declaration parameters
             allowed_fields = {
                 "type", "properties", "required", "items", "enum", 
-                "description", "format", "minimum", "maximum", "pattern"
+                "description", "format", "minimum", "maximum", "pattern", "nullable"
             }
             
             cleaned = {}
@@ -326,207 +431,295 @@ class Gemini:
             import traceback
             return {}
 
-    def _convert_tools_to_gemini_format(self, tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Convert MCP tools to Gemini function declaration format."""
-        function_declarations = []
-        
-        if not tools:
-            return []
-        
-        
-        for i, tool in enumerate(tools):
+    def _convert_tool_to_gemini_format(self, tool: Dict[str, Any], i: int) -> Optional[Dict[str, Any]]:
+        """Convert a single MCP tool to a Gemini function declaration."""
+        try:
+            if not isinstance(tool, dict):
+                print(f"[ERROR] _convert_tools_to_gemini_format: Tool {i} is not a dict, type: {type(tool).__name__}")
+                return None
+            
+            tool_name = tool.get("name", f"unknown_tool_{i}")
+            
+            input_schema = tool.get("input_schema", {})
+            
+            # Handle case where input_schema might be None
+            if input_schema is None:
+                print(f"[WARNING] _convert_tools_to_gemini_format: Tool '{tool_name}' has None input_schema")
+                input_schema = {}
+            
+            # Clean the schema to remove unsupported fields like "title"
             try:
-                tool_name = tool.get("name", f"unknown_tool_{i}")
-                
-                if not isinstance(tool, dict):
-                    print(f"[ERROR] _convert_tools_to_gemini_format: Tool {i} is not a dict, type: {type(tool).__name__}")
-                    continue
-                
-                input_schema = tool.get("input_schema", {})
-                
-                # Handle case where input_schema might be None
-                if input_schema is None:
-                    print(f"[WARNING] _convert_tools_to_gemini_format: Tool '{tool_name}' has None input_schema")
-                    input_schema = {}
-                
-                # Clean the schema to remove unsupported fields like "title"
-                try:
-                    cleaned_schema = self._clean_schema_for_gemini(input_schema)
-                except Exception as e:
-                    print(f"[ERROR] _convert_tools_to_gemini_format: Error cleaning schema for tool '{tool_name}': {type(e).__name__}: {e}")
-                    import traceback
-                    cleaned_schema = {}
-                
-                # Ensure cleaned_schema is a dict (fallback to empty dict if cleaning failed)
-                if not isinstance(cleaned_schema, dict):
-                    print(f"[WARNING] _convert_tools_to_gemini_format: Tool '{tool_name}' cleaned_schema is not a dict, type: {type(cleaned_schema).__name__}")
-                    cleaned_schema = {}
-                
-                if "name" not in tool:
-                    print(f"[ERROR] _convert_tools_to_gemini_format: Tool {i} missing 'name' field")
-                    continue
-                
-                function_decl = {
-                    "name": tool["name"],
-                    "description": tool.get("description", ""),
-                    "parameters": cleaned_schema
-                }
-                function_declarations.append(function_decl)
-            except KeyError as e:
-                print(f"[ERROR] _convert_tools_to_gemini_format: Missing key in tool {i}: {e}")
-                continue
+                cleaned_schema = self._clean_schema_for_gemini(self._inline_schema_refs(input_schema))
             except Exception as e:
-                print(f"[ERROR] _convert_tools_to_gemini_format: Unexpected error processing tool {i}: {type(e).__name__}: {e}")
-                import traceback
-                continue
-        
+                print(f"[ERROR] _convert_tools_to_gemini_format: Error cleaning schema for tool '{tool_name}': {type(e).__name__}: {e}")
+                cleaned_schema = {}
+            
+            # Ensure cleaned_schema is a dict (fallback to empty dict if cleaning failed)
+            if not isinstance(cleaned_schema, dict):
+                print(f"[WARNING] _convert_tools_to_gemini_format: Tool '{tool_name}' cleaned_schema is not a dict, type: {type(cleaned_schema).__name__}")
+                cleaned_schema = {}
+            
+            if "name" not in tool:
+                print(f"[ERROR] _convert_tools_to_gemini_format: Tool {i} missing 'name' field")
+                return None
+            
+            return {
+                "name": tool["name"],
+                "description": tool.get("description", ""),
+                "parameters": cleaned_schema
+            }
+        except KeyError as e:
+            print(f"[ERROR] _convert_tools_to_gemini_format: Missing key in tool {i}: {e}")
+            return None
+        except Exception as e:
+            print(f"[ERROR] _convert_tools_to_gemini_format: Unexpected error processing tool {i}: {type(e).__name__}: {e}")
+            return None
+
+    def _tool_key(self, tool: Any) -> str:
+        """Stable hash of a tool's name, description and input schema."""
+        if isinstance(tool, dict):
+            identity = [tool.get("name"), tool.get("description"), tool.get("input_schema")]
+        else:
+            identity = repr(tool)
+        encoded = json.dumps(identity, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _get_function_declarations(
+        self, tools: Optional[List[Dict[str, Any]]]
+    ) -> tuple[List[Dict[str, Any]], str]:
+        """Return the Gemini declarations for tools and a key identifying the set.
+
+        Cleaned declarations are cached per tool hash, and the result for the
+        last tools list is reused outright while the same, unchanged list is
+        passed again (ToolManager hands out one list per catalog version).
+        """
+        if not tools:
+            return [], ""
+
+        last = self._last_declarations
+        if last is not None and last[0] is tools and last[1] == len(tools):
+            return last[2], last[3]
+
+        function_declarations = []
+        keys = []
+        for i, tool in enumerate(tools):
+            key = self._tool_key(tool)
+            if key not in self._declaration_cache:
+                if len(self._declaration_cache) >= self.declaration_cache_size:
+                    self._declaration_cache.clear()
+                self._declaration_cache[key] = self._convert_tool_to_gemini_format(tool, i)
+            declaration = self._declaration_cache[key]
+            if declaration is not None:
+                function_declarations.append(declaration)
+                keys.append(key)
+
+        declarations_key = hashlib.sha256("".join(keys).encode("utf-8")).hexdigest()
+        self._last_declarations = (tools, len(tools), function_declarations, declarations_key)
+        return function_declarations, declarations_key
+
+    def _convert_tools_to_gemini_format(self, tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Convert MCP tools to Gemini function declaration format."""
+        function_declarations, _ = self._get_function_declarations(tools)
         return function_declarations
 
-    def chat(
+    def _convert_message(self, msg: Any) -> Dict[str, Any]:
+        """Convert a single history message to Gemini format."""
+        if isinstance(msg, dict):
+            role = msg.get("role", "user")
+            if role == "assistant":
+                role = "model"
+            
+            parts = msg.get("parts", [])
+            if not parts and "content" in msg:
+                # Handle Anthropic-style content
+                content = msg["content"]
+                if isinstance(content, str):
+                    parts = [{"text": content}]
+                elif isinstance(content, list):
+                    parts = []
+                    for block in content:
+                        if isinstance(block, dict):
+                            if block.get("type") == "text":
+                                parts.append({"text": block.get("text", "")})
+                            elif block.get("type") == "tool_result":
+                                # Convert tool result to function response
+                                parts.append({
+                                    "functionResponse": {
+                                        "name": block.get("tool_use_id", ""),
+                                        "response": {
+                                            "result": block.get("content", "")
+                                        }
+                                    }
+                                })
+                        else:
+                            parts.append({"text": str(block)})
+            
+            # Process parts to ensure proper format for Gemini
+            # When using start_chat(history=...), function calls need snake_case format
+            processed_parts = []
+            for part in parts:
+                if isinstance(part, dict):
+                    # Handle function calls - convert camelCase to snake_case if needed
+                    if "functionCall" in part:
+                        # Convert camelCase to snake_case for history compatibility
+                        func_call = part["functionCall"]
+                        processed_parts.append({
+                            "function_call": {
+                                "name": func_call.get("name", ""),
+                                "args": func_call.get("args", {})
+                            }
+                        })
+                    elif "function_call" in part:
+                        # Already in correct format
+                        processed_parts.append(part)
+                    # Handle function responses
+                    elif "functionResponse" in part:
+                        # Convert camelCase to snake_case
+                        func_resp = part["functionResponse"]
+                        response_value = func_resp.get("response", {})
+                        
+                        # FunctionResponse.response expects a struct (dict-like)
+                        # Wrap strings and primitives in a dict
+                        if isinstance(response_value, str):
+                            # Wrap string in a struct
+                            response_value = {"result": response_value}
+                        elif isinstance(response_value, (int, float, bool)):
+                            # Wrap primitive types
+                            response_value = {"result": response_value}
+                        elif isinstance(response_value, list):
+                            # Lists are fine, but wrap for consistency
+                            response_value = {"result": response_value}
+                        elif response_value is None:
+                            response_value = {}
+                        elif not isinstance(response_value, dict):
+                            # Convert other types to string and wrap
+                            response_value = {"result": str(response_value)}
+                        
+                        processed_parts.append({
+                            "function_response": {
+                                "name": func_resp.get("name", ""),
+                                "response": response_value
+                            }
+                        })
+                    elif "function_response" in part:
+                        # Already in correct format, but ensure response is properly formatted
+                        func_resp = part["function_response"]
+                        response_value = func_resp.get("response", {})
+                        
+                        # FunctionResponse.response expects a struct (dict-like)
+                        # Wrap strings and primitives in a dict
+                        if isinstance(response_value, str):
+                            # Wrap string in a struct
+                            response_value = {"result": response_value}
+                            part["function_response"]["response"] = response_value
+                        elif isinstance(response_value, (int, float, bool)):
+                            # Wrap primitive types
+                            response_value = {"result": response_value}
+                            part["function_response"]["response"] = response_value
+                        elif isinstance(response_value, list):
+                            # Lists are fine, but wrap for consistency
+                            response_value = {"result": response_value}
+                            part["function_response"]["response"] = response_value
+                        elif response_value is None:
+                            part["function_response"]["response"] = {}
+                        elif not isinstance(response_value, dict):
+                            # Convert other types to string and wrap
+                            response_value = {"result": str(response_value)}
+                            part["function_response"]["response"] = response_value
+                        
+                        processed_parts.append(part)
+                    elif "text" in part:
+                        # Text part - keep as is
+                        processed_parts.append(part)
+                    else:
+                        # Unknown format - try to convert to text
+                        processed_parts.append({"text": str(part)})
+                else:
+                    # Not a dict - convert to text
+                    processed_parts.append({"text": str(part)})
+            
+            # Ensure parts is a list
+            if not processed_parts:
+                processed_parts = [{"text": ""}]
+            
+            return {
+                "role": role,
+                "parts": processed_parts
+            }
+        # Fallback for other message types
+        return {
+            "role": "user",
+            "parts": [{"text": str(msg)}]
+        }
+
+    def _to_content(self, msg: Any):
+        """Convert a history message to a protobuf Content ready to send."""
+        converted = self._convert_message(msg)
+        self._sdk()
+        try:
+            return content_types.to_content(converted)
+        except Exception as e:
+            print(f"[WARNING] Gemini._to_content: Error converting message to Content: {type(e).__name__}: {e}")
+            # Let the SDK try again when the request is built
+            return converted
+
+    def _convert_messages(self, messages: List[Dict[str, Any]]) -> List[Any]:
+        """Convert the history to Gemini Content, reusing cached conversions.
+
+        Conversions are memoized per message object, so each turn only pays
+        for messages appended since the previous call. Messages are treated
+        as immutable once converted: replace a message to change it.
+        """
+        contents = []
+        for msg in messages:
+            if not isinstance(msg, dict):
+                contents.append(self._to_content(msg))
+                continue
+
+            key = id(msg)
+            entry = self._content_cache.get(key)
+            if entry is not None and entry[0] is msg:
+                self._content_cache.move_to_end(key)
+            else:
+                entry = (msg, self._to_content(msg))
+                self._content_cache[key] = entry
+                if len(self._content_cache) > self.content_cache_size:
+                    self._content_cache.popitem(last=False)
+            contents.append(entry[1])
+        return contents
+
+    def _model_fingerprint(
+        self,
+        declarations_key: str,
+        system: Optional[str],
+        temperature: float,
+        stop_sequences: List[str],
+    ) -> str:
+        """Stable key for the model configuration of a request."""
+        config = [declarations_key, system, temperature, list(stop_sequences)]
+        encoded = json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _get_model(
         self,
-        messages: List[Dict[str, Any]],
         system: Optional[str] = None,
         temperature: float = 1.0,
         stop_sequences: List[str] = [],
         tools: Optional[List[Dict[str, Any]]] = None,
-        thinking: bool = False,
-        thinking_budget: int = 1024,
     ):
-        """Send a chat request to Gemini."""
-        # Convert messages to Gemini format
-        gemini_messages = []
-        for msg in messages:
-            if isinstance(msg, dict):
-                role = msg.get("role", "user")
-                if role == "assistant":
-                    role = "model"
-                
-                parts = msg.get("parts", [])
-                if not parts and "content" in msg:
-                    # Handle Anthropic-style content
-                    content = msg["content"]
-                    if isinstance(content, str):
-                        parts = [{"text": content}]
-                    elif isinstance(content, list):
-                        parts = []
-                        for block in content:
-                            if isinstance(block, dict):
-                                if block.get("type") == "text":
-                                    parts.append({"text": block.get("text", "")})
-                                elif block.get("type") == "tool_result":
-                                    # Convert tool result to function response
-                                    parts.append({
-                                        "functionResponse": {
-                                            "name": block.get("tool_use_id", ""),
-                                            "response": {
-                                                "result": block.get("content", "")
-                                            }
-                                        }
-                                    })
-                            else:
-                                parts.append({"text": str(block)})
-                
-                # Process parts to ensure proper format for Gemini
-                # When using start_chat(history=...), function calls need snake_case format
-                processed_parts = []
-                for part in parts:
-                    if isinstance(part, dict):
-                        # Handle function calls - convert camelCase to snake_case if needed
-                        if "functionCall" in part:
-                            # Convert camelCase to snake_case for history compatibility
-                            func_call = part["functionCall"]
-                            processed_parts.append({
-                                "function_call": {
-                                    "name": func_call.get("name", ""),
-                                    "args": func_call.get("args", {})
-                                }
-                            })
-                        elif "function_call" in part:
-                            # Already in correct format
-                            processed_parts.append(part)
-                        # Handle function responses
-                        elif "functionResponse" in part:
-                            # Convert camelCase to snake_case
-                            func_resp = part["functionResponse"]
-                            response_value = func_resp.get("response", {})
-                            
-                            # FunctionResponse.response expects a struct (dict-like)
-                            # Wrap strings and primitives in a dict
-                            if isinstance(response_value, str):
-                                # Wrap string in a struct
-                                response_value = {"result": response_value}
-                            elif isinstance(response_value, (int, float, bool)):
-                                # Wrap primitive types
-                                response_value = {"result": response_value}
-                            elif isinstance(response_value, list):
-                                # Lists are fine, but wrap for consistency
-                                response_value = {"result": response_value}
-                            elif response_value is None:
-                                response_value = {}
-                            elif not isinstance(response_value, dict):
-                                # Convert other types to string and wrap
-                                response_value = {"result": str(response_value)}
-                            
-                            processed_parts.append({
-                                "function_response": {
-                                    "name": func_resp.get("name", ""),
-                                    "response": response_value
-                                }
-                            })
-                        elif "function_response" in part:
-                            # Already in correct format, but ensure response is properly formatted
-                            func_resp = part["function_response"]
-                            response_value = func_resp.get("response", {})
-                            
-                            # FunctionResponse.response expects a struct (dict-like)
-                            # Wrap strings and primitives in a dict
-                            if isinstance(response_value, str):
-                                # Wrap string in a struct
-                                response_value = {"result": response_value}
-                                part["function_response"]["response"] = response_value
-                            elif isinstance(response_value, (int, float, bool)):
-                                # Wrap primitive types
-                                response_value = {"result": response_value}
-                                part["function_response"]["response"] = response_value
-                            elif isinstance(response_value, list):
-                                # Lists are fine, but wrap for consistency
-                                response_value = {"result": response_value}
-                                part["function_response"]["response"] = response_value
-                            elif response_value is None:
-                                part["function_response"]["response"] = {}
-                            elif not isinstance(response_value, dict):
-                                # Convert other types to string and wrap
-                                response_value = {"result": str(response_value)}
-                                part["function_response"]["response"] = response_value
-                            
-                            processed_parts.append(part)
-                        elif "text" in part:
-                            # Text part - keep as is
-                            processed_parts.append(part)
-                        else:
-                            # Unknown format - try to convert to text
-                            processed_parts.append({"text": str(part)})
-                    else:
-                        # Not a dict - convert to text
-                        processed_parts.append({"text": str(part)})
-                
-                # Ensure parts is a list
-                if not processed_parts:
-                    processed_parts = [{"text": ""}]
-                
-                gemini_messages.append({
-                    "role": role,
-                    "parts": processed_parts
-                })
-            else:
-                # Fallback for other message types
-                gemini_messages.append({
-                    "role": "user",
-                    "parts": [{"text": str(msg)}]
-                })
+        """Return the model for this configuration, building it only once."""
+        function_declarations, declarations_key = self._get_function_declarations(tools)
+        fingerprint = self._model_fingerprint(
+            declarations_key, system, temperature, stop_sequences
+        )
+        model = self._models.get(fingerprint)
+        if model is not None:
+            self._models.move_to_end(fingerprint)
+            return model
 
+        sdk = self._sdk()
         # Prepare generation config
-        generation_config = genai.types.GenerationConfig(
+        generation_config = sdk.types.GenerationConfig(
             temperature=temperature,
             max_output_tokens=8192,
         )
@@ -536,8 +729,7 @@ class Gemini:
 
         # Prepare tools if provided
         tools_config = None
-        if tools:
-            function_declarations = self._convert_tools_to_gemini_format(tools)
+        if function_declarations:
             tools_config = [{"function_declarations": function_declarations}]
 
         # Handle system prompt - Gemini supports system_instruction parameter
@@ -555,126 +747,241 @@ class Gemini:
         if tools_config:
             model_kwargs["tools"] = tools_config
         
-        model = genai.GenerativeModel(**model_kwargs)
-        
-        # Prepare the chat history (all messages except the last one)
-        history = gemini_messages[:-1] if len(gemini_messages) > 1 else []
-        
-        # Get the last message to send
-        last_message_parts = gemini_messages[-1]["parts"] if gemini_messages else [{"text": ""}]
-        
-        # Convert function_response to proper format for sending
-        # The SDK's send_message expects parts in a specific format
-        # Function responses need to be converted using the SDK's content types
-        converted_parts = []
-        for part in last_message_parts:
-            if isinstance(part, dict):
-                if "function_response" in part:
-                    # Function responses need special handling
-                    func_resp = part["function_response"]
-                    response_value = func_resp.get("response", {})
-                    
-                    # FunctionResponse.response expects a struct_pb2.Struct (dict-like)
-                    # If response_value is a string, we need to wrap it properly
-                    # For protobuf struct, strings should be in struct format
-                    if isinstance(response_value, str):
-                        # Wrap string in a struct with a "result" or "content" key
-                        # Or use the string directly as struct value
-                        response_value = {"result": response_value}
-                    elif isinstance(response_value, (int, float, bool)):
-                        # Wrap primitive types
-                        response_value = {"result": response_value}
-                    elif isinstance(response_value, list):
-                        # Lists are fine as-is for struct
-                        response_value = {"result": response_value}
-                    elif response_value is None:
-                        response_value = {}
-                    elif not isinstance(response_value, dict):
-                        # Convert other types to string and wrap
-                        response_value = {"result": str(response_value)}
-                    
-                    # Ensure it's a dict at this point
-                    if not isinstance(response_value, dict):
-                        response_value = {"result": str(response_value)}
-                    
-                    # Try to use SDK's content types helper
-                    try:
-                        # Import content types helper
-                        from google.generativeai.types import content_types
-                        
-                        # Create the function response dict in the format SDK expects
-                        func_response_dict = {
-                            "function_response": {
-                                "name": func_resp.get("name", ""),
-                                "response": response_value
-                            }
-                        }
-                        
-                        # Use SDK's to_part helper to convert
-                        converted_part = content_types.to_part(func_response_dict)
-                        converted_parts.append(converted_part)
-                    except Exception as e:
-                        print(f"[WARNING] Gemini.chat: Error using content_types.to_part: {type(e).__name__}: {e}")
-                        # Fallback: try protobuf Part directly
-                        try:
-                            if HAS_PROTOS:
-                                # Import struct_pb2 for proper struct creation
-                                from google.protobuf import struct_pb2
-                                
-                                # Create a struct from the dict
-                                struct_value = struct_pb2.Struct()
-                                struct_value.update(response_value)
-                                
-                                proto_part = protos.Part(
-                                    function_response=protos.FunctionResponse(
-                                        name=func_resp.get("name", ""),
-                                        response=struct_value
-                                    )
-                                )
-                                converted_parts.append(proto_part)
-                            else:
-                                # Last resort: use dict but this might fail
-                                print(f"[ERROR] Gemini.chat: Cannot create function response part, no protobuf available")
-                                raise ValueError(f"Cannot format function response: {e}")
-                        except Exception as e2:
-                            print(f"[ERROR] Gemini.chat: Error creating protobuf Part: {type(e2).__name__}: {e2}")
-                            import traceback
-                            raise
-                elif "function_call" in part:
-                    # Function calls - convert to proper format
-                    func_call = part["function_call"]
-                    try:
-                        from google.generativeai.types import content_types
-                        func_call_dict = {
-                            "function_call": {
-                                "name": func_call.get("name", ""),
-                                "args": func_call.get("args", {})
-                            }
-                        }
-                        converted_part = content_types.to_part(func_call_dict)
-                        converted_parts.append(converted_part)
-                    except Exception as e:
-                        print(f"[WARNING] Gemini.chat: Error converting function call: {e}")
-                        # Keep as-is and let SDK handle it
-                        converted_parts.append(part)
-                else:
-                    # Keep other parts as-is (text, etc.)
-                    converted_parts.append(part)
+        model = sdk.GenerativeModel(**model_kwargs)
+        self._models[fingerprint] = model
+        if len(self._models) > self.model_cache_size:
+            self._models.popitem(last=False)
+        return model
+
+    def _session_in_sync(self, state: Dict[str, Any], messages: List[Dict[str, Any]]) -> bool:
+        """Check that messages only grew since the session last sent a request."""
+        anchor_index = state["synced"] - 2
+        return (
+            len(messages) > state["synced"]
+            and messages[anchor_index] is state["anchor"]
+            and isinstance(messages[anchor_index + 1], dict)
+            and messages[anchor_index + 1].get("role") in ("model", "assistant")
+        )
+
+    def _prepare_chat(
+        self,
+        messages: List[Dict[str, Any]],
+        system: Optional[str] = None,
+        temperature: float = 1.0,
+        stop_sequences: List[str] = [],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        session_id: Optional[str] = None,
+    ):
+        """Build the chat session and the parts to send for a chat request.
+
+        With a session_id the chat object is kept between calls and only the
+        messages appended since the previous request are added to its
+        history. The session is rebuilt if the history was rewritten.
+        """
+        model = self._get_model(
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+        )
+
+        state = self._sessions.get(session_id) if session_id else None
+        if state is not None and self._session_in_sync(state, messages):
+            chat = state["chat"]
+            chat.model = model
+            new_messages = messages[state["synced"]:-1]
+            if new_messages:
+                chat.history.extend(self._convert_messages(new_messages))
+            last_message = self._convert_messages(messages[-1:])
+        else:
+            gemini_messages = self._convert_messages(messages)
+
+            # Prepare the chat history (all messages except the last one)
+            history = gemini_messages[:-1] if len(gemini_messages) > 1 else []
+            last_message = gemini_messages[-1:]
+
+            # Start chat with history
+            if history:
+                chat = model.start_chat(history=history)
             else:
-                converted_parts.append(part)
+                chat = model.start_chat()
+
+            if session_id:
+                self._sessions[session_id] = {"chat": chat, "synced": 0, "anchor": None}
         
-        # Start chat with history
-        if history:
-            chat = model.start_chat(history=history)
+        # Get the last message to send; it always goes out as a user turn
+        if not last_message:
+            last_message_parts = [{"text": ""}]
+        elif isinstance(last_message[0], dict):
+            last_message_parts = last_message[0]["parts"]
         else:
-            chat = model.start_chat()
+            last_message_parts = list(last_message[0].parts)
         
-        # Send the message
+        return chat, last_message_parts
+
+    def _finish_session_request(
+        self,
+        session_id: Optional[str],
+        messages: List[Dict[str, Any]],
+        succeeded: bool,
+    ):
+        """Record what the session's chat history now covers."""
+        if not session_id or session_id not in self._sessions:
+            return
+        if not succeeded or not messages:
+            # The chat history may hold a half-finished exchange; rebuild next time
+            self._sessions.pop(session_id, None)
+            return
+        state = self._sessions[session_id]
+        # The chat history now holds every message plus the model's reply
+        state["synced"] = len(messages) + 1
+        state["anchor"] = messages[-1]
+
+    async def summarize(self, messages: List[Dict[str, Any]]) -> str:
+        """Summarize part of a conversation so it can replace the original turns."""
+        request = list(messages) + [{
+            "role": "user",
+            "parts": [{
+                "text": "Summarize the conversation so far in a few short paragraphs. "
+                "Keep names, document ids, decisions, open questions and any facts "
+                "needed to continue. Reply with the summary only."
+            }]
+        }]
+        response = await self.chat_async(messages=request, temperature=0.2)
+        return self.text_from_message(response)
+
+    def close_session(self, session_id: str):
+        """Forget the chat session kept for session_id."""
+        self._sessions.pop(session_id, None)
+
+    def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        system: Optional[str] = None,
+        temperature: float = 1.0,
+        stop_sequences: List[str] = [],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        thinking: bool = False,
+        thinking_budget: int = 1024,
+        session_id: Optional[str] = None,
+    ):
+        """Send a chat request to Gemini."""
+        with metrics.span("gemini", self.model, "conversion"):
+            chat, message_parts = self._prepare_chat(
+                messages,
+                system=system,
+                temperature=temperature,
+                stop_sequences=stop_sequences,
+                tools=tools,
+                session_id=session_id,
+            )
+        succeeded = False
         try:
-            response = chat.send_message(converted_parts)
-        except Exception as e:
-            import traceback
-            raise
-        
+            with metrics.span("gemini", self.model, "generate"):
+                response = chat.send_message(message_parts)
+            succeeded = True
+        finally:
+            self._finish_session_request(session_id, messages, succeeded)
+        return response
+
+    async def chat_async(
+        self,
+        messages: List[Dict[str, Any]],
+        system: Optional[str] = None,
+        temperature: float = 1.0,
+        stop_sequences: List[str] = [],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        thinking: bool = False,
+        thinking_budget: int = 1024,
+        session_id: Optional[str] = None,
+    ):
+        """Send a chat request to Gemini without blocking the event loop.
+
+        Uses the SDK's native async client, so cancelling the awaiting task
+        also cancels the in-flight request.
+        """
+        await self.load_sdk_async()
+        with metrics.span("gemini", self.model, "conversion"):
+            chat, message_parts = self._prepare_chat(
+                messages,
+                system=system,
+                temperature=temperature,
+                stop_sequences=stop_sequences,
+                tools=tools,
+                session_id=session_id,
+            )
+        succeeded = False
+        try:
+            with metrics.span("gemini", self.model, "generate"):
+                response = await chat.send_message_async(message_parts)
+            succeeded = True
+        finally:
+            self._finish_session_request(session_id, messages, succeeded)
         return response
 
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        system: Optional[str] = None,
+        temperature: float = 1.0,
+        stop_sequences: List[str] = [],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        thinking: bool = False,
+        thinking_budget: int = 1024,
+        session_id: Optional[str] = None,
+    ) -> AsyncIterator[Any]:
+        """Stream a chat request to Gemini, yielding response parts as they arrive.
+
+        Text parts are partial deltas. Function call parts are only sent once
+        complete, so they can be acted on as soon as they are yielded. Use
+        message_from_parts to assemble the yielded parts into a response.
+        """
+        await self.load_sdk_async()
+        with metrics.span("gemini", self.model, "conversion"):
+            chat, message_parts = self._prepare_chat(
+                messages,
+                system=system,
+                temperature=temperature,
+                stop_sequences=stop_sequences,
+                tools=tools,
+                session_id=session_id,
+            )
+        succeeded = False
+        try:
+            with metrics.span("gemini", self.model, "stream"):
+                start = time.perf_counter()
+                first_chunk = True
+                response = await chat.send_message_async(message_parts, stream=True)
+                async for chunk in response:
+                    if first_chunk:
+                        metrics.record("gemini", self.model, "stream:first_chunk", time.perf_counter() - start)
+                        first_chunk = False
+                    if not chunk.candidates:
+                        continue
+                    for part in chunk.candidates[0].content.parts:
+                        yield part
+            succeeded = True
+        finally:
+            self._finish_session_request(session_id, messages, succeeded)
+
+    def message_from_parts(self, parts: List[Any]):
+        """Assemble streamed response parts into a single model message.
+
+        Consecutive text deltas are merged so the stored history holds one
+        text part per run of text instead of one per chunk.
+        """
+        self._sdk()
+        merged = []
+        text_buffer = []
+        for part in parts:
+            if getattr(part, "text", ""):
+                text_buffer.append(part.text)
+                continue
+            if text_buffer:
+                merged.append(protos.Part(text="".join(text_buffer)))
+                text_buffer = []
+            merged.append(part)
+        if text_buffer:
+            merged.append(protos.Part(text="".join(text_buffer)))
+        return protos.Content(role="model", parts=merged)
+
@@ -0,0 +1,82 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class ModelOverloadedError(Exception):
+    """Too many model calls are queued, or the model quota is exhausted."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_quota_error(e: BaseException) -> bool:
+    """True for the SDK's 429 / ResourceExhausted errors."""
+    return (
+        getattr(e, "code", None) == 429
+        or type(e).__name__ in ("ResourceExhausted", "TooManyRequests")
+    )
+
+
+class ModelCallLimiter:
+    """Shares model capacity between the conversations of one process.
+
+    At most max_concurrent model calls run at once and the rest wait in
+    arrival order. Each conversation makes one call at a time, so
+    arrival order gives every conversation a turn in rotation. Once
+    max_waiting calls are queued, or the model has answered with a quota
+    error in the last quota_cooldown seconds, new calls fail straight
+    away with ModelOverloadedError instead of piling up.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_waiting: int = 16, quota_cooldown: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.quota_cooldown = quota_cooldown
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cooldown_until = 0.0
+
+    def retry_after(self) -> float:
+        """Seconds a rejected caller should wait before trying again."""
+        return max(1.0, self._cooldown_until - time.monotonic())
+
+    def saturated(self) -> bool:
+        return self.waiting >= self.max_waiting or time.monotonic() < self._cooldown_until
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a model call slot for the body of an async with block."""
+        if self.saturated():
+            self.rejected += 1
+            raise ModelOverloadedError("Model capacity is saturated", self.retry_after())
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        except Exception as e:
+            if not is_quota_error(e):
+                raise
+            self._cooldown_until = time.monotonic() + self.quota_cooldown
+            raise ModelOverloadedError(f"Model quota exhausted: {e}", self.quota_cooldown) from e
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "quota_cooldown_s": round(max(0.0, self._cooldown_until - time.monotonic()), 3),
+        }
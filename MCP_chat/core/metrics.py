@@ -0,0 +1,173 @@
+import json
+import time
+import bisect
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+
+# Upper bounds of the latency buckets, in milliseconds
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, plus count, sum, min and max."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.min_ms = float("inf")
+        self.max_ms = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def observe(self, ms: float, bytes_in: int = 0, bytes_out: int = 0, error: bool = False):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.errors += error
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def percentile(self, q: float) -> float:
+        """Estimate of the q-th percentile: the upper bound of its bucket,
+        capped by the largest value seen."""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                bound = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "min_ms": round(self.min_ms, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "buckets": {
+                **{f"le_{bound}": n for bound, n in zip(BUCKET_BOUNDS_MS, self.buckets)},
+                "le_inf": self.buckets[-1],
+            },
+        }
+
+
+class Span:
+    """A timing in progress; payload sizes can be added before it ends."""
+
+    __slots__ = ("bytes_in", "bytes_out", "error")
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = False
+
+
+class Metrics:
+    """Latency histograms, counts and payload sizes keyed by
+    (component, target, operation).
+
+    component is what did the work ("mcp", "gemini" or "turn"), target
+    the server or model it talked to, and operation the method or span,
+    such as "tools/call:read_doc_contents" or "generation".
+    """
+
+    def __init__(self):
+        self._histograms: Dict[tuple[str, str, str], Histogram] = {}
+        self.started_at = time.time()
+
+    def record(
+        self,
+        component: str,
+        target: str,
+        operation: str,
+        seconds: float,
+        bytes_in: int = 0,
+        bytes_out: int = 0,
+        error: bool = False,
+    ):
+        key = (component, target, operation)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(seconds * 1000, bytes_in, bytes_out, error)
+
+    @contextmanager
+    def span(self, component: str, target: str, operation: str) -> Iterator[Span]:
+        """Time the body of a with block. Exceptions, cancellation included,
+        are recorded as errors and re-raised."""
+        span = Span()
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            self.record(
+                component,
+                target,
+                operation,
+                time.perf_counter() - start,
+                span.bytes_in,
+                span.bytes_out,
+                span.error,
+            )
+
+    def reset(self):
+        self._histograms.clear()
+        self.started_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All metrics as plain data, for JSON export."""
+        return {
+            "started_at": self.started_at,
+            "uptime_s": round(time.time() - self.started_at, 3),
+            "metrics": [
+                {"component": component, "target": target, "operation": operation, **histogram.to_dict()}
+                for (component, target, operation), histogram in sorted(self._histograms.items())
+            ],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def format_table(self) -> str:
+        """Human readable summary for the CLI."""
+        if not self._histograms:
+            return "No calls recorded yet."
+        rows = [("component", "target", "operation", "count", "err", "p50 ms", "p95 ms", "max ms", "KB in", "KB out")]
+        for (component, target, operation), h in sorted(self._histograms.items()):
+            rows.append((
+                component,
+                target if len(target) <= 28 else "…" + target[-27:],
+                operation,
+                str(h.count),
+                str(h.errors),
+                f"{h.percentile(50):.0f}",
+                f"{h.percentile(95):.0f}",
+                f"{h.max_ms:.1f}",
+                f"{h.bytes_in / 1024:.1f}",
+                f"{h.bytes_out / 1024:.1f}",
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join(
+            "  ".join(cell.ljust(width) if i < 3 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in rows
+        )
+
+
+# Shared by every client, model and chat in the process
+metrics = Metrics()
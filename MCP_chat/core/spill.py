@@ -0,0 +1,78 @@
+import os
+import uuid
+import atexit
+import shutil
+import tempfile
+from typing import Optional, Dict, Any
+
+
+class SpillStore:
+    """Keeps oversized tool results on local disk and serves them back in pages.
+
+    Results are stored as UTF-8 files in a private temporary directory that
+    is removed when the process exits. Pages are addressed by byte offset so
+    a read only touches the requested range.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+        self._owns_directory = directory is None
+        self._sizes: Dict[str, int] = {}
+
+    def _dir(self) -> str:
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="mcp_chat_spill_")
+            atexit.register(self.close)
+        return self._directory
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self._dir(), f"{handle}.txt")
+
+    def put(self, text: str) -> str:
+        """Store text and return the handle to read it back with."""
+        handle = uuid.uuid4().hex[:12]
+        data = text.encode("utf-8")
+        with open(self._path(handle), "wb") as f:
+            f.write(data)
+        self._sizes[handle] = len(data)
+        return handle
+
+    def size(self, handle: str) -> int:
+        if handle not in self._sizes:
+            raise KeyError(f"Unknown tool result handle '{handle}'")
+        return self._sizes[handle]
+
+    def read(self, handle: str, offset: int = 0, length: int = 8192) -> Dict[str, Any]:
+        """Read a page of a stored result, never splitting a UTF-8 character at the end."""
+        total = self.size(handle)
+        offset = max(0, min(offset, total))
+        length = max(1, length)
+        with open(self._path(handle), "rb") as f:
+            f.seek(offset)
+            # Read a few bytes past the page so a split character can be detected
+            data = f.read(length + 4)
+
+        cut = min(length, len(data))
+        while 0 < cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        if cut == 0 and data:
+            # A page shorter than the next character holds that whole
+            # character, so paging always moves forward
+            cut = 1
+            while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+                cut += 1
+        next_offset = offset + cut
+        return {
+            "handle": handle,
+            "offset": offset,
+            "text": data[:cut].decode("utf-8", errors="replace"),
+            "next_offset": next_offset if next_offset < total else None,
+            "total_bytes": total,
+        }
+
+    def close(self):
+        """Delete every stored result."""
+        if self._owns_directory and self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+        self._sizes.clear()
@@ -1,92 +1,194 @@
 import json
+import asyncio
+import weakref
 from typing import Optional, Literal, List, Dict, Any
 from mcp.types import CallToolResult, Tool, TextContent
-from mcp_client import MCPClient
+from mcp_client import MCPClient, ToolTimeoutError
+from core.spill import SpillStore
+
+READ_TOOL_RESULT = "read_tool_result"
 
 
 class ToolManager:
+    # Tool results larger than either cap are spilled and replaced by a preview
+    max_result_bytes: int = 16384
+    max_result_tokens: int = 4000
+    result_preview_bytes: int = 2000
+    spill_store: SpillStore = SpillStore()
+
+    # Tools answered by ToolManager itself rather than an MCP server
+    builtin_tools: list[Dict[str, Any]] = [
+        {
+            "name": READ_TOOL_RESULT,
+            "description": "Read part of a tool result that was too large to return in full. "
+            "Use the handle from the truncated result and the next_offset of the previous page.",
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "handle": {"type": "string", "description": "Handle of the truncated result"},
+                    "offset": {"type": "integer", "description": "Byte offset to start reading from"},
+                    "length": {"type": "integer", "description": "Maximum number of bytes to read"},
+                },
+                "required": ["handle"],
+            },
+        }
+    ]
+
+    # Parsed tool dicts per client, tagged with the client's tools_version
+    _catalogs: "weakref.WeakKeyDictionary[MCPClient, tuple[int, list[Dict[str, Any]]]]" = (
+        weakref.WeakKeyDictionary()
+    )
+    # (id of clients dict, catalog signature, tool name -> client, advertised tools)
+    _routing_cache: Optional[
+        tuple[int, tuple, dict[str, MCPClient], list[Dict[str, Any]]]
+    ] = None
+
     @classmethod
     async def get_all_tools(cls, clients: dict[str, MCPClient]) -> list[Dict[str, Any]]:
-        """Gets all tools from the provided clients."""
-        tools = []
-        
+        """Gets all tools from the provided clients.
+
+        Tools shadowed by a same-named tool on an earlier client are left
+        out, so every advertised name routes to exactly one client.
+        """
         if not clients:
             print(f"[WARNING] ToolManager.get_all_tools: No clients provided")
             return []
-        
+
+        _, tools = await cls._get_routing_table(clients)
+        return tools
+
+    @classmethod
+    async def _get_routing_table(
+        cls, clients: dict[str, MCPClient]
+    ) -> tuple[dict[str, MCPClient], list[Dict[str, Any]]]:
+        """Maps each tool name to the client that owns it.
+
+        Clients are searched in insertion order and the first one to
+        declare a name wins. The table is rebuilt only when a client's
+        catalog changes.
+        """
+        catalogs = []
         for client_name, client in clients.items():
             try:
-                tool_models = await client.list_tools()
+                catalogs.append(
+                    (client_name, client, await cls._get_client_catalog(client_name, client))
+                )
+            except Exception as e:
+                print(f"[ERROR] ToolManager.get_all_tools: Error getting tools from client '{client_name}': {type(e).__name__}: {e}")
+                continue
+
+        signature = tuple(
+            (client_name, id(client), client.tools_version)
+            for client_name, client, _ in catalogs
+        )
+        cached = cls._routing_cache
+        if cached is not None and cached[0] == id(clients) and cached[1] == signature:
+            return cached[2], cached[3]
+
+        routes: dict[str, MCPClient] = {}
+        owners: dict[str, str] = {tool["name"]: "built-in" for tool in cls.builtin_tools}
+        tools: list[Dict[str, Any]] = list(cls.builtin_tools)
+        for client_name, client, client_tools in catalogs:
+            for tool in client_tools:
+                tool_name = tool["name"]
+                if tool_name in owners:
+                    print(f"[WARNING] ToolManager._get_routing_table: Tool '{tool_name}' from client '{client_name}' is shadowed by client '{owners[tool_name]}'")
+                    continue
+                routes[tool_name] = client
+                owners[tool_name] = client_name
+                tools.append(tool)
+
+        cls._routing_cache = (id(clients), signature, routes, tools)
+        return routes, tools
+
+    @classmethod
+    async def _get_client_catalog(
+        cls, client_name: str, client: MCPClient
+    ) -> list[Dict[str, Any]]:
+        """Returns the parsed tools of a client, reparsing only when its catalog changed."""
+        tool_models = await client.list_tools()
+        cached = cls._catalogs.get(client)
+        if cached is not None and cached[0] == client.tools_version:
+            return cached[1]
+        tools = cls._parse_tools(client_name, tool_models)
+        cls._catalogs[client] = (client.tools_version, tools)
+        return tools
+
+    @classmethod
+    def _parse_tools(
+        cls, client_name: str, tool_models: list[Tool]
+    ) -> list[Dict[str, Any]]:
+        """Converts MCP tool models to tool dicts with parsed input schemas."""
+        tools = []
+        for i, t in enumerate(tool_models):
+            try:
+                tool_name = getattr(t, 'name', f'unknown_tool_{i}')
+                
+                # Handle inputSchema - it might be a string (JSON) or dict
+                input_schema = getattr(t, 'inputSchema', None)
+                input_schema_type = type(input_schema).__name__
                 
-                for i, t in enumerate(tool_models):
+                if isinstance(input_schema, str):
+                    try:
+                        input_schema = json.loads(input_schema)
+                    except json.JSONDecodeError as e:
+                        print(f"[ERROR] ToolManager._parse_tools: Failed to parse JSON for tool '{tool_name}': {e}")
+                        input_schema = {}
+                    except TypeError as e:
+                        print(f"[ERROR] ToolManager._parse_tools: TypeError parsing JSON for tool '{tool_name}': {e}")
+                        input_schema = {}
+                    except Exception as e:
+                        print(f"[ERROR] ToolManager._parse_tools: Unexpected error parsing JSON for tool '{tool_name}': {type(e).__name__}: {e}")
+                        input_schema = {}
+                elif input_schema is None:
+                    print(f"[WARNING] ToolManager._parse_tools: Tool '{tool_name}' has None inputSchema")
+                    input_schema = {}
+                elif not isinstance(input_schema, dict):
+                    print(f"[WARNING] ToolManager._parse_tools: Tool '{tool_name}' inputSchema is not dict or string, type: {input_schema_type}")
+                    # Try to convert if possible
                     try:
-                        tool_name = getattr(t, 'name', f'unknown_tool_{i}')
-                        
-                        # Handle inputSchema - it might be a string (JSON) or dict
-                        input_schema = getattr(t, 'inputSchema', None)
-                        input_schema_type = type(input_schema).__name__
-                        
-                        if isinstance(input_schema, str):
-                            try:
-                                input_schema = json.loads(input_schema)
-                            except json.JSONDecodeError as e:
-                                print(f"[ERROR] ToolManager.get_all_tools: Failed to parse JSON for tool '{tool_name}': {e}")
-                                input_schema = {}
-                            except TypeError as e:
-                                print(f"[ERROR] ToolManager.get_all_tools: TypeError parsing JSON for tool '{tool_name}': {e}")
-                                input_schema = {}
-                            except Exception as e:
-                                print(f"[ERROR] ToolManager.get_all_tools: Unexpected error parsing JSON for tool '{tool_name}': {type(e).__name__}: {e}")
-                                input_schema = {}
-                        elif input_schema is None:
-                            print(f"[WARNING] ToolManager.get_all_tools: Tool '{tool_name}' has None inputSchema")
+                        if hasattr(input_schema, '__dict__'):
+                            input_schema = dict(input_schema.__dict__)
+                        else:
                             input_schema = {}
-                        elif not isinstance(input_schema, dict):
-                            print(f"[WARNING] ToolManager.get_all_tools: Tool '{tool_name}' inputSchema is not dict or string, type: {input_schema_type}")
-                            # Try to convert if possible
-                            try:
-                                if hasattr(input_schema, '__dict__'):
-                                    input_schema = dict(input_schema.__dict__)
-                                else:
-                                    input_schema = {}
-                            except Exception as e:
-                                print(f"[ERROR] ToolManager.get_all_tools: Failed to convert inputSchema for tool '{tool_name}': {e}")
-                                input_schema = {}
-                        
-                        # Ensure we have required attributes
-                        if not hasattr(t, 'name'):
-                            print(f"[ERROR] ToolManager.get_all_tools: Tool {i} from client '{client_name}' missing 'name' attribute")
-                            continue
-                        
-                        tool_dict = {
-                            "name": t.name,
-                            "description": getattr(t, 'description', ''),
-                            "input_schema": input_schema,
-                        }
-                        tools.append(tool_dict)
-                    except AttributeError as e:
-                        print(f"[ERROR] ToolManager.get_all_tools: AttributeError processing tool {i} from client '{client_name}': {e}")
-                        continue
                     except Exception as e:
-                        print(f"[ERROR] ToolManager.get_all_tools: Unexpected error processing tool {i} from client '{client_name}': {type(e).__name__}: {e}")
-                        continue
+                        print(f"[ERROR] ToolManager._parse_tools: Failed to convert inputSchema for tool '{tool_name}': {e}")
+                        input_schema = {}
+                
+                # Ensure we have required attributes
+                if not hasattr(t, 'name'):
+                    print(f"[ERROR] ToolManager._parse_tools: Tool {i} from client '{client_name}' missing 'name' attribute")
+                    continue
+                
+                tool_dict = {
+                    "name": t.name,
+                    "description": getattr(t, 'description', ''),
+                    "input_schema": input_schema,
+                }
+                tools.append(tool_dict)
+            except AttributeError as e:
+                print(f"[ERROR] ToolManager._parse_tools: AttributeError processing tool {i} from client '{client_name}': {e}")
+                continue
             except Exception as e:
-                print(f"[ERROR] ToolManager.get_all_tools: Error getting tools from client '{client_name}': {type(e).__name__}: {e}")
+                print(f"[ERROR] ToolManager._parse_tools: Unexpected error processing tool {i} from client '{client_name}': {type(e).__name__}: {e}")
                 continue
-        
         return tools
 
     @classmethod
     async def _find_client_with_tool(
-        cls, clients: list[MCPClient], tool_name: str
+        cls, clients: dict[str, MCPClient], tool_name: str
     ) -> Optional[MCPClient]:
-        """Finds the first client that has the specified tool."""
-        for client in clients:
-            tools = await client.list_tools()
-            tool = next((t for t in tools if t.name == tool_name), None)
-            if tool:
-                return client
-        return None
+        """Finds the client that owns the specified tool.
+
+        Calls are answered from the table built when the tools were last
+        advertised, which is what the model chose from, so the common case
+        is a single dict lookup.
+        """
+        cached = cls._routing_cache
+        if cached is not None and cached[0] == id(clients) and tool_name in cached[2]:
+            return cached[2][tool_name]
+        routes, _ = await cls._get_routing_table(clients)
+        return routes.get(tool_name)
 
     @classmethod
     def _build_tool_result_part(
@@ -96,22 +198,9 @@ class ToolManager:
         status: Literal["success"] | Literal["error"],
     ) -> Dict[str, Any]:
         """Builds a tool result part dictionary for Gemini function response format."""
-        # Gemini expects functionResponse with name and response
-        # The response field needs to be properly formatted for protobuf conversion
-        # If result is a string, we need to ensure it's handled correctly
-        # If result is already a dict/list, use it as-is
-        # For simple types, wrap them appropriately
-        
-        # Ensure response is in a format that protobuf can handle
-        if isinstance(result, str):
-            # For strings, we can pass them directly, but sometimes need to wrap
-            # Check if it's JSON - if so, parse it
-            if result.strip().startswith('{') or result.strip().startswith('['):
-                try:
-                    result = json.loads(result)
-                except (json.JSONDecodeError, TypeError):
-                    # Not JSON, keep as string
-                    pass
+        # Gemini expects functionResponse with name and response.
+        # Results arrive already decoded by _tool_output_to_result, so the
+        # part is built as-is and Gemini wraps non-dict values when sending.
         
         # Build the function response part
         # Use snake_case for consistency with Gemini SDK expectations
@@ -122,11 +211,176 @@ class ToolManager:
             }
         }
 
+    @classmethod
+    def _tool_output_to_result(cls, content_list: list[str]) -> Any:
+        """Turns the text items of a tool output into a function response value.
+
+        JSON is decoded here, once. Output over max_result_bytes or
+        max_result_tokens is not decoded: it goes to the spill store and
+        the model gets a preview plus a handle for read_tool_result.
+        """
+        total_chars = sum(len(text) for text in content_list)
+        # Cheap upper bound first: a UTF-8 character is at most 4 bytes
+        if total_chars * 4 > cls.max_result_bytes or total_chars // 4 > cls.max_result_tokens:
+            full_text = "\n".join(content_list)
+            total_bytes = len(full_text.encode("utf-8"))
+            if total_bytes > cls.max_result_bytes or len(full_text) // 4 > cls.max_result_tokens:
+                handle = cls.spill_store.put(full_text)
+                page = cls.spill_store.read(handle, 0, cls.result_preview_bytes)
+                return {
+                    "truncated": True,
+                    "preview": page["text"],
+                    "handle": handle,
+                    "next_offset": page["next_offset"],
+                    "total_bytes": total_bytes,
+                    "note": f"Result too large to return in full. Call {READ_TOOL_RESULT} with this handle and next_offset to read more.",
+                }
+
+        if len(content_list) != 1:
+            return content_list
+
+        result = content_list[0]
+        # Only attempt to decode text that looks like a JSON object or array
+        stripped = result.lstrip()
+        if stripped.startswith("{") or stripped.startswith("["):
+            try:
+                return json.loads(result)
+            except (json.JSONDecodeError, TypeError):
+                # Not JSON, keep as string
+                pass
+        return result
+
+    @classmethod
+    def _read_tool_result(cls, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Serves a page of a spilled tool result for the read_tool_result tool."""
+        try:
+            handle = str(args.get("handle", ""))
+            offset = int(args.get("offset", 0) or 0)
+            length = int(args.get("length", 0) or cls.max_result_bytes)
+            return cls.spill_store.read(handle, offset, min(length, cls.max_result_bytes))
+        except KeyError as e:
+            return {"error": e.args[0]}
+        except (ValueError, TypeError) as e:
+            return {"error": f"Invalid arguments: {e}"}
+
+    @classmethod
+    def _timeout_result(cls, function_name: str, timeout: float) -> Dict[str, Any]:
+        return cls._build_tool_result_part(
+            function_name,
+            {
+                "error": "timeout",
+                "message": f"Tool '{function_name}' did not finish within {timeout:.1f}s and was cancelled. "
+                "Try a narrower request or continue without it.",
+                "timeout_seconds": round(timeout, 3),
+            },
+            "error",
+        )
+
+    @classmethod
+    async def _execute_function_call(
+        cls,
+        clients: dict[str, MCPClient],
+        function_call: Any,
+        i: int,
+        deadline: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Executes a single function call and builds its result part.
+
+        deadline is an event loop time the call must finish by.
+        """
+        try:
+            function_name = getattr(function_call, 'name', f'unknown_function_{i}')
+            
+            # Handle args - it might be None, a dict, or need conversion
+            function_args = {}
+            try:
+                if hasattr(function_call, 'args') and function_call.args is not None:
+                    if isinstance(function_call.args, dict):
+                        function_args = function_call.args
+                    else:
+                        try:
+                            function_args = dict(function_call.args)
+                        except (TypeError, ValueError) as e:
+                            print(f"[WARNING] ToolManager.execute_tool_requests: Could not convert args to dict for '{function_name}': {e}")
+                            function_args = {}
+            except Exception as e:
+                print(f"[ERROR] ToolManager.execute_tool_requests: Error processing args for '{function_name}': {type(e).__name__}: {e}")
+                function_args = {}
+            
+
+            if function_name == READ_TOOL_RESULT:
+                return cls._build_tool_result_part(
+                    function_name, cls._read_tool_result(function_args), "success"
+                )
+
+            client = await cls._find_client_with_tool(
+                clients, function_name
+            )
+
+            if not client:
+                print(f"[WARNING] ToolManager.execute_tool_requests: Could not find client for tool '{function_name}'")
+                tool_result_part = cls._build_tool_result_part(
+                    function_name, {"error": "Could not find that tool"}, "error"
+                )
+                return tool_result_part
+
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    return cls._timeout_result(function_name, 0.0)
+
+            try:
+                tool_output: CallToolResult | None = await client.call_tool(
+                    function_name, function_args, timeout=timeout
+                )
+                
+                items = []
+                if tool_output:
+                    try:
+                        items = tool_output.content
+                    except AttributeError as e:
+                        print(f"[ERROR] ToolManager.execute_tool_requests: Tool output missing 'content' attribute: {e}")
+                        items = []
+                
+                content_list = []
+                try:
+                    content_list = [
+                        item.text for item in items if isinstance(item, TextContent)
+                    ]
+                except Exception as e:
+                    print(f"[ERROR] ToolManager.execute_tool_requests: Error extracting text from tool output: {type(e).__name__}: {e}")
+                    content_list = []
+                
+                result = cls._tool_output_to_result(content_list)
+                
+                tool_result_part = cls._build_tool_result_part(
+                    function_name,
+                    result,
+                    "error" if (tool_output and tool_output.isError) else "success",
+                )
+            except ToolTimeoutError as e:
+                print(f"[WARNING] ToolManager.execute_tool_requests: {e}")
+                tool_result_part = cls._timeout_result(function_name, e.timeout)
+            except Exception as e:
+                error_message = f"Error executing tool '{function_name}': {type(e).__name__}: {e}"
+                print(f"[ERROR] ToolManager.execute_tool_requests: {error_message}")
+                tool_result_part = cls._build_tool_result_part(
+                    function_name,
+                    {"error": error_message},
+                    "error",
+                )
+
+            return tool_result_part
+        except Exception as e:
+            print(f"[ERROR] ToolManager._execute_function_call: Error processing function call {i}: {type(e).__name__}: {e}")
+            return None
+
     @classmethod
     async def execute_tool_requests(
-        cls, clients: dict[str, MCPClient], response: Any
+        cls, clients: dict[str, MCPClient], response: Any, deadline: Optional[float] = None
     ) -> List[Dict[str, Any]]:
-        """Executes function calls from a Gemini response."""
+        """Executes function calls from a Gemini response, each bounded by deadline."""
         try:
             # Extract function calls from Gemini response
             function_calls = []
@@ -149,97 +403,22 @@ class ToolManager:
             if not function_calls:
                 return []
             
-            tool_result_blocks: List[Dict[str, Any]] = []
-            
-            for i, function_call in enumerate(function_calls):
-                try:
-                    function_name = getattr(function_call, 'name', f'unknown_function_{i}')
-                    
-                    # Handle args - it might be None, a dict, or need conversion
-                    function_args = {}
-                    try:
-                        if hasattr(function_call, 'args') and function_call.args is not None:
-                            if isinstance(function_call.args, dict):
-                                function_args = function_call.args
-                            else:
-                                try:
-                                    function_args = dict(function_call.args)
-                                except (TypeError, ValueError) as e:
-                                    print(f"[WARNING] ToolManager.execute_tool_requests: Could not convert args to dict for '{function_name}': {e}")
-                                    function_args = {}
-                    except Exception as e:
-                        print(f"[ERROR] ToolManager.execute_tool_requests: Error processing args for '{function_name}': {type(e).__name__}: {e}")
-                        function_args = {}
-                    
-
-                    client = await cls._find_client_with_tool(
-                        list(clients.values()), function_name
-                    )
-
-                    if not client:
-                        print(f"[WARNING] ToolManager.execute_tool_requests: Could not find client for tool '{function_name}'")
-                        tool_result_part = cls._build_tool_result_part(
-                            function_name, {"error": "Could not find that tool"}, "error"
-                        )
-                        tool_result_blocks.append(tool_result_part)
-                        continue
+            # Calls run concurrently; each client caps its own in-flight calls
+            results = await asyncio.gather(
+                *(
+                    cls._execute_function_call(clients, function_call, i, deadline)
+                    for i, function_call in enumerate(function_calls)
+                ),
+                return_exceptions=True,
+            )
 
-                    try:
-                        tool_output: CallToolResult | None = await client.call_tool(
-                            function_name, function_args
-                        )
-                        
-                        items = []
-                        if tool_output:
-                            try:
-                                items = tool_output.content
-                            except AttributeError as e:
-                                print(f"[ERROR] ToolManager.execute_tool_requests: Tool output missing 'content' attribute: {e}")
-                                items = []
-                        
-                        content_list = []
-                        try:
-                            content_list = [
-                                item.text for item in items if isinstance(item, TextContent)
-                            ]
-                        except Exception as e:
-                            print(f"[ERROR] ToolManager.execute_tool_requests: Error extracting text from tool output: {type(e).__name__}: {e}")
-                            content_list = []
-                        
-                        # Convert to a result format
-                        if len(content_list) == 1:
-                            result = content_list[0]
-                        else:
-                            result = content_list
-                        
-                        # Try to parse as JSON if it looks like JSON
-                        try:
-                            if isinstance(result, str):
-                                parsed = json.loads(result)
-                                result = parsed
-                        except (json.JSONDecodeError, TypeError):
-                            # Not JSON, keep as string
-                            pass
-                        
-                        tool_result_part = cls._build_tool_result_part(
-                            function_name,
-                            result,
-                            "error" if (tool_output and tool_output.isError) else "success",
-                        )
-                    except Exception as e:
-                        error_message = f"Error executing tool '{function_name}': {type(e).__name__}: {e}"
-                        print(f"[ERROR] ToolManager.execute_tool_requests: {error_message}")
-                        tool_result_part = cls._build_tool_result_part(
-                            function_name,
-                            {"error": error_message},
-                            "error",
-                        )
-
-                    tool_result_blocks.append(tool_result_part)
-                except Exception as e:
-                    print(f"[ERROR] ToolManager.execute_tool_requests: Error processing function call {i}: {type(e).__name__}: {e}")
-                    # Continue with next function call
+            tool_result_blocks: List[Dict[str, Any]] = []
+            for i, result in enumerate(results):
+                if isinstance(result, BaseException):
+                    print(f"[ERROR] ToolManager.execute_tool_requests: Error processing function call {i}: {type(result).__name__}: {result}")
                     continue
+                if result is not None:
+                    tool_result_blocks.append(result)
             
             return tool_result_blocks
         except Exception as e:
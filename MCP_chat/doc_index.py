@@ -0,0 +1,181 @@
+import re
+import math
+import heapq
+import itertools
+from collections import Counter
+from typing import Callable, Collection, Iterable
+
+_TOKEN = re.compile(r"\w+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Characters of a document read at a time when looking for snippets, and
+# how far into a document to look before giving up
+SNIPPET_WINDOW = 65536
+SNIPPET_SCAN_CHARS = 2**20
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def term_counts(text: str) -> Counter:
+    return Counter(tokenize(text))
+
+
+def bm25_top(
+    doc_freqs: dict[str, int],
+    fetch: Callable[[str], list[tuple[str, int, int]]],
+    lookup: Callable[[str, Collection[str]], list[tuple[str, int, int]]],
+    total_docs: int,
+    total_length: int,
+    limit: int,
+) -> list[tuple[str, float]]:
+    """Rank documents by BM25 for the query terms in doc_freqs, which maps
+    each term to the number of documents containing it.
+
+    fetch(term) returns the term's whole posting list as (doc_id, term
+    frequency, document length in tokens), and lookup(term, doc_ids) the
+    postings of just those documents.
+
+    Terms are scored rarest first. Once no document outside the current
+    candidates could still reach the top `limit` from the remaining,
+    more common terms, those terms are only looked up for the
+    candidates, so long posting lists of common words are skipped
+    without changing the result.
+    """
+    if not total_docs:
+        return []
+    average_length = total_length / total_docs or 1
+    terms = sorted((df, term) for term, df in doc_freqs.items() if df)
+    idfs = [math.log(1 + (total_docs - df + 0.5) / (df + 0.5)) for df, _ in terms]
+    # The most a document can gain from terms[i:]
+    remaining = list(itertools.accumulate(reversed([idf * (K1 + 1) for idf in idfs])))[::-1]
+
+    scores: dict[str, float] = {}
+    for (df, term), idf, bound in zip(terms, idfs, remaining):
+        if (
+            len(scores) >= limit
+            and len(scores) < df
+            and heapq.nlargest(limit, scores.values())[-1] >= bound
+        ):
+            postings = lookup(term, list(scores))
+        else:
+            postings = fetch(term)
+        for doc_id, tf, length in postings:
+            norm = K1 * (1 - B + B * length / average_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+def _terms_pattern(words: list[str]) -> re.Pattern:
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b", re.IGNORECASE)
+
+
+def find_snippets(text: str, terms: Iterable[str], max_snippets: int = 3, context: int = 60) -> list[dict]:
+    """Character offsets of the first few query term matches in text,
+    each with some surrounding text."""
+    words = sorted(set(terms), key=len, reverse=True)
+    if not words:
+        return []
+    snippets = []
+    for match in _terms_pattern(words).finditer(text):
+        if len(snippets) == max_snippets:
+            break
+        start, end = match.span()
+        snippets.append({
+            "start": start,
+            "end": end,
+            "text": text[max(0, start - context):end + context],
+        })
+    return snippets
+
+
+def scan_snippets(
+    read: Callable[[int, int], str],
+    terms: Iterable[str],
+    max_snippets: int = 3,
+    context: int = 60,
+    window: int = SNIPPET_WINDOW,
+    max_chars: int = SNIPPET_SCAN_CHARS,
+) -> list[dict]:
+    """find_snippets for a document read a window at a time with
+    read(offset, length), so a search result never loads a whole long
+    document. Stops once max_snippets matches are found or the first
+    max_chars characters have been scanned."""
+    words = sorted(set(terms), key=len, reverse=True)
+    if not words:
+        return []
+    pattern = _terms_pattern(words)
+    # Each window is read with enough text on both sides to check word
+    # boundaries and cut the context of matches that start inside it
+    pad = len(words[0]) + context + 1
+    snippets = []
+    offset = 0
+    while offset < max_chars and len(snippets) < max_snippets:
+        base = max(0, offset - pad)
+        text = read(base, offset - base + window + pad)
+        for match in pattern.finditer(text, offset - base):
+            start, end = match.start() + base, match.end() + base
+            if start >= offset + window or len(snippets) == max_snippets:
+                break
+            snippets.append({
+                "start": start,
+                "end": end,
+                "text": text[max(0, start - context - base):end + context - base],
+            })
+        if base + len(text) <= offset + window:
+            break
+        offset += window
+    return snippets
+
+
+class InvertedIndex:
+    """In-memory term -> {doc_id: term frequency} index, kept current by
+    applying the term count changes of each edit."""
+
+    def __init__(self):
+        self.postings: dict[str, dict[str, int]] = {}
+        self.doc_lengths: dict[str, int] = {}
+        self.total_length = 0
+
+    def update(self, doc_id: str, removed: Counter, added: Counter):
+        """Apply an edit that removed text with term counts removed and
+        added text with term counts added. These are the whole document
+        for a new or overwritten one, or just the edited passages."""
+        for term in removed.keys() | added.keys():
+            change = added.get(term, 0) - removed.get(term, 0)
+            if not change:
+                continue
+            docs = self.postings.setdefault(term, {})
+            tf = docs.get(doc_id, 0) + change
+            if tf > 0:
+                docs[doc_id] = tf
+            else:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        change = sum(added.values()) - sum(removed.values())
+        self.doc_lengths[doc_id] = self.doc_lengths.get(doc_id, 0) + change
+        self.total_length += change
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        lengths = self.doc_lengths
+
+        def fetch(term):
+            return [(doc_id, tf, lengths[doc_id]) for doc_id, tf in self.postings[term].items()]
+
+        def lookup(term, doc_ids):
+            docs = self.postings[term]
+            return [(doc_id, docs[doc_id], lengths[doc_id]) for doc_id in doc_ids if doc_id in docs]
+
+        return bm25_top(
+            {term: len(self.postings.get(term, ())) for term in set(tokenize(query))},
+            fetch,
+            lookup,
+            len(lengths),
+            self.total_length,
+            limit,
+        )
@@ -0,0 +1,875 @@
+import os
+import re
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from collections import Counter
+from collections import OrderedDict
+from typing import Callable, Iterable, Iterator, Optional
+
+from doc_index import InvertedIndex, bm25_top, term_counts, tokenize
+from piece_table import PieceTable
+
+# Bumped when the schema changes; older files are upgraded on open
+SCHEMA_VERSION = 3
+
+# Changes listed in an edit's result, and characters of context around each
+MAX_REPORTED_CHANGES = 20
+CHANGE_CONTEXT = 40
+
+# Occurrences at most this many characters apart are edited together
+GROUP_GAP = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    chars INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL DEFAULT 0
+);
+-- Inverted index: term frequency per document, number of documents
+-- per term, and token count per document for BM25
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS doc_lengths (
+    doc_id TEXT PRIMARY KEY,
+    length INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS index_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    docs INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO index_totals VALUES (0, 0, 0);
+-- Edits not yet folded into documents: replacing old_length characters
+-- with new_string at each of offsets, a JSON list, and the change in
+-- size, which an edit of several rows records on its first. Any update
+-- to a documents row rewrites its whole body.
+CREATE TABLE IF NOT EXISTS journal (
+    doc_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    old_length INTEGER NOT NULL,
+    new_string TEXT NOT NULL,
+    offsets TEXT NOT NULL,
+    chars INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    edited_at REAL NOT NULL,
+    PRIMARY KEY (doc_id, seq)
+) WITHOUT ROWID
+"""
+
+
+def document_stats(content: str) -> dict[str, int]:
+    """Size of a document in characters, UTF-8 bytes and lines."""
+    lines = content.count("\n") + (1 if content and not content.endswith("\n") else 0)
+    return {"chars": len(content), "bytes": len(content.encode("utf-8")), "lines": lines}
+
+
+def _line_offset(content: str, line: int, start: int = 0) -> int:
+    """Offset of the line that is `line` lines after the one at start,
+    or len(content) if there are not that many."""
+    for _ in range(line):
+        start = content.find("\n", start) + 1
+        if not start:
+            return len(content)
+    return start
+
+
+def _text_lines(content: str, start_line: int, line_count: Optional[int] = None) -> str:
+    """read_lines for a document held as a string."""
+    start = _line_offset(content, start_line - 1)
+    end = len(content) if line_count is None else _line_offset(content, line_count, start)
+    return content[start:end]
+
+
+def _table_lines(table: PieceTable, start_line: int, line_count: Optional[int] = None) -> str:
+    """read_lines for a document held as a piece table."""
+    start = table.line_offset(start_line - 1)
+    end = len(table) if line_count is None else table.line_offset(line_count, start)
+    return table.slice(start, end)
+
+
+_LEADING_WORD = re.compile(r"\w+")
+_TRAILING_WORD = re.compile(r"\w+$")
+
+
+def _word_bounds(table: PieceTable, start: int, end: int) -> tuple[int, int]:
+    """Widen start:end so it does not cut through a word, so that the
+    terms of the span can be counted on their own."""
+    while start > 0:
+        chunk = table.slice(max(0, start - 64), start)
+        match = _TRAILING_WORD.search(chunk)
+        if not match:
+            break
+        start -= len(match.group())
+        if match.start() > 0:
+            break
+    while end < len(table):
+        chunk = table.slice(end, end + 64)
+        match = _LEADING_WORD.match(chunk)
+        if not match:
+            break
+        end += match.end()
+        if match.end() < len(chunk):
+            break
+    return start, end
+
+
+def _unterminated(table: PieceTable) -> int:
+    """1 if the last line has no newline, which still counts as a line."""
+    return int(len(table) > 0 and table.slice(len(table) - 1, len(table)) != "\n")
+
+
+class Edit:
+    """What an edit changed: where, the term counts of the edited
+    passages before and after, and how the document's size changed."""
+
+    def __init__(self, replacements: list[tuple[int, str, str]]):
+        # (offset, old string, new string), offsets in the text before the
+        # edit, left to right
+        self.replacements = replacements
+        # Replacements made for each edit of a batch
+        self.counts = [len(replacements)]
+        self.removed = Counter()
+        self.added = Counter()
+        self.chars = 0
+        self.bytes = 0
+        self.lines = 0
+        self.changes: list[dict] = []
+
+    @property
+    def offsets(self) -> list[int]:
+        return [start for start, _, _ in self.replacements]
+
+    def runs(self) -> Iterator[tuple[str, str, list[int]]]:
+        """The replacements as (old string, new string, offsets) runs of the
+        same strings, right to left. Applying each run's offsets right to
+        left, in this order, redoes the edit."""
+        run: list[int] = []
+        for start, old_string, new_string in reversed(self.replacements):
+            if run and (old_string, new_string) != key:
+                yield (*key, run[::-1])
+                run = []
+            key = (old_string, new_string)
+            run.append(start)
+        if run:
+            yield (*key, run[::-1])
+
+    def summary(self) -> dict:
+        """A compact description of the edit, instead of the whole document."""
+        summary = {"replacements": len(self.replacements), "changes": self.changes}
+        if len(self.replacements) > len(self.changes):
+            summary["unlisted_changes"] = len(self.replacements) - len(self.changes)
+        return summary
+
+
+def apply_replace(table: PieceTable, old_string: str, new_string: str, offset: Optional[int] = None) -> Edit:
+    """Replace every occurrence of old_string in table, or only the one at
+    offset when given. Apart from finding the occurrences, the work is
+    proportional to the replaced text and the words around it."""
+    if not old_string:
+        raise ValueError("old_string must not be empty")
+    if offset is None:
+        offsets = table.find_all(old_string)
+    elif table.slice(offset, offset + len(old_string)) == old_string:
+        offsets = [offset]
+    else:
+        raise ValueError(f"old_string was not found at offset {offset}")
+    return _apply(table, [(start, old_string, new_string) for start in offsets], every=offset is None)
+
+
+def apply_batch(table: PieceTable, edits: list[tuple[str, str, Optional[int]]]) -> Edit:
+    """Make several (old string, new string, offset) replacements at once,
+    each as apply_replace would, all against the text before the batch.
+
+    Every edit is checked before any is made, so either all are made or
+    none are: each old string must be found, none may be given twice
+    without an offset, and no two replacements may overlap. Where old
+    strings start at the same place, the longest is taken. Old strings
+    without an offset are all found in one pass over the text."""
+    errors: list[tuple[int, str]] = []
+    replacements = []
+    # Index of the edit replacing each old string wherever it occurs
+    everywhere: dict[str, int] = {}
+    for i, (old_string, new_string, offset) in enumerate(edits):
+        if not old_string:
+            errors.append((i, f"edit {i}: old_string must not be empty"))
+        elif offset is not None:
+            if table.slice(offset, offset + len(old_string)) == old_string:
+                replacements.append((offset, old_string, new_string, i))
+            else:
+                errors.append((i, f"edit {i}: old_string was not found at offset {offset}"))
+        elif old_string in everywhere:
+            errors.append((i, f"edit {i}: old_string is the same as edit {everywhere[old_string]}'s"))
+        else:
+            everywhere[old_string] = i
+    if everywhere:
+        for start, old_string in table.find_any(everywhere):
+            i = everywhere[old_string]
+            replacements.append((start, old_string, edits[i][1], i))
+
+    replacements.sort()
+    counts = Counter(i for _, _, _, i in replacements)
+    for old_string, i in everywhere.items():
+        if not counts[i]:
+            errors.append((i, f"edit {i}: old_string was not found"))
+    for previous, current in zip(replacements, replacements[1:]):
+        if current[0] < previous[0] + len(previous[1]):
+            first, second = sorted((previous[3], current[3]))
+            errors.append((first, f"edits {first} and {second} overlap at offset {current[0]}"))
+    if errors:
+        raise ValueError("No edits were made: " + "; ".join(message for _, message in sorted(errors)))
+
+    edit = _apply(
+        table,
+        [(start, old_string, new_string) for start, old_string, new_string, _ in replacements],
+        every=len(everywhere) == len(edits) == 1,
+    )
+    edit.counts = [counts[i] for i in range(len(edits))]
+    return edit
+
+
+def _apply(table: PieceTable, replacements: list[tuple[int, str, str]], every: bool = False) -> Edit:
+    """Make replacements, (offset, old string, new string) left to right
+    and not overlapping, in table. every says they are all the
+    occurrences of a single old string, as found left to right."""
+    edit = Edit(replacements)
+    if not replacements:
+        return edit
+
+    # Replacements close together are edited as one span, so the table is
+    # read and spliced once per group rather than once per replacement
+    groups: list[list[tuple[int, str, str]]] = []
+    for replacement in replacements:
+        if groups and replacement[0] - groups[-1][-1][0] - len(groups[-1][-1][1]) <= GROUP_GAP:
+            groups[-1].append(replacement)
+        else:
+            groups.append([replacement])
+    # Widen each group to whole words, so the terms of the span can be
+    # counted on their own; groups whose widened spans touch are merged
+    spans: list[tuple[int, int, list[tuple[int, str, str]]]] = []
+    for group in groups:
+        span_start, span_end = _word_bounds(table, group[0][0], group[-1][0] + len(group[-1][1]))
+        if spans and span_start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], span_end), spans[-1][2] + group)
+        else:
+            spans.append((span_start, span_end, group))
+
+    was_unterminated = _unterminated(table)
+    splices = []
+    shift = 0
+    for span_start, span_end, group in spans:
+        # Read enough around the span for the context of each change
+        read_start = max(0, span_start - CHANGE_CONTEXT)
+        text = table.slice(read_start, span_end + CHANGE_CONTEXT)
+        first = group[0][0] - read_start
+        last = group[-1][0] + len(group[-1][1]) - read_start
+        if every:
+            # Starting at the first occurrence, str.replace finds the same
+            # ones; with anchored replacements it could find others between
+            middle = text[first:last].replace(group[0][1], group[0][2])
+        else:
+            parts = []
+            position = first
+            for start, old_string, new_string in group:
+                parts += [text[position:start - read_start], new_string]
+                position = start - read_start + len(old_string)
+            middle = "".join(parts)
+        new_text = text[:first] + middle + text[last:]
+        span_shift = len(new_text) - len(text)
+        new_span = new_text[span_start - read_start:span_end - read_start + span_shift]
+        edit.removed.update(tokenize(text[span_start - read_start:span_end - read_start]))
+        edit.added.update(tokenize(new_span))
+        local_shift = 0
+        for start, old_string, new_string in group[:MAX_REPORTED_CHANGES - len(edit.changes)]:
+            local = start - read_start
+            new_local = local + local_shift
+            edit.changes.append({
+                "offset": start + shift + local_shift,
+                "before": text[max(0, local - CHANGE_CONTEXT):local + len(old_string) + CHANGE_CONTEXT],
+                "after": new_text[max(0, new_local - CHANGE_CONTEXT):new_local + len(new_string) + CHANGE_CONTEXT],
+            })
+            local_shift += len(new_string) - len(old_string)
+        shift += span_shift
+        splices.append((span_start, span_end - span_start, new_span))
+    # Right to left, so the spans still to be replaced stay where they were
+    for span_start, length, new_span in reversed(splices):
+        table.replace(span_start, length, new_span)
+
+    for (old_string, new_string), count in Counter(
+        (old_string, new_string) for _, old_string, new_string in replacements
+    ).items():
+        edit.chars += count * (len(new_string) - len(old_string))
+        edit.bytes += count * (len(new_string.encode("utf-8")) - len(old_string.encode("utf-8")))
+        edit.lines += count * (new_string.count("\n") - old_string.count("\n"))
+    edit.lines += _unterminated(table) - was_unterminated
+    return edit
+
+
+class DocumentNotFoundError(ValueError):
+    def __init__(self, doc_id: str):
+        super().__init__(f"Document {doc_id} not found")
+        self.doc_id = doc_id
+
+
+class DocumentStore(ABC):
+    """Storage engine behind the document server's tools and resources."""
+
+    @abstractmethod
+    def list_ids(self) -> list[str]:
+        """All document ids, sorted."""
+
+    @abstractmethod
+    def exists(self, doc_id: str) -> bool: ...
+
+    @abstractmethod
+    def get(self, doc_id: str) -> str:
+        """The document's contents; raises DocumentNotFoundError."""
+
+    @abstractmethod
+    def put(self, doc_id: str, content: str):
+        """Create or overwrite a document."""
+
+    @abstractmethod
+    def replace(self, doc_id: str, old_string: str, new_string: str, offset: Optional[int] = None) -> Edit:
+        """Replace every occurrence of old_string, or only the one at
+        offset, in one atomic edit; raises DocumentNotFoundError."""
+
+    @abstractmethod
+    def replace_many(self, doc_id: str, edits: list[tuple[str, str, Optional[int]]]) -> Edit:
+        """Make a batch of (old_string, new_string, offset) replacements, as
+        apply_batch does, in one atomic edit; raises DocumentNotFoundError,
+        or ValueError naming every edit that cannot be made."""
+
+    def read_range(self, doc_id: str, offset: int, length: Optional[int] = None) -> str:
+        """Characters offset to offset + length of the document, or to its
+        end when length is None."""
+        content = self.get(doc_id)
+        return content[offset:] if length is None else content[offset:offset + length]
+
+    def read_lines(self, doc_id: str, start_line: int, line_count: Optional[int] = None) -> str:
+        """line_count lines from 1-based start_line, with their line
+        endings, or the rest of the document when line_count is None."""
+        return _text_lines(self.get(doc_id), start_line, line_count)
+
+    def metadata(self, doc_id: str) -> dict[str, int]:
+        """The document's size, as returned by document_stats."""
+        return document_stats(self.get(doc_id))
+
+    def seed(self, docs: dict[str, str]):
+        """Add docs, but only to a store that has no documents yet."""
+        if not self.count():
+            self.put_many(docs.items())
+
+    def put_many(self, items: Iterable[tuple[str, str]]):
+        for doc_id, content in items:
+            self.put(doc_id, content)
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        """Ids of the documents that best match query, with BM25 scores,
+        best first."""
+
+    def flush(self):
+        """Write out edits that are held back; nothing to do by default."""
+
+    def close(self):
+        self.flush()
+
+
+class MemoryDocumentStore(DocumentStore):
+    """Documents in a dict; nothing survives a restart."""
+
+    # A document is rebuilt as a single piece when edits have split it
+    # into more pieces than this
+    max_pieces = 4096
+
+    def __init__(self):
+        self._docs: dict[str, PieceTable] = {}
+        # doc_id -> document_stats, kept current from each edit's deltas
+        self._stats: dict[str, dict[str, int]] = {}
+        self._index = InvertedIndex()
+
+    def list_ids(self) -> list[str]:
+        return sorted(self._docs)
+
+    def exists(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def _table(self, doc_id: str) -> PieceTable:
+        try:
+            return self._docs[doc_id]
+        except KeyError:
+            raise DocumentNotFoundError(doc_id) from None
+
+    def get(self, doc_id: str) -> str:
+        return self._table(doc_id).text()
+
+    def read_range(self, doc_id: str, offset: int, length: Optional[int] = None) -> str:
+        table = self._table(doc_id)
+        return table.slice(offset, len(table) if length is None else offset + length)
+
+    def read_lines(self, doc_id: str, start_line: int, line_count: Optional[int] = None) -> str:
+        return _table_lines(self._table(doc_id), start_line, line_count)
+
+    def metadata(self, doc_id: str) -> dict[str, int]:
+        self._table(doc_id)
+        return dict(self._stats[doc_id])
+
+    def put(self, doc_id: str, content: str):
+        old = self._docs.get(doc_id)
+        self._docs[doc_id] = PieceTable(content)
+        self._stats[doc_id] = document_stats(content)
+        self._index.update(doc_id, term_counts(old.text()) if old is not None else Counter(), term_counts(content))
+
+    def replace(self, doc_id: str, old_string: str, new_string: str, offset: Optional[int] = None) -> Edit:
+        return self._edit(doc_id, lambda table: apply_replace(table, old_string, new_string, offset))
+
+    def replace_many(self, doc_id: str, edits: list[tuple[str, str, Optional[int]]]) -> Edit:
+        return self._edit(doc_id, lambda table: apply_batch(table, edits))
+
+    def _edit(self, doc_id: str, apply: Callable[[PieceTable], Edit]) -> Edit:
+        table = self._table(doc_id)
+        edit = apply(table)
+        self._index.update(doc_id, edit.removed, edit.added)
+        stats = self._stats[doc_id]
+        stats["chars"] += edit.chars
+        stats["bytes"] += edit.bytes
+        stats["lines"] += edit.lines
+        if table.piece_count > self.max_pieces:
+            self._docs[doc_id] = PieceTable(table.text())
+        return edit
+
+    def count(self) -> int:
+        return len(self._docs)
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        return self._index.search(query, limit)
+
+
+class SQLiteDocumentStore(DocumentStore):
+    """Documents in a SQLite file, so edits survive restarts and the corpus
+    does not have to fit in memory.
+
+    Lookups go through the primary key index. Listing reads only that
+    index, so no document body is loaded until it is asked for. Each
+    edit is one transaction; the write-ahead log lets several server
+    processes read the file while one of them writes.
+
+    The inverted index for search lives in the same file and is updated
+    in the edit's transaction, touching only terms whose counts changed.
+
+    A document of journal_min_chars or more is kept open as a piece table
+    once edited, and each edit is appended to a journal instead of
+    rewriting the body. After journal_limit edits, when the document is
+    evicted from the max_open_docs open documents, or on flush, the body
+    is written out and its journal entries are dropped. Journal entries
+    left by a crash are replayed when the document is next opened.
+
+    Several processes may share a file. Each read and edit runs in a
+    transaction that first checks PRAGMA data_version, and when another
+    process has written since, drops the open documents and counts the
+    journal again before going on.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        journal_min_chars: int = 65536,
+        journal_limit: int = 1000,
+        max_open_docs: int = 16,
+    ):
+        self.path = path
+        self.journal_min_chars = journal_min_chars
+        self.journal_limit = journal_limit
+        self.max_open_docs = max_open_docs
+        # Edited documents as piece tables, least recently used first
+        self._open: OrderedDict[str, PieceTable] = OrderedDict()
+        # Sizes of recently used documents, least recently used first.
+        # The size columns come after the body in each row, so reading
+        # them from SQLite walks the whole body.
+        self._sizes: OrderedDict[str, dict[str, int]] = OrderedDict()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Autocommit; transactions are opened explicitly where needed
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        with self._transaction("IMMEDIATE"):
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            # One statement at a time: executescript would commit first
+            for statement in _SCHEMA.split(";"):
+                self._db.execute(statement)
+            if version < 2:
+                self._add_size_columns()
+            if version < 1:
+                self._rebuild_index()
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        # Journal entries per document whose body is not up to date
+        self._pending = self._load_pending()
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def list_ids(self) -> list[str]:
+        return [row[0] for row in self._db.execute("SELECT id FROM documents ORDER BY id")]
+
+    def exists(self, doc_id: str) -> bool:
+        return self._db.execute("SELECT 1 FROM documents WHERE id = ?", (doc_id,)).fetchone() is not None
+
+    def get(self, doc_id: str) -> str:
+        with self._snapshot():
+            return self._get(doc_id)
+
+    def _get(self, doc_id: str) -> str:
+        if doc_id in self._pending:
+            return self._table(doc_id).text()
+        row = self._db.execute("SELECT body FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            raise DocumentNotFoundError(doc_id)
+        return row[0]
+
+    def read_range(self, doc_id: str, offset: int, length: Optional[int] = None) -> str:
+        with self._snapshot():
+            if doc_id in self._pending:
+                table = self._table(doc_id)
+                return table.slice(offset, len(table) if length is None else offset + length)
+            # substr counts characters from 1; only the range leaves SQLite
+            if length is None:
+                query, params = "SELECT substr(body, ?) FROM documents WHERE id = ?", (offset + 1, doc_id)
+            else:
+                query, params = "SELECT substr(body, ?, ?) FROM documents WHERE id = ?", (offset + 1, length, doc_id)
+            row = self._db.execute(query, params).fetchone()
+        if row is None:
+            raise DocumentNotFoundError(doc_id)
+        return row[0]
+
+    def read_lines(self, doc_id: str, start_line: int, line_count: Optional[int] = None) -> str:
+        # A document that is not open is read whole; SQLite cannot find
+        # the nth line of a body without reading it
+        with self._snapshot():
+            if doc_id in self._pending:
+                return _table_lines(self._table(doc_id), start_line, line_count)
+            content = self._get(doc_id)
+        return _text_lines(content, start_line, line_count)
+
+    def metadata(self, doc_id: str) -> dict[str, int]:
+        with self._snapshot():
+            sizes = self._sizes.get(doc_id)
+            if sizes is None:
+                row = self._db.execute(
+                    "SELECT d.chars + IFNULL(SUM(j.chars), 0), d.bytes + IFNULL(SUM(j.bytes), 0), "
+                    "d.lines + IFNULL(SUM(j.lines), 0) FROM documents AS d LEFT JOIN journal AS j "
+                    "ON j.doc_id = d.id WHERE d.id = ? GROUP BY d.id",
+                    (doc_id,),
+                ).fetchone()
+                if row is None:
+                    raise DocumentNotFoundError(doc_id)
+                sizes = dict(zip(("chars", "bytes", "lines"), row))
+                self._sizes[doc_id] = sizes
+                while len(self._sizes) > self.max_open_docs:
+                    self._sizes.popitem(last=False)
+            else:
+                self._sizes.move_to_end(doc_id)
+            return dict(sizes)
+
+    def _get_optional(self, doc_id: str) -> Optional[str]:
+        try:
+            return self._get(doc_id)
+        except DocumentNotFoundError:
+            return None
+
+    def _table(self, doc_id: str, writing: bool = False) -> PieceTable:
+        """The document as a piece table, with any journaled edits applied.
+        Documents with journaled edits are kept open."""
+        table = self._open.get(doc_id)
+        if table is not None:
+            self._open.move_to_end(doc_id)
+            return table
+        row = self._db.execute("SELECT body FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            raise DocumentNotFoundError(doc_id)
+        table = PieceTable(row[0])
+        for old_length, new_string, offsets in self._db.execute(
+            "SELECT old_length, new_string, offsets FROM journal WHERE doc_id = ? ORDER BY seq", (doc_id,)
+        ):
+            for offset in reversed(json.loads(offsets)):
+                table.replace(offset, old_length, new_string)
+        if doc_id in self._pending:
+            self._keep_open(doc_id, table, writing)
+        return table
+
+    def _keep_open(self, doc_id: str, table: PieceTable, writing: bool = False):
+        """Keep a document open, closing the least recently used beyond
+        max_open_docs. Those with journaled edits are flushed when writing,
+        and otherwise left to be replayed when next opened."""
+        self._open[doc_id] = table
+        while len(self._open) > self.max_open_docs:
+            evicted = next(iter(self._open))
+            if writing and evicted in self._pending:
+                self._flush_doc(evicted)
+            del self._open[evicted]
+
+    def put(self, doc_id: str, content: str):
+        self.put_many([(doc_id, content)])
+
+    def put_many(self, items: Iterable[tuple[str, str]]):
+        now = time.time()
+        with self._snapshot("IMMEDIATE"):
+            for doc_id, content in items:
+                old = self._get_optional(doc_id)
+                if doc_id in self._pending:
+                    self._db.execute("DELETE FROM journal WHERE doc_id = ?", (doc_id,))
+                    del self._pending[doc_id]
+                self._open.pop(doc_id, None)
+                self._sizes.pop(doc_id, None)
+                stats = document_stats(content)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO documents (id, body, updated_at, chars, bytes, lines) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, content, now, stats["chars"], stats["bytes"], stats["lines"]),
+                )
+                self._update_index(
+                    doc_id, term_counts(old) if old is not None else None, term_counts(content)
+                )
+
+    def replace(self, doc_id: str, old_string: str, new_string: str, offset: Optional[int] = None) -> Edit:
+        return self._edit(doc_id, lambda table: apply_replace(table, old_string, new_string, offset))
+
+    def replace_many(self, doc_id: str, edits: list[tuple[str, str, Optional[int]]]) -> Edit:
+        return self._edit(doc_id, lambda table: apply_batch(table, edits))
+
+    def _edit(self, doc_id: str, apply: Callable[[PieceTable], Edit]) -> Edit:
+        try:
+            # IMMEDIATE takes the write lock before reading, so a concurrent
+            # edit from another process cannot be lost between read and write
+            with self._snapshot("IMMEDIATE"):
+                table = self._table(doc_id, writing=True)
+                journaled = doc_id in self._pending or len(table) >= self.journal_min_chars
+                edit = apply(table)
+                if not edit.replacements:
+                    return edit
+                self._update_index(doc_id, edit.removed, edit.added)
+                cached = self._sizes.get(doc_id)
+                if cached is not None:
+                    cached["chars"] += edit.chars
+                    cached["bytes"] += edit.bytes
+                    cached["lines"] += edit.lines
+                if not journaled:
+                    # Small documents cost less to rewrite than to journal
+                    self._db.execute(
+                        "UPDATE documents SET body = ?, chars = chars + ?, bytes = bytes + ?, lines = lines + ?, "
+                        "updated_at = ? WHERE id = ?",
+                        (table.text(), edit.chars, edit.bytes, edit.lines, time.time(), doc_id),
+                    )
+                    return edit
+                if doc_id not in self._open:
+                    self._keep_open(doc_id, table, writing=True)
+                seq = self._pending.get(doc_id, 0)
+                now = time.time()
+                # The edit's size change goes on its first row
+                sizes = (edit.chars, edit.bytes, edit.lines)
+                for old_string, new_string, offsets in edit.runs():
+                    self._db.execute(
+                        "INSERT INTO journal (doc_id, seq, old_length, new_string, offsets, chars, bytes, lines, "
+                        "edited_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (doc_id, seq, len(old_string), new_string, json.dumps(offsets), *sizes, now),
+                    )
+                    seq += 1
+                    sizes = (0, 0, 0)
+                self._pending[doc_id] = seq
+                if seq >= self.journal_limit:
+                    self._flush_doc(doc_id)
+        except BaseException:
+            # The rollback may also have undone changes made on the way,
+            # such as flushing another document to make room; reread this
+            # document and what is pending from the file next time
+            self._open.pop(doc_id, None)
+            self._sizes.pop(doc_id, None)
+            self._pending = self._load_pending()
+            raise
+        return edit
+
+    def _load_pending(self) -> dict[str, int]:
+        return dict(self._db.execute("SELECT doc_id, COUNT(*) FROM journal GROUP BY doc_id"))
+
+    def _flush_doc(self, doc_id: str):
+        """Fold a document's journal into its row; call in a transaction."""
+        body = self._open[doc_id].text()
+        self._db.execute(
+            "UPDATE documents SET body = ?, chars = documents.chars + j.chars, "
+            "bytes = documents.bytes + j.bytes, lines = documents.lines + j.lines, updated_at = j.edited_at "
+            "FROM (SELECT SUM(chars) AS chars, SUM(bytes) AS bytes, SUM(lines) AS lines, "
+            "MAX(edited_at) AS edited_at FROM journal WHERE doc_id = ?) AS j WHERE id = ?",
+            (body, doc_id, doc_id),
+        )
+        self._db.execute("DELETE FROM journal WHERE doc_id = ?", (doc_id,))
+        del self._pending[doc_id]
+        # Start again from a single piece
+        self._open[doc_id] = PieceTable(body)
+
+    def flush(self):
+        with self._snapshot("IMMEDIATE"):
+            while self._pending:
+                doc_id = next(iter(self._pending))
+                self._table(doc_id, writing=True)
+                self._flush_doc(doc_id)
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+        total_docs, total_length = self._db.execute(
+            "SELECT docs, length FROM index_totals WHERE id = 0"
+        ).fetchone()
+        doc_freqs = dict(self._db.execute(
+            f"SELECT term, df FROM terms WHERE term IN ({', '.join('?' * len(terms))})", terms
+        ))
+
+        def fetch(term):
+            return self._db.execute(
+                "SELECT p.doc_id, p.tf, l.length FROM postings p "
+                "JOIN doc_lengths l ON l.doc_id = p.doc_id WHERE p.term = ?",
+                (term,),
+            ).fetchall()
+
+        def lookup(term, doc_ids):
+            rows = []
+            for i in range(0, len(doc_ids), 500):
+                batch = doc_ids[i:i + 500]
+                rows += self._db.execute(
+                    "SELECT p.doc_id, p.tf, l.length FROM postings p "
+                    "JOIN doc_lengths l ON l.doc_id = p.doc_id "
+                    f"WHERE p.term = ? AND p.doc_id IN ({', '.join('?' * len(batch))})",
+                    (term, *batch),
+                ).fetchall()
+            return rows
+
+        return bm25_top(doc_freqs, fetch, lookup, total_docs, total_length, limit)
+
+    def _update_index(self, doc_id: str, removed: Optional[Counter], added: Counter):
+        """Apply the term counts of the text an edit removed and added,
+        as InvertedIndex.update does; removed is None for a new document."""
+        is_new = removed is None
+        removed = removed or Counter()
+        changes = {
+            term: added.get(term, 0) - removed.get(term, 0) for term in removed.keys() | added.keys()
+        }
+        changes = {term: change for term, change in changes.items() if change}
+        current: dict[str, int] = {}
+        if not is_new:
+            terms = list(changes)
+            for i in range(0, len(terms), 500):
+                batch = terms[i:i + 500]
+                current.update(self._db.execute(
+                    f"SELECT term, tf FROM postings WHERE doc_id = ? AND term IN ({', '.join('?' * len(batch))})",
+                    (doc_id, *batch),
+                ))
+        tfs = {term: current.get(term, 0) + change for term, change in changes.items()}
+        self._db.executemany(
+            "DELETE FROM postings WHERE term = ? AND doc_id = ?",
+            ((term, doc_id) for term, tf in tfs.items() if tf <= 0),
+        )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+            ((term, doc_id, tf) for term, tf in tfs.items() if tf > 0),
+        )
+        self._db.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+            (
+                (term, 1 if tf > 0 else -1)
+                for term, tf in tfs.items()
+                if (tf > 0) != (current.get(term, 0) > 0)
+            ),
+        )
+        length_change = sum(added.values()) - sum(removed.values())
+        self._db.execute(
+            "INSERT INTO doc_lengths (doc_id, length) VALUES (?, ?) "
+            "ON CONFLICT (doc_id) DO UPDATE SET length = length + excluded.length",
+            (doc_id, length_change),
+        )
+        self._db.execute(
+            "UPDATE index_totals SET docs = docs + ?, length = length + ? WHERE id = 0",
+            (int(is_new), length_change),
+        )
+
+    def _add_size_columns(self):
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(documents)")}
+        for column in ("chars", "bytes", "lines"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE documents ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        for doc_id, body in self._db.cursor().execute("SELECT id, body FROM documents"):
+            stats = document_stats(body)
+            self._db.execute(
+                "UPDATE documents SET chars = ?, bytes = ?, lines = ? WHERE id = ?",
+                (stats["chars"], stats["bytes"], stats["lines"], doc_id),
+            )
+
+    def _rebuild_index(self):
+        self._db.execute("DELETE FROM postings")
+        self._db.execute("DELETE FROM terms")
+        self._db.execute("DELETE FROM doc_lengths")
+        self._db.execute("UPDATE index_totals SET docs = 0, length = 0")
+        for doc_id, body in self._db.cursor().execute("SELECT id, body FROM documents"):
+            self._update_index(doc_id, None, term_counts(body))
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    @contextmanager
+    def _snapshot(self, mode: str = "DEFERRED") -> Iterator[None]:
+        """A transaction whose open documents and journal counts agree with
+        what it reads, however other processes have written the file."""
+        with self._transaction(mode):
+            # Reading starts the transaction's snapshot before the check
+            self._db.execute("SELECT 1 FROM index_totals").fetchone()
+            version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._data_version:
+                self._open.clear()
+                self._sizes.clear()
+                self._pending = self._load_pending()
+                self._data_version = version
+            yield
+
+    @contextmanager
+    def _transaction(self, mode: str = "DEFERRED") -> Iterator[None]:
+        self._db.execute(f"BEGIN {mode}")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+
+def open_store(backend: Optional[str] = None, path: Optional[str] = None) -> DocumentStore:
+    """The store named by backend, or DOC_STORE_BACKEND: "sqlite" (the
+    default) at path or DOC_STORE_PATH, or "memory"."""
+    backend = backend or os.getenv("DOC_STORE_BACKEND", "sqlite")
+    if backend == "memory":
+        return MemoryDocumentStore()
+    if backend == "sqlite":
+        path = path or os.getenv(
+            "DOC_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents.db")
+        )
+        return SQLiteDocumentStore(path)
+    raise ValueError(f"Unknown document store backend '{backend}', expected 'sqlite' or 'memory'")
@@ -1,11 +1,17 @@
 import asyncio
+import hashlib
 import sys
 import os
+from contextlib import nullcontext
+from typing import Optional
 from dotenv import load_dotenv
-from contextlib import AsyncExitStack
+from mcp.client.stdio import get_default_environment
 
-from mcp_client import MCPClient
-from core.gemini import Gemini
+from mcp_client import MCPClient, start_clients, stop_clients
+from core.gemini import Gemini, load_sdk
+from core.context import ContextBudget
+from core.limiter import ModelCallLimiter
+from core.tools import ToolManager
 
 from core.cli_chat import CliChat
 from core.cli import CliApp
@@ -16,52 +22,138 @@ load_dotenv()
 gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
 gemini_api_key = os.getenv("GEMINI_API_KEY", "")
 
+# Context budget config
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "100000"))
+context_summarize = os.getenv("CONTEXT_SUMMARIZE", "0") == "1"
 
-assert gemini_api_key, (
-    "Error: GEMINI_API_KEY cannot be empty. Update .env"
+# Tool results over either cap are spilled to disk and paged by the model
+ToolManager.max_result_bytes = int(os.getenv("TOOL_RESULT_MAX_BYTES", "16384"))
+ToolManager.max_result_tokens = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "4000"))
+
+# Secondary servers can start on first use, advertising their tools from a
+# saved manifest until then, and stop again after MCP_IDLE_TIMEOUT seconds
+lazy_servers = os.getenv("MCP_LAZY", "0") == "1"
+idle_timeout = float(os.getenv("MCP_IDLE_TIMEOUT", "300")) or None
+manifest_dir = os.getenv(
+    "MCP_MANIFEST_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mcp_chat", "manifests")
 )
 
+# Timeouts in seconds; unset means no limit. TOOL_TIMEOUTS overrides
+# TOOL_CALL_TIMEOUT per tool, e.g. "slow_scan=300,read_doc_contents=5"
+query_timeout = float(os.getenv("QUERY_TIMEOUT", "0")) or None
+tool_call_timeout = float(os.getenv("TOOL_CALL_TIMEOUT", "0")) or None
+tool_timeouts = {
+    name.strip(): float(seconds)
+    for name, _, seconds in (
+        item.partition("=") for item in os.getenv("TOOL_TIMEOUTS", "").split(",") if item.strip()
+    )
+}
 
-async def main():
-    gemini_service = Gemini(model=gemini_model, api_key=gemini_api_key)
 
-    server_scripts = sys.argv[1:]
-    clients = {}
+assert gemini_api_key, (
+    "Error: GEMINI_API_KEY cannot be empty. Update .env"
+)
 
+
+def build_clients(server_scripts: list[str]) -> dict[str, MCPClient]:
+    """The document server client plus one client per extra server,
+    configured from the environment but not yet started."""
     command, args = (
         ("uv", ["run", "mcp_server.py"])
         if os.getenv("USE_UV", "0") == "1"
         else ("python", ["mcp_server.py"])
     )
 
-    async with AsyncExitStack() as stack:
-        doc_client = await stack.enter_async_context(
-            MCPClient(command=command, args=args)
-        )
-        clients["doc_client"] = doc_client
-
-        for i, server_script in enumerate(server_scripts):
-            client_id = f"client_{i}_{server_script}"
-            client = await stack.enter_async_context(
-                MCPClient(command="uv", args=["run", server_script])
+    # A shared document server can be used instead of a private subprocess
+    doc_server_url = os.getenv("DOC_SERVER_URL")
+    timeouts = {"call_timeout": tool_call_timeout, "tool_timeouts": tool_timeouts}
+    # Subprocesses only inherit a minimal environment, so the document
+    # server's DOC_* settings from .env are passed on explicitly
+    doc_env = {
+        **get_default_environment(),
+        **{name: value for name, value in os.environ.items() if name.startswith("DOC_")},
+    }
+    clients = {
+        "doc_client": MCPClient(url=doc_server_url, name="doc_client", **timeouts)
+        if doc_server_url
+        else MCPClient(command=command, args=args, env=doc_env, name="doc_client", **timeouts)
+    }
+    for i, server_script in enumerate(server_scripts):
+        client_id = f"client_{i}_{server_script}"
+        if server_script.startswith(("http://", "https://")):
+            clients[client_id] = MCPClient(url=server_script, name=client_id, **timeouts)
+        else:
+            lazy = {}
+            if lazy_servers:
+                script_key = hashlib.sha1(os.path.abspath(server_script).encode()).hexdigest()[:12]
+                lazy = {
+                    "lazy": True,
+                    "idle_timeout": idle_timeout,
+                    "manifest_path": os.path.join(
+                        manifest_dir, f"{os.path.basename(server_script)}-{script_key}.json"
+                    ),
+                }
+            clients[client_id] = MCPClient(
+                command="uv", args=["run", server_script], name=client_id, **timeouts, **lazy
             )
-            clients[client_id] = client
+    return clients
+
+
+def build_context_budget(
+    gemini_service: Gemini, model_limiter: Optional[ModelCallLimiter] = None
+) -> ContextBudget:
+    summarizer = None
+    if context_summarize:
+        async def summarizer(messages):
+            # Summaries are model calls too, so they wait for the same slots
+            async with model_limiter.slot() if model_limiter else nullcontext():
+                return await gemini_service.summarize(messages)
+
+    return ContextBudget(max_tokens=context_token_budget, summarizer=summarizer)
+
+
+async def main():
+    gemini_service = Gemini(model=gemini_model, api_key=gemini_api_key)
+    sdk_import = None
+
+    clients = build_clients(sys.argv[1:])
+
+    # All servers spawn and handshake at once, so startup takes about as
+    # long as the slowest one
+    failures = await start_clients(clients)
+    for client_id, error in failures.items():
+        print(f"[ERROR] main: Failed to start MCP server '{client_id}': {type(error).__name__}: {error}")
+
+    try:
+        if "doc_client" not in clients:
+            print("\n❌ Fatal error: the document server failed to start")
+            return
 
         chat = CliChat(
-            doc_client=doc_client,
+            doc_client=clients["doc_client"],
             clients=clients,
             gemini_service=gemini_service,
+            context_budget=build_context_budget(gemini_service),
+            query_timeout=query_timeout,
         )
 
         cli = CliApp(chat)
         try:
             await cli.initialize()
+            # The Gemini SDK takes most of a second to import. Nothing
+            # before the first query needs it, so it is imported in a
+            # thread while the user types the first prompt.
+            sdk_import = asyncio.ensure_future(asyncio.to_thread(load_sdk))
             await cli.run()
         except Exception as e:
             print(f"\n❌ Fatal error: {str(e)}")
             import traceback
             traceback.print_exc()
             raise
+    finally:
+        await stop_clients(clients)
+        if sdk_import is not None:
+            await asyncio.gather(sdk_import, return_exceptions=True)
 
 
 if __name__ == "__main__":
@@ -1,40 +1,376 @@
+import os
 import sys
+import time
 import asyncio
+from collections import OrderedDict
 import json
+import anyio
 from pydantic import AnyUrl
-from typing import Optional, Any
+from typing import Optional, Any, Callable, Awaitable
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from core.metrics import metrics
+
+
+# Returned by MCPClient._monitor when an idle server should be shut down
+IDLE = "idle"
+
+
+def _content_size(result: Any) -> int:
+    """Approximate payload size of a tool or resource result in bytes."""
+    size = 0
+    for item in getattr(result, "content", None) or getattr(result, "contents", None) or []:
+        text = getattr(item, "text", None)
+        if text is None:
+            text = getattr(item, "blob", None) or getattr(item, "data", None) or ""
+        size += len(text)
+    return size
+
+
+class ToolTimeoutError(TimeoutError):
+    """A tool call ran past its timeout and was cancelled on the server."""
+
+    def __init__(self, tool_name: str, timeout: float):
+        super().__init__(f"Tool '{tool_name}' did not finish within {timeout:.1f}s")
+        self.tool_name = tool_name
+        self.timeout = timeout
 
 
 class MCPClient:
     def __init__(
         self,
-        command: str,
-        args: list[str],
+        command: Optional[str] = None,
+        args: Optional[list[str]] = None,
         env: Optional[dict] = None,
+        url: Optional[str] = None,
+        name: Optional[str] = None,
+        tools_ttl: Optional[float] = None,
+        max_concurrent_calls: int = 4,
+        call_timeout: Optional[float] = None,
+        tool_timeouts: Optional[dict[str, float]] = None,
+        resource_ttl: Optional[float] = 30.0,
+        subscribed_resource_ttl: Optional[float] = 300.0,
+        resource_cache_bytes: int = 8 * 1024 * 1024,
+        health_check_interval: float = 15.0,
+        health_check_timeout: float = 5.0,
+        restart_backoff: float = 0.5,
+        max_restart_backoff: float = 30.0,
+        restart_wait_timeout: float = 30.0,
+        fail_fast: bool = False,
+        lazy: bool = False,
+        manifest_path: Optional[str] = None,
+        idle_timeout: Optional[float] = None,
     ):
+        if (command is None) == (url is None):
+            raise ValueError("MCPClient needs either a command or a url")
         self._command = command
-        self._args = args
+        self._args = args or []
         self._env = env
+        # Servers reached over HTTP are shared, long-lived processes; urls
+        # ending in /sse use the older SSE transport, others streamable HTTP
+        self._url = url
+        # Label for this server in metrics
+        self.name = name or self._describe()
         self._session: Optional[ClientSession] = None
         self._exit_stack: AsyncExitStack = AsyncExitStack()
+        # Tool catalog, refreshed on tools/list_changed or after tools_ttl seconds
+        self._tools_ttl = tools_ttl
+        self._tools: Optional[list[types.Tool]] = None
+        self._tools_fetched_at: float = 0.0
+        # Bumped whenever the catalog is refetched so callers can rebuild derived data
+        self.tools_version: int = 0
+        # Caps the tool calls in flight on this server at once
+        self._call_semaphore = asyncio.Semaphore(max_concurrent_calls)
+        # Seconds a tool call may take: per tool, else for the whole server
+        self.call_timeout = call_timeout
+        self.tool_timeouts: dict[str, float] = dict(tool_timeouts or {})
+        self._prompts: Optional[list[types.Prompt]] = None
+        # Resource reads by URI, least recently used first: uri -> (value,
+        # size in bytes, fetched at). Unsubscribed URIs expire after
+        # resource_ttl seconds. Subscribed URIs are dropped when the server
+        # reports an update, and after subscribed_resource_ttl seconds in
+        # case a change never is, such as an edit made through another
+        # server process sharing the same documents.
+        self._resource_ttl = resource_ttl
+        self._subscribed_resource_ttl = subscribed_resource_ttl
+        self._resource_cache_bytes = resource_cache_bytes
+        self._resources: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()
+        self._resources_size: int = 0
+        # Bumped on every invalidation so a read racing an update is not cached
+        self._resources_generation: int = 0
+        self._subscribed: set[str] = set()
+        self.server_capabilities: Optional[types.ServerCapabilities] = None
+        # Background task that owns and supervises the connection when
+        # started with start()
+        self._owner_task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._broken_reason: Optional[str] = None
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        # While restarting, calls wait up to restart_wait_timeout or, with
+        # fail_fast, fail straight away
+        self._restart_wait_timeout = restart_wait_timeout
+        self._fail_fast = fail_fast
+        self.restarts: int = 0
+        # Requests in flight, and those cancelled because the connection dropped
+        self._inflight: set[asyncio.Future] = set()
+        self._aborted: set[asyncio.Future] = set()
+        # A lazy client advertises the catalogs saved in its manifest and
+        # only spawns the server on the first request that needs it. With
+        # idle_timeout the server is shut down again after that many
+        # seconds without requests.
+        self.lazy = lazy
+        self._manifest_path = manifest_path
+        self.idle_timeout = idle_timeout
+        self._last_used: float = time.monotonic()
+        self._spawn_lock = asyncio.Lock()
+
+    def _transport(self):
+        if self._url is None:
+            return stdio_client(
+                StdioServerParameters(
+                    command=self._command,
+                    args=self._args,
+                    env=self._env,
+                )
+            )
+        if self._url.rstrip("/").endswith("/sse"):
+            return sse_client(self._url)
+        return streamablehttp_client(self._url)
 
     async def connect(self):
-        server_params = StdioServerParameters(
-            command=self._command,
-            args=self._args,
-            env=self._env,
-        )
-        stdio_transport = await self._exit_stack.enter_async_context(
-            stdio_client(server_params)
-        )
-        _stdio, _write = stdio_transport
+        transport = await self._exit_stack.enter_async_context(self._transport())
+        # streamablehttp_client also yields a session id getter
+        _stdio, _write = transport[0], transport[1]
         self._session = await self._exit_stack.enter_async_context(
-            ClientSession(_stdio, _write)
+            ClientSession(_stdio, _write, message_handler=self._handle_message)
         )
-        await self._session.initialize()
+        init_result = await self._session.initialize()
+        self.server_capabilities = init_result.capabilities
+
+    async def _warm_catalogs(self):
+        """Fetch the tool and prompt catalogs so the first turn finds them cached."""
+        capabilities = self.server_capabilities
+        # A lazy client's catalogs may come from an outdated manifest
+        if capabilities is None or capabilities.tools is not None:
+            await self.list_tools(refresh=self.lazy)
+        if capabilities is None or capabilities.prompts is not None:
+            await self.list_prompts(refresh=self.lazy)
+
+    async def _close_connection(self, broken: bool = False):
+        try:
+            await self.cleanup()
+        except Exception as e:
+            # Transport errors are expected when closing a connection that broke
+            if not broken:
+                print(f"[ERROR] MCPClient: Error closing connection to '{self._describe()}': {type(e).__name__}: {e}")
+
+    async def _own_connection(self, ready: asyncio.Future):
+        """Owns and supervises the connection until stop() is called.
+
+        The transports run an anyio task group, which must be entered and
+        exited by the same task, so this task connects, watches the
+        connection and reconnects it. A connection is restarted when a
+        call hits a broken pipe or a periodic ping fails. Restarts back
+        off exponentially up to max_restart_backoff seconds.
+        """
+        failures = 0
+        while not self._closing.is_set():
+            try:
+                await self.connect()
+                self._connected.set()
+                await self._warm_catalogs()
+            except BaseException as e:
+                self._connected.clear()
+                await self._close_connection()
+                if not ready.done():
+                    # The first connection failing is reported to start()
+                    ready.set_exception(e)
+                    if isinstance(e, Exception):
+                        return
+                if not isinstance(e, Exception):
+                    raise
+                failures += 1
+                delay = min(self.max_restart_backoff, self.restart_backoff * 2 ** (failures - 1))
+                print(f"[ERROR] MCPClient: Restarting '{self._describe()}' failed: {type(e).__name__}: {e}. Retrying in {delay:.1f}s")
+                try:
+                    await asyncio.wait_for(self._closing.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            failures = 0
+            if not ready.done():
+                ready.set_result(None)
+            reason = "connection closed"
+            try:
+                reason = await self._monitor()
+            finally:
+                self._connected.clear()
+                self._abort_inflight()
+                await self._close_connection(broken=reason is not None)
+            if reason is None:
+                break
+            if reason is IDLE:
+                # Keep advertising the catalogs while the server is down
+                self._load_manifest()
+                break
+            self.restarts += 1
+            print(f"[WARNING] MCPClient: Connection to '{self._describe()}' lost ({reason}). Restarting")
+
+    async def _monitor(self) -> Optional[str]:
+        """Waits until stop() is called, the server is idle or the connection breaks.
+
+        Returns None on stop(), IDLE after idle_timeout seconds without
+        requests, otherwise the reason the connection is considered broken.
+        """
+        interval = self.health_check_interval
+        if self.idle_timeout is not None:
+            interval = min(interval, self.idle_timeout)
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._closing.is_set():
+                return None
+            if (
+                self.idle_timeout is not None
+                and not self._inflight
+                and time.monotonic() - self._last_used > self.idle_timeout
+            ):
+                return IDLE
+            if self._broken_reason is not None:
+                reason, self._broken_reason = self._broken_reason, None
+                return reason
+            try:
+                await asyncio.wait_for(self._session.send_ping(), timeout=self.health_check_timeout)
+            except Exception as e:
+                return f"health check failed: {type(e).__name__}: {e}"
+
+    def _mark_broken(self, session: ClientSession, reason: str):
+        """Ask the supervisor to restart the connection session belongs to."""
+        if self._owner_task is None or session is not self._session:
+            return
+        # Calls hold off until the supervisor has reconnected
+        self._connected.clear()
+        if self._broken_reason is None:
+            self._broken_reason = reason
+            self._wake.set()
+
+    def _abort_inflight(self):
+        """Fail calls still waiting on a connection that is being torn down."""
+        for task in self._inflight:
+            self._aborted.add(task)
+            task.cancel()
+
+    @property
+    def running(self) -> bool:
+        return self._owner_task is not None and not self._owner_task.done()
+
+    def _source_mtimes(self) -> dict[str, float]:
+        """Modification times of the files the server is started from, so a
+        manifest is not trusted after the server script changed."""
+        return {
+            arg: os.path.getmtime(arg) for arg in self._args if os.path.isfile(arg)
+        }
+
+    def _save_manifest(self):
+        if self._manifest_path is None:
+            return
+        manifest = {
+            "server": self._describe(),
+            "sources": self._source_mtimes(),
+            "tools": [tool.model_dump(mode="json") for tool in self._tools or []],
+            "prompts": [prompt.model_dump(mode="json") for prompt in self._prompts or []],
+        }
+        try:
+            os.makedirs(os.path.dirname(self._manifest_path) or ".", exist_ok=True)
+            tmp_path = f"{self._manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self._manifest_path)
+        except OSError as e:
+            print(f"[WARNING] MCPClient: Could not save tool manifest '{self._manifest_path}': {e}")
+
+    def _load_manifest(self) -> bool:
+        """Load the saved catalogs. Returns False if there is no usable manifest."""
+        if self._manifest_path is None or not os.path.exists(self._manifest_path):
+            return False
+        try:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("server") != self._describe() or manifest.get("sources") != self._source_mtimes():
+                return False
+            self._tools = [types.Tool.model_validate(tool) for tool in manifest["tools"]]
+            self._prompts = [types.Prompt.model_validate(prompt) for prompt in manifest["prompts"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARNING] MCPClient: Ignoring unreadable tool manifest '{self._manifest_path}': {e}")
+            return False
+        self._tools_fetched_at = time.monotonic()
+        self.tools_version += 1
+        return True
+
+    async def _spawn(self):
+        """Start a lazy client's server unless it is already running."""
+        async with self._spawn_lock:
+            if not self.running:
+                await self._start_owner()
+
+    async def start(self):
+        """Connect and fetch catalogs in a background task that keeps the
+        connection open, and healthy, until stop() is called.
+
+        A lazy client with a usable manifest only loads the manifest; the
+        server starts on the first request.
+        """
+        if self.lazy and self._load_manifest():
+            return
+        await self._start_owner()
+
+    async def _start_owner(self):
+        ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._connected = asyncio.Event()
+        self._owner_task = asyncio.create_task(self._own_connection(ready))
+        await ready
+
+    async def stop(self):
+        """Close a connection opened with start()."""
+        if self._owner_task is None:
+            return
+        self._closing.set()
+        self._wake.set()
+        try:
+            await self._owner_task
+        finally:
+            self._owner_task = None
+
+    def _describe(self) -> str:
+        if self._url is not None:
+            return self._url
+        return " ".join([self._command, *self._args])
+
+    async def _handle_message(self, message) -> None:
+        """Handle server notifications that invalidate cached state."""
+        if isinstance(message, types.ServerNotification):
+            if isinstance(message.root, types.ToolListChangedNotification):
+                self.invalidate_tools()
+            elif isinstance(message.root, types.PromptListChangedNotification):
+                self._prompts = None
+            elif isinstance(message.root, types.ResourceUpdatedNotification):
+                self.invalidate_resource(str(message.root.params.uri))
+            elif isinstance(message.root, types.ResourceListChangedNotification):
+                self.invalidate_resource()
 
     def session(self) -> ClientSession:
         if self._session is None:
@@ -43,35 +379,263 @@ class MCPClient:
             )
         return self._session
 
-    async def list_tools(self) -> list[types.Tool]:
-        result = await self.session().list_tools()
-        return result.tools
+    async def _ready_session(self) -> ClientSession:
+        """Return the session, waiting for a restart in progress to finish.
+
+        With fail_fast the call fails immediately instead of waiting. A
+        lazy client's server is started here if it is not running.
+        """
+        self._last_used = time.monotonic()
+        if self.lazy and not self.running:
+            await self._spawn()
+        if self._owner_task is not None and not self._connected.is_set():
+            if self._fail_fast:
+                raise ConnectionError(f"MCP server '{self._describe()}' is restarting")
+            try:
+                await asyncio.wait_for(self._connected.wait(), timeout=self._restart_wait_timeout)
+            except asyncio.TimeoutError:
+                raise ConnectionError(
+                    f"MCP server '{self._describe()}' did not come back within {self._restart_wait_timeout}s"
+                )
+        return self.session()
+
+    async def _request(
+        self,
+        operation: str,
+        method: Callable[[ClientSession], Awaitable[Any]],
+        bytes_out: int = 0,
+        result_size: Optional[Callable[[Any], int]] = None,
+    ) -> Any:
+        """Run a request on the session, restarting the connection if it broke.
+
+        A request that could not be written to a broken transport never
+        reached the server, so unless fail_fast is set it is queued until
+        the connection is back and sent once more. Latency and payload
+        sizes are recorded under operation.
+        """
+        with metrics.span("mcp", self.name, operation) as span:
+            span.bytes_out = bytes_out
+            result = await self._send_with_retry(method)
+            if result_size is not None:
+                span.bytes_in = result_size(result)
+            # Tool failures come back as results flagged isError
+            span.error = bool(getattr(result, "isError", False))
+            return result
+
+    async def _send_with_retry(self, method: Callable[[ClientSession], Awaitable[Any]]) -> Any:
+        retried = False
+        while True:
+            session = await self._ready_session()
+            task = asyncio.ensure_future(method(session))
+            self._inflight.add(task)
+            try:
+                return await task
+            except asyncio.CancelledError:
+                if task in self._aborted:
+                    raise ConnectionError(
+                        f"Connection to MCP server '{self._describe()}' was lost during the request"
+                    )
+                raise
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError, BrokenPipeError) as e:
+                self._mark_broken(session, f"{type(e).__name__} during a request")
+                if self._owner_task is None or self._fail_fast or retried:
+                    raise ConnectionError(
+                        f"Connection to MCP server '{self._describe()}' is broken: {type(e).__name__}"
+                    ) from e
+                retried = True
+            finally:
+                self._inflight.discard(task)
+                self._aborted.discard(task)
+                self._last_used = time.monotonic()
+
+    def invalidate_tools(self):
+        """Drop the cached tool catalog so the next list_tools refetches it."""
+        self._tools = None
+
+    async def list_tools(self, refresh: bool = False) -> list[types.Tool]:
+        expired = (
+            self._tools_ttl is not None
+            and time.monotonic() - self._tools_fetched_at > self._tools_ttl
+        )
+        if self.lazy and not self.running and self._tools is not None and not refresh:
+            # Advertised from the manifest without spawning the server
+            return self._tools
+        if self._tools is None or refresh or expired:
+            result = await self._request("tools/list", lambda session: session.list_tools())
+            self._tools = result.tools
+            self._tools_fetched_at = time.monotonic()
+            self.tools_version += 1
+            self._save_manifest()
+        return self._tools
+
+    def tool_timeout(self, tool_name: str) -> Optional[float]:
+        return self.tool_timeouts.get(tool_name, self.call_timeout)
+
+    async def _cancel_request(self, session: ClientSession, request_id: int, reason: str):
+        """Tell the server to stop working on a request we no longer wait for."""
+        notification = types.ClientNotification(
+            types.CancelledNotification(
+                method="notifications/cancelled",
+                params=types.CancelledNotificationParams(requestId=request_id, reason=reason),
+            )
+        )
+        try:
+            await asyncio.wait_for(session.send_notification(notification), timeout=1.0)
+        except Exception:
+            # The connection is gone, so is the request
+            pass
 
     async def call_tool(
-        self, tool_name: str, tool_input: dict
+        self, tool_name: str, tool_input: dict, timeout: Optional[float] = None
     ) -> types.CallToolResult | None:
-        return await self.session().call_tool(tool_name, tool_input)
+        """Call a tool, giving up after the tighter of timeout and the
+        configured timeout for the tool.
 
-    async def list_prompts(self) -> list[types.Prompt]:
+        On timeout, or if the caller is cancelled, the server is sent a
+        cancellation notification. Timeouts raise ToolTimeoutError.
+        """
+        limits = [t for t in (timeout, self.tool_timeout(tool_name)) if t is not None]
+        limit = min(limits) if limits else None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + limit if limit is not None else None
 
-        result = await self.session().list_prompts()
-        return result.prompts
+        async def call(session: ClientSession) -> types.CallToolResult:
+            # send_request takes the next id before its first await
+            request_id = session._request_id
+            try:
+                with anyio.fail_after(None if deadline is None else max(0.0, deadline - loop.time())):
+                    return await session.call_tool(tool_name, tool_input)
+            except TimeoutError:
+                await self._cancel_request(session, request_id, "Timed out")
+                raise ToolTimeoutError(tool_name, limit)
+            except asyncio.CancelledError:
+                await self._cancel_request(session, request_id, "Cancelled by the client")
+                raise
+
+        try:
+            with anyio.fail_after(limit):
+                await self._call_semaphore.acquire()
+        except TimeoutError:
+            raise ToolTimeoutError(tool_name, limit)
+        try:
+            return await self._request(
+                f"tools/call:{tool_name}",
+                call,
+                bytes_out=len(json.dumps(tool_input, default=str)),
+                result_size=_content_size,
+            )
+        finally:
+            self._call_semaphore.release()
+
+    async def list_prompts(self, refresh: bool = False) -> list[types.Prompt]:
+        if self._prompts is None or refresh:
+            result = await self._request("prompts/list", lambda session: session.list_prompts())
+            self._prompts = result.prompts
+            self._save_manifest()
+        return self._prompts
 
     async def get_prompt(self, prompt_name, args: dict[str, str]):
-        result = await self.session().get_prompt(prompt_name, args)
+        result = await self._request(
+            "prompts/get", lambda session: session.get_prompt(prompt_name, args)
+        )
         return result.messages
 
-    async def read_resource(self, uri: str) -> Any:
-        result = await self.session().read_resource(AnyUrl(uri))
+    def invalidate_resource(self, uri: Optional[str] = None):
+        """Drop one cached resource, or all of them when uri is None."""
+        self._resources_generation += 1
+        if uri is None:
+            self._resources.clear()
+            self._resources_size = 0
+        elif uri in self._resources:
+            self._resources_size -= self._resources.pop(uri)[1]
+
+    def _can_subscribe(self) -> bool:
+        capabilities = self.server_capabilities
+        return bool(
+            capabilities is not None
+            and capabilities.resources is not None
+            and capabilities.resources.subscribe
+        )
+
+    async def _subscribe(self, uri: str):
+        if uri in self._subscribed or not self._can_subscribe():
+            return
+        try:
+            await self._request(
+                "resources/subscribe",
+                lambda session: session.subscribe_resource(AnyUrl(uri)),
+            )
+            self._subscribed.add(uri)
+        except Exception as e:
+            print(f"[WARNING] MCPClient: Could not subscribe to '{uri}': {type(e).__name__}: {e}")
+
+    def _cached_resource(self, uri: str) -> tuple[bool, Any]:
+        entry = self._resources.get(uri)
+        if entry is None:
+            return False, None
+        value, _size, fetched_at = entry
+        ttl = self._subscribed_resource_ttl if uri in self._subscribed else self._resource_ttl
+        if ttl is not None and time.monotonic() - fetched_at > ttl:
+            self.invalidate_resource(uri)
+            return False, None
+        self._resources.move_to_end(uri)
+        return True, value
+
+    def _cache_resource(self, uri: str, value: Any, size: int):
+        if size > self._resource_cache_bytes:
+            return
+        if uri in self._resources:
+            self._resources_size -= self._resources.pop(uri)[1]
+        self._resources[uri] = (value, size, time.monotonic())
+        self._resources_size += size
+        while self._resources_size > self._resource_cache_bytes:
+            _uri, (_value, evicted, _at) = self._resources.popitem(last=False)
+            self._resources_size -= evicted
+
+    async def read_resource(self, uri: str, refresh: bool = False) -> Any:
+        """Read a resource, served from cache while it is unchanged.
+
+        Cached values are shared between callers and must not be mutated.
+        """
+        if not refresh:
+            hit, value = self._cached_resource(uri)
+            if hit:
+                metrics.record("mcp", self.name, "resources/read:cached", 0.0)
+                return value
+
+        # Subscribe first so an update that lands during the read is not missed
+        await self._subscribe(uri)
+        generation = self._resources_generation
+        result = await self._request(
+            "resources/read",
+            lambda session: session.read_resource(AnyUrl(uri)),
+            result_size=_content_size,
+        )
         resource = result.contents[0]
         if isinstance(resource, types.TextResourceContents):
+            size = len(resource.text.encode("utf-8"))
             if resource.mimeType == "application/json":
-                return json.loads(resource.text)
-        return resource.text
+                value = json.loads(resource.text)
+            else:
+                value = resource.text
+        else:
+            size = len(resource.blob)
+            value = resource.blob
+        if generation == self._resources_generation:
+            self._cache_resource(uri, value, size)
+        return value
 
     async def cleanup(self):
-        await self._exit_stack.aclose()
-        self._session = None
+        try:
+            await self._exit_stack.aclose()
+        finally:
+            self._exit_stack = AsyncExitStack()
+            self._session = None
+        self._tools = None
+        self._prompts = None
+        # Subscriptions end with the session
+        self._subscribed.clear()
+        self.invalidate_resource()
 
     async def __aenter__(self):
         await self.connect()
@@ -81,6 +645,31 @@ class MCPClient:
         await self.cleanup()
 
 
+async def start_clients(clients: dict[str, MCPClient]) -> dict[str, BaseException]:
+    """Start every client concurrently.
+
+    Clients that fail to start are removed from clients and returned with
+    their error, so one broken server does not hold up or abort the rest.
+    """
+    names = list(clients)
+    results = await asyncio.gather(
+        *(clients[name].start() for name in names), return_exceptions=True
+    )
+    failures = {}
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            failures[name] = result
+            del clients[name]
+    return failures
+
+
+async def stop_clients(clients: dict[str, MCPClient]):
+    """Stop every client concurrently."""
+    await asyncio.gather(
+        *(client.stop() for client in clients.values()), return_exceptions=True
+    )
+
+
 # For testing
 async def main():
     async with MCPClient(
@@ -1,11 +1,107 @@
+import os
+import sys
+import atexit
+import importlib.metadata
+import argparse
+from functools import partial
+from typing import Optional
+from weakref import WeakSet
 from mcp.server.fastmcp import FastMCP
-from pydantic import Field
+from mcp.server.lowlevel import NotificationOptions
+from mcp.shared.session import RequestResponder
+from pydantic import AnyUrl, BaseModel, Field
 from mcp.server.fastmcp.prompts import base
 
+from doc_store import open_store
+from doc_index import scan_snippets, tokenize
+
 mcp = FastMCP("DocumentMCP", log_level="ERROR")
 
+# Sessions subscribed to each resource URI. One server process can serve
+# many clients over HTTP, so an edit is announced to every subscriber.
+subscriptions: dict[str, WeakSet] = {}
+
+
+@mcp._mcp_server.subscribe_resource()
+async def subscribe_resource(uri: AnyUrl):
+    session = mcp._mcp_server.request_context.session
+    subscriptions.setdefault(str(uri), WeakSet()).add(session)
+
+
+@mcp._mcp_server.unsubscribe_resource()
+async def unsubscribe_resource(uri: AnyUrl):
+    session = mcp._mcp_server.request_context.session
+    subscriptions.get(str(uri), WeakSet()).discard(session)
+
+
+async def notify_document_changed(doc_id: str):
+    """Announce an edit to subscribers of the document and of its chunks
+    and metadata."""
+    prefix = f"docs://documents/{doc_id}"
+    for uri in [uri for uri in subscriptions if uri == prefix or uri.startswith(prefix + "/")]:
+        await notify_resource_updated(uri)
+
+
+async def notify_resource_updated(uri: str):
+    for session in list(subscriptions.get(uri, ())):
+        try:
+            await session.send_resource_updated(AnyUrl(uri))
+        except Exception:
+            # The client has gone away
+            subscriptions[uri].discard(session)
+
+
+# The two patches below replace private parts of the mcp SDK and were
+# written against 1.8, which pyproject pins. On any other version they are
+# skipped rather than risk breaking, or double-handling, what they patch;
+# check them against the new SDK before widening the pin.
+PATCHED_MCP_VERSION = (1, 8)
+mcp_version = tuple(int(part) for part in importlib.metadata.version("mcp").split(".")[:2])
+
+
+_responder_exit = RequestResponder.__exit__
+
+
+def _responder_exit_suppressing_cancel(self, exc_type, exc_val, exc_tb):
+    """Let a request cancelled by the client end quietly.
+
+    mcp 1.8 drops the cancel scope's result here, so the CancelledError of
+    a request cancelled with notifications/cancelled escapes and shuts
+    the whole server down.
+    """
+    scope = self._cancel_scope
+    _responder_exit(self, exc_type, exc_val, exc_tb)
+    return scope.cancelled_caught
+
+
+_create_initialization_options = mcp._mcp_server.create_initialization_options
+
+
+def create_initialization_options(notification_options=None, experimental_capabilities=None):
+    """Advertise resource subscriptions, which FastMCP does not do on its own."""
+    options = _create_initialization_options(
+        notification_options or NotificationOptions(resources_changed=True),
+        experimental_capabilities,
+    )
+    options.capabilities.resources.subscribe = True
+    return options
+
+
+if mcp_version == PATCHED_MCP_VERSION:
+    RequestResponder.__exit__ = _responder_exit_suppressing_cancel
+    mcp._mcp_server.create_initialization_options = create_initialization_options
+else:
+    print(
+        f"[WARNING] mcp_server: mcp {'.'.join(map(str, mcp_version))} is not the tested "
+        f"{'.'.join(map(str, PATCHED_MCP_VERSION))}; cancelled requests may stop the server "
+        "and resource subscriptions are not advertised",
+        file=sys.stderr,
+    )
+
 
-docs = {
+# Written to a new store on first start. Documents live in a SQLite file
+# next to this script unless DOC_STORE_PATH or DOC_STORE_BACKEND say otherwise.
+default_docs = {
     "deposition.md": "This deposition covers the testimony of Angela Smith, P.E.",
     "report.pdf": "The report details the state of a 20m condenser tower.",
     "financials.docx": "These financials outline the project's budget and expenditures.",
@@ -14,41 +110,165 @@ docs = {
     "spec.txt": "These specifications define the technical requirements for the equipment.",
 }
 
+store = open_store()
+store.seed(default_docs)
+# Writes out edits the store is still holding back in its journal
+atexit.register(store.close)
+
+# Characters per page of the docs://documents/{doc_id}/chunks/{n} resource
+chunk_chars = int(os.getenv("DOC_CHUNK_CHARS", "16384"))
+
+
+def document_metadata(doc_id: str) -> dict:
+    info = store.metadata(doc_id)
+    return {
+        "doc_id": doc_id,
+        **info,
+        "chunk_chars": chunk_chars,
+        "chunks": max(1, -(-info["chars"] // chunk_chars)),
+    }
+
+
 @mcp.tool (
     name="read_doc_contents",
-    description="Read the contents of a document and return as a string",
+    description=(
+        "Read the contents of a document and return as a string. For large documents, "
+        "read only part of it: a character range with offset and length, or a line range "
+        "with start_line and line_count. get_doc_metadata gives a document's size."
+    ),
 )
 def read_document(
-    doc_id: str = Field(description="The ID of the document to read")
+    doc_id: str = Field(description="The ID of the document to read"),
+    offset: Optional[int] = Field(default=None, description="First character to read, counting from 0"),
+    length: Optional[int] = Field(default=None, description="Number of characters to read"),
+    start_line: Optional[int] = Field(default=None, description="First line to read, counting from 1"),
+    line_count: Optional[int] = Field(default=None, description="Number of lines to read"),
 ):
-    if doc_id not in docs:
-        raise ValueError(f"Document {doc_id} not found")
-    return docs[doc_id]
+    by_chars = offset is not None or length is not None
+    by_lines = start_line is not None or line_count is not None
+    if by_chars and by_lines:
+        raise ValueError("Give either offset/length or start_line/line_count, not both")
+    if by_chars:
+        if (offset or 0) < 0 or (length is not None and length < 0):
+            raise ValueError("offset and length must not be negative")
+        return store.read_range(doc_id, offset or 0, length)
+    if by_lines:
+        if (start_line or 1) < 1 or (line_count is not None and line_count < 0):
+            raise ValueError("start_line counts from 1 and line_count must not be negative")
+        return store.read_lines(doc_id, start_line or 1, line_count)
+    return store.get(doc_id)
+
+
+@mcp.tool(
+    name="get_doc_metadata",
+    description="Get a document's size in characters, bytes and lines, and its number of chunks",
+)
+def get_doc_metadata(
+    doc_id: str = Field(description="The ID of the document")
+) -> dict:
+    return document_metadata(doc_id)
     
 @mcp.tool (
     name="edit_doument", 
-    description="Edit a documnet by replacing a string in the documents content with a new string")
-def edit_document(
+    description=(
+        "Edit a documnet by replacing a string in the documents content with a new string. "
+        "Every occurrence is replaced, or only the one at offset when given, such as an offset "
+        "from search_documents. Returns the number of replacements, the text around the first "
+        "few before and after the edit, and the document's new size."
+    ),
+)
+async def edit_document(
     doc_id: str = Field(description="The ID of the document to edit"),
     old_string: str = Field(description="The string to replace"),
+    new_string: str = Field(description="The new string to replace the old string with"),
+    offset: Optional[int] = Field(
+        default=None, description="Replace only the occurrence starting at this character offset"
+    ),
+) -> dict:
+    edit = store.replace(doc_id, old_string, new_string, offset)
+    if edit.replacements:
+        await notify_document_changed(doc_id)
+    return {"doc_id": doc_id, **edit.summary(), **store.metadata(doc_id)}
+
+
+class Replacement(BaseModel):
+    old_string: str = Field(description="The string to replace")
     new_string: str = Field(description="The new string to replace the old string with")
-):
-    if doc_id not in docs:
-        raise ValueError(f"Document {doc_id} not found")
-    docs[doc_id] = docs[doc_id].replace(old_string, new_string)
-    return docs[doc_id]
+    offset: Optional[int] = Field(
+        default=None,
+        description="Replace only the occurrence starting at this character offset, in the document as it was before the batch",
+    )
+
+
+@mcp.tool(
+    name="batch_edit_document",
+    description=(
+        "Make many replacements in a document with one call, all or none. Each old_string is "
+        "replaced everywhere, or only at its offset when given, and every offset refers to the "
+        "document before the batch. If any old_string is not found, is given twice without an "
+        "offset, or two replacements overlap, nothing is changed and every problem is reported. "
+        "Prefer this over calling edit_doument once per change."
+    ),
+)
+async def batch_edit_document(
+    doc_id: str = Field(description="The ID of the document to edit"),
+    edits: list[Replacement] = Field(description="The replacements to make"),
+) -> dict:
+    edit = store.replace_many(doc_id, [(e.old_string, e.new_string, e.offset) for e in edits])
+    if edit.replacements:
+        await notify_document_changed(doc_id)
+    return {
+        "doc_id": doc_id,
+        "replacements_per_edit": edit.counts,
+        **edit.summary(),
+        **store.metadata(doc_id),
+    }
+
+@mcp.tool(
+    name="search_documents",
+    description=(
+        "Search all documents for words and return the best matching document ids, "
+        "ranked by relevance, with the character offsets and surrounding text of matches. "
+        "Use this to find relevant documents instead of reading every document."
+    ),
+)
+def search_documents(
+    query: str = Field(description="Words to search for"),
+    limit: int = Field(default=10, description="Maximum number of documents to return"),
+) -> dict:
+    terms = tokenize(query)
+    results = []
+    for doc_id, score in store.search(query, max(1, min(limit, 50))):
+        results.append({
+            "doc_id": doc_id,
+            "score": round(score, 4),
+            "snippets": scan_snippets(partial(store.read_range, doc_id), terms),
+        })
+    return {"query": query, "results": results}
 
 
 @mcp.resource("docs://documents", mime_type="application/json")
 def list_docs() -> list[str]:
-    return list(docs.keys())
+    return store.list_ids()
 
 # TODO: Write a resource to return the contents of a particular doc
 @mcp.resource("docs://documents/{doc_id}", mime_type="text/plain")
 def get_doc(doc_id: str) -> str:
-    if doc_id not in docs:
-        raise ValueError(f"Document {doc_id} not found")
-    return docs[doc_id]
+    return store.get(doc_id)
+
+
+@mcp.resource("docs://documents/{doc_id}/metadata", mime_type="application/json")
+def get_doc_metadata_resource(doc_id: str) -> dict:
+    return document_metadata(doc_id)
+
+
+@mcp.resource("docs://documents/{doc_id}/chunks/{n}", mime_type="text/plain")
+def get_doc_chunk(doc_id: str, n: int) -> str:
+    """Chunk n, counting from 0, of chunk_chars characters each."""
+    chunks = document_metadata(doc_id)["chunks"]
+    if not 0 <= n < chunks:
+        raise ValueError(f"Document {doc_id} has chunks 0 to {chunks - 1}, not {n}")
+    return store.read_range(doc_id, n * chunk_chars, chunk_chars)
 
 @mcp.prompt(
     name="rewrite_doc_in_markdown",
@@ -66,7 +286,9 @@ The id of the document you need to reformat is:
 </document_id>
 
 Add in headers, bullet points, tables, etc as necessary. Feel free to add in structure.
-Use the 'edit_document' tool to edit the document. After the document has been reformatted...
+Read the document, then make all of your changes with a single call to the 'batch_edit_document'
+tool, listing every replacement in its edits. If it reports a problem, nothing was changed: fix the
+listed edits and call it again. After the document has been reformatted...
 """
     
     return [
@@ -76,4 +298,18 @@ Use the 'edit_document' tool to edit the document. After the document has been r
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    # stdio serves a single chat process. With sse or streamable-http one
+    # long-lived server can be shared by many chat sessions.
+    parser = argparse.ArgumentParser(description="Document MCP server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse", "streamable-http"],
+        default=os.getenv("MCP_TRANSPORT", "stdio"),
+    )
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", "8000")))
+    cli_args = parser.parse_args()
+
+    mcp.settings.host = cli_args.host
+    mcp.settings.port = cli_args.port
+    mcp.run(transport=cli_args.transport)
@@ -0,0 +1,207 @@
+import re
+from typing import Collection, Iterator
+
+# A piece is (source string, start, end). The first piece points into the
+# text the table was created with, and each insert adds its own string, so
+# no text is ever copied or moved by an edit.
+Piece = tuple[str, int, int]
+
+# Pieces per block. Blocks keep lookups and splices to a few hundred pieces
+# however fragmented the table gets.
+BLOCK_PIECES = 256
+
+# Characters find_any reads into one string at a time
+SEARCH_WINDOW = 1 << 20
+
+# Characters line_offset counts newlines in at a time
+LINE_SCAN_CHUNK = 1 << 16
+
+
+class PieceTable:
+    """Mutable text that edits in time proportional to the edit, not to
+    the length of the text."""
+
+    def __init__(self, text: str = ""):
+        self._blocks: list[list[Piece]] = [[(text, 0, len(text))] if text else []]
+        self._block_lengths: list[int] = [len(text)]
+        self._length = len(text)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def piece_count(self) -> int:
+        return sum(len(block) for block in self._blocks)
+
+    def text(self) -> str:
+        return "".join(source[start:end] for block in self._blocks for source, start, end in block)
+
+    def _locate(self, offset: int) -> tuple[int, int]:
+        """Index of the block holding offset, and the offset the block starts at."""
+        position = 0
+        for i, length in enumerate(self._block_lengths):
+            if offset < position + length or i == len(self._blocks) - 1:
+                return i, position
+            position += length
+        return 0, 0
+
+    def _pieces_from(self, offset: int) -> Iterator[tuple[int, Piece]]:
+        """(text offset, piece) for the pieces from the one holding offset on."""
+        first, position = self._locate(offset)
+        for block in self._blocks[first:]:
+            for piece in block:
+                length = piece[2] - piece[1]
+                if position + length > offset:
+                    yield position, piece
+                position += length
+
+    def slice(self, start: int, end: int) -> str:
+        start = max(0, start)
+        end = min(end, self._length)
+        if start >= end:
+            return ""
+        parts = []
+        for position, (source, piece_start, piece_end) in self._pieces_from(start):
+            if position >= end:
+                break
+            parts.append(source[piece_start + max(0, start - position):piece_start + min(piece_end - piece_start, end - position)])
+        return "".join(parts)
+
+    def replace(self, offset: int, length: int, text: str):
+        """Replace length characters at offset with text."""
+        if offset < 0 or length < 0 or offset + length > self._length:
+            raise IndexError(f"Range {offset}:{offset + length} is outside a text of {self._length} characters")
+        end = offset + length
+        first, block_start = self._locate(offset)
+        last = first
+        position = block_start + self._block_lengths[first]
+        while position < end and last + 1 < len(self._blocks):
+            last += 1
+            position += self._block_lengths[last]
+
+        local_start = offset - block_start
+        local_end = end - block_start
+        before: list[Piece] = []
+        after: list[Piece] = []
+        piece_position = 0
+        for block in self._blocks[first:last + 1]:
+            for source, start, stop in block:
+                piece_end = piece_position + stop - start
+                if piece_position < local_start:
+                    before.append((source, start, start + min(stop - start, local_start - piece_position)))
+                if piece_end > local_end:
+                    after.append((source, start + max(0, local_end - piece_position), stop))
+                piece_position = piece_end
+        pieces = before + ([(text, 0, len(text))] if text else []) + after
+
+        blocks = [pieces[i:i + BLOCK_PIECES] for i in range(0, len(pieces), BLOCK_PIECES)]
+        if not blocks and len(self._blocks) == last - first + 1:
+            # An empty text still has one, empty, block
+            blocks = [[]]
+        self._blocks[first:last + 1] = blocks
+        self._block_lengths[first:last + 1] = [
+            sum(stop - start for _, start, stop in block) for block in blocks
+        ]
+        self._length += len(text) - length
+
+    def insert(self, offset: int, text: str):
+        self.replace(offset, 0, text)
+
+    def delete(self, offset: int, length: int):
+        self.replace(offset, length, "")
+
+    def find(self, sub: str, start: int = 0) -> int:
+        """Offset of the first occurrence of sub at or after start, or -1.
+        Pieces are searched in place, so nothing is copied but the few
+        characters around each piece boundary."""
+        if not sub:
+            raise ValueError("Cannot search for an empty string")
+        overlap = len(sub) - 1
+        # Last characters before the current piece, for matches across a boundary
+        carry = ""
+        carry_start = start
+        for position, (source, piece_start, piece_end) in self._pieces_from(start):
+            skip = max(0, start - position)
+            begin = piece_start + skip
+            if overlap:
+                junction = carry + source[begin:min(piece_end, begin + overlap)]
+                index = junction.find(sub)
+                if 0 <= index < len(carry):
+                    return carry_start + index
+            index = source.find(sub, begin, piece_end)
+            if index >= 0:
+                return position + index - piece_start
+            if overlap:
+                carry = (carry + source[max(begin, piece_end - overlap):piece_end])[-overlap:]
+                carry_start = position + piece_end - piece_start - len(carry)
+        return -1
+
+    def line_offset(self, lines: int, start: int = 0) -> int:
+        """Offset of the line that is `lines` lines after the one at start,
+        or len(self) if there are not that many. Newlines are counted in
+        place, a chunk at a time, so nothing is copied."""
+        if lines <= 0:
+            return start
+        for position, (source, piece_start, piece_end) in self._pieces_from(start):
+            begin = piece_start + max(0, start - position)
+            while begin < piece_end:
+                chunk_end = min(piece_end, begin + LINE_SCAN_CHUNK)
+                count = source.count("\n", begin, chunk_end)
+                if count >= lines:
+                    index = begin - 1
+                    for _ in range(lines):
+                        index = source.find("\n", index + 1, chunk_end)
+                    return position + index + 1 - piece_start
+                lines -= count
+                begin = chunk_end
+        return self._length
+
+    def find_all(self, sub: str) -> Iterator[int]:
+        """Offsets of the non-overlapping occurrences of sub, left to right,
+        as str.replace would replace them. One pass over the pieces."""
+        if not sub:
+            raise ValueError("Cannot search for an empty string")
+        overlap = len(sub) - 1
+        carry = ""
+        carry_start = 0
+        # Where the next match may start, so matches do not overlap
+        next_start = 0
+        for position, (source, piece_start, piece_end) in self._pieces_from(0):
+            if carry:
+                junction = carry + source[piece_start:min(piece_end, piece_start + overlap)]
+                index = junction.find(sub, max(0, next_start - carry_start))
+                if 0 <= index < len(carry):
+                    yield carry_start + index
+                    next_start = carry_start + index + len(sub)
+            begin = piece_start + max(0, next_start - position)
+            index = source.find(sub, begin, piece_end)
+            while index >= 0:
+                yield position + index - piece_start
+                next_start = position + index - piece_start + len(sub)
+                index = source.find(sub, index + len(sub), piece_end)
+            if overlap:
+                carry = (carry + source[max(piece_start, piece_end - overlap):piece_end])[-overlap:]
+                carry_start = position + piece_end - piece_start - len(carry)
+
+    def find_any(self, subs: Collection[str]) -> Iterator[tuple[int, str]]:
+        """(offset, sub) for the non-overlapping occurrences of any of subs,
+        left to right, taking the longest sub that matches at an offset.
+        All of subs are matched in one pass by a single regex alternation,
+        over windows of the text so it is never copied whole."""
+        if not subs or not all(subs):
+            raise ValueError("Cannot search for an empty string")
+        # Longest first, as the alternation takes the first that matches
+        pattern = re.compile("|".join(map(re.escape, sorted(set(subs), key=len, reverse=True))))
+        longest = max(map(len, subs))
+        position = 0
+        while position < self._length:
+            # Read past the window so a match starting in it is read whole
+            text = self.slice(position, position + SEARCH_WINDOW + longest - 1)
+            last = position + len(text) >= self._length
+            next_position = position + SEARCH_WINDOW
+            for match in pattern.finditer(text):
+                if match.start() >= SEARCH_WINDOW and not last:
+                    break
+                yield position + match.start(), match.group()
+                next_position = max(next_position, position + match.end())
+            position = next_position
@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+from typing import Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from main import (
+    gemini_model,
+    gemini_api_key,
+    query_timeout,
+    build_clients,
+    build_context_budget,
+)
+from mcp_client import MCPClient, start_clients, stop_clients
+from core.gemini import Gemini
+from core.cli_chat import CliChat
+from core.limiter import ModelCallLimiter, ModelOverloadedError
+from core.metrics import metrics
+
+# Service config
+service_host = os.getenv("SERVICE_HOST", "127.0.0.1")
+service_port = int(os.getenv("SERVICE_PORT", "8080"))
+max_sessions = int(os.getenv("SERVICE_MAX_SESSIONS", "100"))
+# Sessions unused for this many seconds are closed; 0 keeps them forever
+session_ttl = float(os.getenv("SERVICE_SESSION_TTL", "3600")) or None
+
+# Model calls shared by all sessions
+model_max_concurrent = int(os.getenv("MODEL_MAX_CONCURRENT", "4"))
+model_max_waiting = int(os.getenv("MODEL_MAX_WAITING", "16"))
+model_quota_cooldown = float(os.getenv("MODEL_QUOTA_COOLDOWN", "10"))
+
+
+class Session:
+    """One conversation: its own history, run one query at a time."""
+
+    def __init__(self, chat: CliChat):
+        self.chat = chat
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class ChatService:
+    """Hosts many conversations in one process over a shared set of MCP
+    clients, Gemini service and model call limiter."""
+
+    def __init__(
+        self,
+        clients: dict[str, MCPClient],
+        gemini_service: Gemini,
+        model_limiter: ModelCallLimiter,
+        max_sessions: int = 100,
+        session_ttl: Optional[float] = None,
+    ):
+        self.clients = clients
+        self.gemini_service = gemini_service
+        self.model_limiter = model_limiter
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.sessions: dict[str, Session] = {}
+
+    def _expire_sessions(self):
+        if self.session_ttl is None:
+            return
+        cutoff = time.monotonic() - self.session_ttl
+        for session_id, session in list(self.sessions.items()):
+            if session.last_used < cutoff and not session.lock.locked():
+                self.close_session(session_id)
+
+    def create_session(self) -> Optional[str]:
+        """Start a conversation; None if the service is at max_sessions."""
+        self._expire_sessions()
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        chat = CliChat(
+            doc_client=self.clients["doc_client"],
+            clients=self.clients,
+            gemini_service=self.gemini_service,
+            context_budget=build_context_budget(self.gemini_service, self.model_limiter),
+            query_timeout=query_timeout,
+            model_limiter=self.model_limiter,
+        )
+        self.sessions[chat.session_id] = Session(chat)
+        return chat.session_id
+
+    def close_session(self, session_id: str) -> bool:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.gemini_service.close_session(session.chat.session_id)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "busy_sessions": sum(session.lock.locked() for session in self.sessions.values()),
+            "max_sessions": self.max_sessions,
+            "model": self.model_limiter.stats(),
+            "clients": {client_id: client.running for client_id, client in self.clients.items()},
+        }
+
+
+def _error(status: int, message: str, **headers) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status, headers=headers or None)
+
+
+def _overloaded(retry_after: float) -> JSONResponse:
+    return _error(
+        429,
+        "Model capacity is saturated, retry later",
+        **{"Retry-After": str(max(1, round(retry_after)))},
+    )
+
+
+async def create_session(request: Request) -> JSONResponse:
+    service: ChatService = request.app.state.service
+    session_id = service.create_session()
+    if session_id is None:
+        return _error(503, f"Session limit of {service.max_sessions} reached")
+    return JSONResponse({"session_id": session_id}, status_code=201)
+
+
+async def delete_session(request: Request) -> JSONResponse:
+    service: ChatService = request.app.state.service
+    if not service.close_session(request.path_params["session_id"]):
+        return _error(404, "Unknown session")
+    return JSONResponse({"closed": True})
+
+
+async def post_message(request: Request):
+    """Run a query in a session. The body is {"query": "..."}; with
+    ?stream=1 the answer is streamed as plain text while it is generated."""
+    service: ChatService = request.app.state.service
+    session = service.sessions.get(request.path_params["session_id"])
+    if session is None:
+        return _error(404, "Unknown session")
+    try:
+        body = await request.json()
+    except ValueError:
+        return _error(400, "Body must be JSON")
+    query = body.get("query") if isinstance(body, dict) else None
+    if not isinstance(query, str) or not query.strip():
+        return _error(400, "Body must have a non-empty 'query' string")
+    if session.lock.locked():
+        return _error(409, "The session is already running a query")
+    # Turn work away before it starts rather than after reading documents
+    if service.model_limiter.saturated():
+        service.model_limiter.rejected += 1
+        return _overloaded(service.model_limiter.retry_after())
+
+    # An unlocked lock is taken without waiting, so no other request can
+    # slip in between the check above and here
+    await session.lock.acquire()
+    session.last_used = time.monotonic()
+    if request.query_params.get("stream") in ("1", "true"):
+        return SessionStream(session, query)
+
+    try:
+        response = await session.chat.run(query)
+    except ModelOverloadedError as e:
+        return _overloaded(e.retry_after)
+    finally:
+        session.last_used = time.monotonic()
+        session.lock.release()
+    return JSONResponse({"response": response})
+
+
+class SessionStream(StreamingResponse):
+    """Streams the answer to a query as plain text. The session's lock is
+    taken before the response is returned and released once it has been
+    sent, or the client has gone, even if streaming never started."""
+
+    def __init__(self, session: Session, query: str):
+        super().__init__(_stream(session, query), media_type="text/plain; charset=utf-8")
+        self.session = session
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Finish the query's cleanup before the next query can start
+            await self.body_iterator.aclose()
+            self.session.last_used = time.monotonic()
+            self.session.lock.release()
+
+
+async def _stream(session: Session, query: str):
+    try:
+        async for text in session.chat.run_stream(query):
+            yield text
+    except ModelOverloadedError as e:
+        # Headers are already sent, so the 429 becomes a closing line
+        yield f"\n❌ Model capacity is saturated, retry in {max(1, round(e.retry_after))}s."
+
+
+async def get_stats(request: Request) -> JSONResponse:
+    service: ChatService = request.app.state.service
+    return JSONResponse({"service": service.stats(), **metrics.snapshot()})
+
+
+def create_app(server_scripts: list[str]) -> Starlette:
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        gemini_service = Gemini(model=gemini_model, api_key=gemini_api_key)
+        clients = build_clients(server_scripts)
+        failures = await start_clients(clients)
+        for client_id, error in failures.items():
+            print(f"[ERROR] service: Failed to start MCP server '{client_id}': {type(error).__name__}: {error}")
+        try:
+            if "doc_client" not in clients:
+                raise RuntimeError("the document server failed to start")
+            await gemini_service.load_sdk_async()
+            app.state.service = ChatService(
+                clients,
+                gemini_service,
+                ModelCallLimiter(
+                    max_concurrent=model_max_concurrent,
+                    max_waiting=model_max_waiting,
+                    quota_cooldown=model_quota_cooldown,
+                ),
+                max_sessions=max_sessions,
+                session_ttl=session_ttl,
+            )
+            yield
+        finally:
+            await stop_clients(clients)
+
+    return Starlette(
+        routes=[
+            Route("/sessions", create_session, methods=["POST"]),
+            Route("/sessions/{session_id}", delete_session, methods=["DELETE"]),
+            Route("/sessions/{session_id}/messages", post_message, methods=["POST"]),
+            Route("/stats", get_stats, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve many chat sessions over HTTP")
+    parser.add_argument("--host", default=service_host)
+    parser.add_argument("--port", type=int, default=service_port)
+    parser.add_argument("server_scripts", nargs="*", help="Extra MCP servers, as in main.py")
+    options = parser.parse_args()
+
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+    uvicorn.run(create_app(options.server_scripts), host=options.host, port=options.port)
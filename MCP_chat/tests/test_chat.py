@@ -0,0 +1,178 @@
+import asyncio
+
+from core import gemini as gemini_module
+from core.chat import Chat
+from core.context import ContextBudget
+from core.gemini import Gemini
+from core.limiter import ModelCallLimiter
+
+
+class FakeChatSession:
+    def __init__(self, history):
+        self.history = list(history)
+        self.model = None
+        self.sent = []
+
+    async def send_message_async(self, parts, stream=False):
+        # Like the SDK's ChatSession, keep the request and the reply
+        to_content = gemini_module.content_types.to_content
+        self.sent.append(parts)
+        self.history += [
+            to_content({"role": "user", "parts": list(parts)}),
+            to_content({"role": "model", "parts": [{"text": "ok"}]}),
+        ]
+        return None
+
+
+class FakeModel:
+    def __init__(self):
+        self.sessions = []
+
+    def start_chat(self, history=None):
+        session = FakeChatSession(history or [])
+        self.sessions.append(session)
+        return session
+
+
+def history_text(session) -> str:
+    return " ".join(part.text for content in session.history for part in content.parts)
+
+
+def test_compaction_rebuilds_the_chat_session():
+    gemini = Gemini("test-model", "test-key")
+    model = FakeModel()
+    gemini._get_model = lambda **kwargs: model
+    budget = ContextBudget(max_tokens=95, keep_recent=2)
+    chat = Chat(gemini, {}, context_budget=budget)
+    document = '<document id="report.md">' + "secret " * 40 + "</document>"
+
+    async def send():
+        chat._turn_start = len(chat.messages) - 1
+        await chat._compact_history()
+        await gemini.chat_async(messages=chat.messages, session_id=chat.session_id)
+        chat.messages.append({"role": "model", "parts": [{"text": "ok"}]})
+
+    async def run():
+        chat.messages.append({"role": "user", "parts": [{"text": document}]})
+        await send()
+        chat.messages.append({"role": "user", "parts": [{"text": "short"}]})
+        await send()
+        chat.messages.append({"role": "user", "parts": [{"text": "again " * 10}]})
+        await send()
+
+    asyncio.run(run())
+    # Only the third request goes over budget. It compacts the document out
+    # of the first message, which the live session had already been sent.
+    assert "secret" not in chat.messages[0]["parts"][0]["text"]
+    assert len(model.sessions) == 2
+    latest = model.sessions[-1]
+    assert "secret" not in history_text(latest)
+    assert 'document id="report.md"' in history_text(latest)
+    assert len(latest.history) == len(chat.messages)
+
+
+def test_streaming_reader_does_not_hold_the_model_slot():
+    gemini = Gemini("test-model", "test-key")
+    limiter = ModelCallLimiter(max_concurrent=1)
+    chat = Chat(gemini, {}, model_limiter=limiter)
+
+    async def chat_stream(**kwargs):
+        for text in ("Hello", " world"):
+            yield gemini_module.protos.Part(text=text)
+
+    gemini.chat_stream = chat_stream
+
+    async def run():
+        await gemini.load_sdk_async()
+        stream = chat.run_stream("hi")
+        first = await anext(stream)
+        # The reader is still on the first part, but the model is done
+        for _ in range(10):
+            await asyncio.sleep(0)
+        in_flight = limiter.in_flight
+        rest = [text async for text in stream]
+        return [first] + rest, in_flight
+
+    texts, in_flight = asyncio.run(run())
+    assert texts == ["Hello", " world"]
+    assert in_flight == 0
+    assert limiter.in_flight == 0
+    assert chat.messages[-1] == {"role": "model", "parts": [{"text": "Hello world"}]}
+
+
+def test_closing_the_stream_stops_the_model_call():
+    gemini = Gemini("test-model", "test-key")
+    limiter = ModelCallLimiter(max_concurrent=1)
+    chat = Chat(gemini, {}, model_limiter=limiter)
+
+    async def chat_stream(**kwargs):
+        yield gemini_module.protos.Part(text="Hello")
+        await asyncio.sleep(60)
+        yield gemini_module.protos.Part(text=" world")
+
+    gemini.chat_stream = chat_stream
+
+    async def run():
+        await gemini.load_sdk_async()
+        stream = chat.run_stream("hi")
+        assert await anext(stream) == "Hello"
+        await stream.aclose()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert limiter.in_flight == 0
+    assert chat.messages == []
+
+
+def test_a_stalled_model_call_ends_at_the_query_deadline():
+    gemini = Gemini("test-model", "test-key")
+    limiter = ModelCallLimiter(max_concurrent=1)
+    chat = Chat(gemini, {}, query_timeout=0.1, model_limiter=limiter)
+
+    async def chat_async(**kwargs):
+        await asyncio.sleep(60)
+
+    async def chat_stream(**kwargs):
+        yield gemini_module.protos.Part(text="Hello")
+        await asyncio.sleep(60)
+
+    gemini.chat_async = chat_async
+    gemini.chat_stream = chat_stream
+
+    async def run():
+        await gemini.load_sdk_async()
+        answer = await chat.run("hi")
+        streamed = [text async for text in chat.run_stream("again")]
+        return answer, streamed
+
+    answer, streamed = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert answer.startswith("❌ Query deadline")
+    assert streamed[0] == "Hello"
+    assert streamed[1] == "\n" + answer
+    assert limiter.in_flight == 0
+    # Each turn is closed so the history still alternates
+    assert [message["role"] for message in chat.messages] == ["user", "model", "user", "model"]
+    assert chat.messages[-1] == {"role": "model", "parts": [{"text": answer}]}
+
+
+def test_tool_loop_text_is_returned_not_printed(capsys):
+    gemini = Gemini("test-model", "test-key")
+    chat = Chat(gemini, {})
+    calls = []
+
+    async def chat_async(**kwargs):
+        protos = gemini_module.protos
+        calls.append(len(calls))
+        if len(calls) == 1:
+            parts = [protos.Part(text="Let me look."), protos.Part(function_call=protos.FunctionCall(name="search"))]
+        else:
+            parts = [protos.Part(text="Found it.")]
+        return gemini.message_from_parts(parts)
+
+    gemini.chat_async = chat_async
+
+    async def run():
+        await gemini.load_sdk_async()
+        return await chat.run("hi")
+
+    assert asyncio.run(run()) == "Let me look.\nFound it."
+    assert "Let me look." not in capsys.readouterr().out
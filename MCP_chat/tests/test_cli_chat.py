@@ -0,0 +1,33 @@
+import asyncio
+
+from core.cli_chat import CliChat
+from doc_store import document_stats
+
+
+class FakeDocClient:
+    def __init__(self, docs: dict[str, str]):
+        self.docs = docs
+        self.reads: list[str] = []
+
+    async def read_resource(self, uri: str):
+        if uri == "docs://documents":
+            return list(self.docs)
+        doc_id = uri[len("docs://documents/"):]
+        if doc_id.endswith("/metadata"):
+            doc_id = doc_id[:-len("/metadata")]
+            return {**document_stats(self.docs[doc_id]), "chunks": 1}
+        self.reads.append(doc_id)
+        return self.docs[doc_id]
+
+
+def test_only_documents_that_fit_the_remaining_budget_are_read():
+    client = FakeDocClient({"a.md": "a" * 60, "b.md": "b" * 60, "c.md": "c" * 30})
+    chat = CliChat(client, {"doc_client": client}, None, inline_bytes_budget=100)
+
+    resources = asyncio.run(chat._extract_resources("Compare @a.md @b.md and @c.md"))
+
+    # b.md fits the whole budget but not what a.md left of it
+    assert client.reads == ["a.md", "c.md"]
+    assert '<document id="a.md">' in resources
+    assert '<document id="b.md" size="60 bytes"' in resources
+    assert '<document id="c.md">' in resources
@@ -0,0 +1,97 @@
+import asyncio
+
+from core.context import DROPPED_TOOL_RESULT, ContextBudget
+
+
+def user(text: str) -> dict:
+    return {"role": "user", "parts": [{"text": text}]}
+
+
+def model(text: str) -> dict:
+    return {"role": "model", "parts": [{"text": text}]}
+
+
+def tool_result(name: str, result: str) -> dict:
+    return {"role": "user", "parts": [{"function_response": {"name": name, "response": {"result": result}}}]}
+
+
+def tool_call(name: str) -> dict:
+    return {"role": "model", "parts": [{"function_call": {"name": name, "args": {}}}]}
+
+
+def test_history_under_budget_is_left_alone():
+    messages = [user("hello"), model("hi")]
+    before = list(messages)
+    assert asyncio.run(ContextBudget(max_tokens=1000).compact(messages, protect_from=1)) == 1
+    assert all(new is old for new, old in zip(messages, before))
+
+
+def test_tool_results_and_documents_are_lightened_first():
+    document = '<document id="a.md">' + "word " * 200 + "</document>"
+    messages = [
+        user(document),
+        tool_call("read"),
+        tool_result("read", "result " * 200),
+        model("answer"),
+        user("next"),
+        model("reply"),
+    ]
+    before = list(messages)
+    budget = ContextBudget(max_tokens=100, keep_recent=2)
+
+    assert asyncio.run(budget.compact(messages, protect_from=4)) == 4
+    assert len(messages) == 6
+    assert messages[0]["parts"][0]["text"].startswith('<document id="a.md" content="removed')
+    assert messages[2]["parts"][0]["function_response"] == {
+        "name": "read",
+        "response": {"result": DROPPED_TOOL_RESULT},
+    }
+    # Compacted messages are replaced, never edited in place, and the
+    # others are kept as they were
+    assert before[0]["parts"][0]["text"] == document
+    assert [new is old for new, old in zip(messages, before)] == [False, True, False, True, True, True]
+    assert budget.total_tokens(messages) <= 100
+
+
+def test_whole_turns_are_dropped_at_a_turn_boundary():
+    messages = [
+        user("first " * 100), model("one " * 100),
+        user("second " * 100), model("two " * 100),
+        user("third"), model("three"),
+    ]
+    third = messages[4]
+    budget = ContextBudget(max_tokens=60, keep_recent=2)
+
+    protect_from = asyncio.run(budget.compact(messages, protect_from=4))
+
+    # Both earlier turns go, and the note is put on the turn that is kept
+    assert protect_from == 0
+    assert len(messages) == 2
+    assert messages[0]["parts"][0]["text"].startswith("[Earlier conversation omitted")
+    assert messages[0]["parts"][1:] == third["parts"]
+    assert messages[1] == model("three")
+
+
+def test_summarizer_replaces_dropped_turns():
+    summarized = []
+
+    async def summarizer(messages):
+        summarized.append(messages)
+        return "they said hello"
+
+    messages = [user("hello " * 100), model("hi " * 100), user("again"), model("ok")]
+    budget = ContextBudget(max_tokens=30, keep_recent=2, summarizer=summarizer)
+
+    assert asyncio.run(budget.compact(messages, protect_from=2)) == 0
+    assert len(summarized[0]) == 2
+    assert messages[0]["parts"][0]["text"] == "Summary of the earlier conversation:\nthey said hello"
+    assert messages[0]["parts"][1] == {"text": "again"}
+
+
+def test_current_turn_is_never_dropped():
+    messages = [user("question " * 100), tool_call("read"), tool_result("read", "x " * 100), model("done")]
+    budget = ContextBudget(max_tokens=10, keep_recent=1)
+
+    assert asyncio.run(budget.compact(messages, protect_from=0)) == 0
+    assert len(messages) == 4
+    assert messages[0]["parts"][0]["text"] == "question " * 100
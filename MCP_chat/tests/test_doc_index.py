@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from doc_index import InvertedIndex, bm25_top, find_snippets, scan_snippets, term_counts
+
+WORDS = ["foo", "bar", "foobar", "baz", "x", "Foo", " ", "\n", ".", "é"]
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(WORDS) for _ in range(length))
+
+
+@pytest.mark.parametrize("window", [1, 2, 7, 40, 65536])
+def test_scan_snippets_matches_find_snippets(window):
+    rng = random.Random(window)
+    for _ in range(300):
+        text = random_text(rng, rng.randint(0, 200))
+        terms = rng.sample(["foo", "bar", "foobar", "x"], rng.randint(0, 3))
+        max_snippets, context = rng.randint(1, 8), rng.randint(0, 10)
+        reads = []
+
+        def read(offset, length):
+            reads.append(length)
+            return text[offset:offset + length]
+
+        expected = find_snippets(text, terms, max_snippets, context)
+        assert scan_snippets(read, terms, max_snippets, context, window=window) == expected
+        assert max(reads, default=0) <= 2 * window + 2 * (len("foobar") + context + 1)
+
+
+def test_scan_snippets_stops_after_max_chars():
+    text = "x " * 1000 + "foo"
+    assert scan_snippets(lambda offset, length: text[offset:offset + length], ["foo"], window=100, max_chars=1000) == []
+    assert scan_snippets(lambda offset, length: text[offset:offset + length], ["foo"], window=100, max_chars=3000)
+
+
+def test_index_edits_match_a_rebuild():
+    rng = random.Random(0)
+    docs = {f"d{i}": random_text(rng, 50) for i in range(20)}
+    index = InvertedIndex()
+    for doc_id, text in docs.items():
+        index.update(doc_id, term_counts(""), term_counts(text))
+    for _ in range(100):
+        doc_id = rng.choice(list(docs))
+        old = docs[doc_id]
+        start = rng.randint(0, len(old))
+        end = rng.randint(start, len(old))
+        new = old[:start] + random_text(rng, rng.randint(0, 5)) + old[end:]
+        index.update(doc_id, term_counts(old), term_counts(new))
+        docs[doc_id] = new
+
+    rebuilt = InvertedIndex()
+    for doc_id, text in docs.items():
+        rebuilt.update(doc_id, term_counts(""), term_counts(text))
+    assert index.postings == rebuilt.postings
+    assert index.doc_lengths == rebuilt.doc_lengths
+    assert index.total_length == rebuilt.total_length
+    assert index.search("foo baz", 5) == rebuilt.search("foo baz", 5)
+
+
+def test_bm25_pruning_keeps_the_top_documents():
+    rng = random.Random(1)
+    vocabulary = [f"t{i}" for i in range(30)]
+    index = InvertedIndex()
+    for i in range(300):
+        # Skewed so some terms are common and some rare
+        words = [vocabulary[min(int(rng.expovariate(0.2)), 29)] for _ in range(rng.randint(5, 40))]
+        index.update(f"d{i}", term_counts(""), term_counts(" ".join(words)))
+
+    def fetch(term):
+        return [(doc_id, tf, index.doc_lengths[doc_id]) for doc_id, tf in index.postings[term].items()]
+
+    for query in (["t0", "t1", "t20"], ["t2", "t3"], ["t25", "t0", "t5", "t9"]):
+        doc_freqs = {term: len(index.postings.get(term, ())) for term in query}
+        args = (len(index.doc_lengths), index.total_length, 10)
+        exhaustive = bm25_top(doc_freqs, fetch, lambda term, doc_ids: fetch(term), *args)
+        assert index.search(" ".join(query), 10) == pytest.approx(exhaustive)
@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+from doc_store import DocumentNotFoundError, MemoryDocumentStore, SQLiteDocumentStore, document_stats
+
+
+@pytest.fixture(params=["memory", "sqlite", "sqlite-journaled"])
+def open_store(request, tmp_path):
+    """Opens a store; for SQLite, opening again gives a new store on the
+    same file, as after a restart."""
+    path = tmp_path / "documents.db"
+    stores = []
+
+    def open_store(**options):
+        if request.param == "memory":
+            store = stores[0] if stores else MemoryDocumentStore()
+        else:
+            # journal_min_chars=0 journals every edit, however small the document
+            journal_min_chars = 0 if request.param == "sqlite-journaled" else 65536
+            store = SQLiteDocumentStore(str(path), journal_min_chars=journal_min_chars, **options)
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        if isinstance(store, SQLiteDocumentStore):
+            store._db.close()
+
+
+def test_batch_of_one_string_at_chosen_offsets(open_store):
+    store = open_store()
+    store.put("a", "aa aa aa")
+    edit = store.replace_many("a", [("aa", "X", 0), ("aa", "X", 6)])
+    assert store.get("a") == "X aa X"
+    assert edit.summary()["replacements"] == 2
+    assert store.metadata("a") == document_stats("X aa X")
+    assert [doc_id for doc_id, _ in store.search("aa")] == ["a"]
+    # Reopened without a flush, the journal must replay to the same text
+    reopened = open_store()
+    assert reopened.get("a") == "X aa X"
+    assert reopened.metadata("a") == document_stats("X aa X")
+
+
+@pytest.mark.parametrize("journal_min_chars", [0, 65536])
+def test_two_stores_share_a_file(tmp_path, journal_min_chars):
+    path = str(tmp_path / "documents.db")
+    first = SQLiteDocumentStore(path, journal_min_chars=journal_min_chars)
+    second = SQLiteDocumentStore(path, journal_min_chars=journal_min_chars)
+    first.put("doc", "one two three")
+    expected = "one two three"
+    for i, (store, other) in enumerate([(first, second), (second, first)] * 3):
+        old = expected.split()[i % 3]
+        store.replace("doc", old, f"{old}{i}")
+        expected = expected.replace(old, f"{old}{i}")
+        assert other.get("doc") == expected
+        assert other.read_range("doc", 0, 3) == expected[:3]
+        assert other.metadata("doc") == document_stats(expected)
+    first.flush()
+    assert second.get("doc") == expected
+    assert [doc_id for doc_id, _ in second.search(expected.split()[0])] == ["doc"]
+    first.close()
+    second.close()
+
+
+def test_random_edits_match_str(open_store):
+    # Tiny limits so journals are flushed and documents evicted often
+    store = open_store(journal_limit=3, max_open_docs=2)
+    rng = random.Random(0)
+    words = ["alpha", "beta", "gamma", "delta", "\n"]
+    docs = {f"d{i}.md": " ".join(rng.choices(words, k=30)) for i in range(4)}
+    store.put_many(docs.items())
+    for step in range(200):
+        doc_id = rng.choice(list(docs))
+        text = docs[doc_id]
+        old, new = rng.choice(words[:4]), rng.choice(words[:4]) + rng.choice(["", "s", " x"])
+        if old not in text:
+            continue
+        if step % 3 == 0:
+            offset = text.find(old, rng.randint(0, len(text)))
+            offset = text.find(old) if offset < 0 else offset
+            store.replace(doc_id, old, new, offset)
+            docs[doc_id] = text[:offset] + new + text[offset + len(old):]
+        elif step % 3 == 1:
+            store.replace(doc_id, old, new)
+            docs[doc_id] = text.replace(old, new)
+        else:
+            second = next((word for word in words[:4] if word != old and word in text), None)
+            edits = [(old, new, None)] + ([(second, second.upper(), None)] if second else [])
+            store.replace_many(doc_id, edits)
+            for old_string, new_string, _ in reversed(edits):
+                docs[doc_id] = docs[doc_id].replace(old_string, new_string)
+        # Sizes are kept from each edit's deltas rather than recounted
+        assert store.metadata(doc_id) == document_stats(docs[doc_id])
+        if step % 50 == 49:
+            store = open_store(journal_limit=3, max_open_docs=2)
+
+    reference = MemoryDocumentStore()
+    reference.put_many(docs.items())
+    for doc_id, text in docs.items():
+        assert store.get(doc_id) == text
+        assert store.metadata(doc_id) == document_stats(text)
+        assert store.read_range(doc_id, 5, 20) == text[5:25]
+        assert store.read_lines(doc_id, 2, 1) == "".join(text.splitlines(keepends=True)[1:2])
+    for query in ("alpha", "betas gamma", "x delta"):
+        assert [doc_id for doc_id, _ in store.search(query)] == [doc_id for doc_id, _ in reference.search(query)]
+
+
+def test_failed_batch_changes_nothing(open_store):
+    store = open_store()
+    store.put("a", "one two three two")
+    with pytest.raises(ValueError) as error:
+        store.replace_many("a", [("one", "1", None), ("four", "4", None), ("two", "2", 0), ("one", "i", None)])
+    message = str(error.value)
+    assert "edit 1: old_string was not found" in message
+    assert "edit 2: old_string was not found at offset 0" in message
+    assert "edit 3: old_string is the same as edit 0's" in message
+    with pytest.raises(ValueError, match="edits 0 and 1 overlap"):
+        store.replace_many("a", [("two three", "x", 4), ("three", "y", 8)])
+    assert store.get("a") == "one two three two"
+    assert [doc_id for doc_id, _ in store.search("one")] == ["a"]
+    assert open_store().get("a") == "one two three two"
+
+
+def test_edit_summary_lists_changes_around_the_edit(open_store):
+    store = open_store()
+    store.put("a", "the old report and the old plan")
+    summary = store.replace("a", "old", "new").summary()
+    assert summary["replacements"] == 2
+    assert [change["offset"] for change in summary["changes"]] == [4, 23]
+    with pytest.raises(ValueError, match="not found at offset 0"):
+        store.replace("a", "new", "old", 0)
+    with pytest.raises(DocumentNotFoundError):
+        store.replace("missing", "a", "b")
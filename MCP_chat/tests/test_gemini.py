@@ -0,0 +1,42 @@
+from typing import Optional
+
+from google.generativeai.types import content_types
+from pydantic import BaseModel, Field, create_model
+
+from core.gemini import Gemini
+
+
+class Replacement(BaseModel):
+    old_string: str
+    new_string: str
+    offset: Optional[int] = Field(default=None, description="Where the old string starts")
+
+
+def declaration(**fields) -> dict:
+    """The Gemini declaration of a tool taking the given pydantic fields."""
+    arguments = create_model("Arguments", **fields)
+    tool = {"name": "tool", "description": "", "input_schema": arguments.model_json_schema()}
+    return Gemini("test-model", "test-key")._convert_tool_to_gemini_format(tool, 0)
+
+
+def test_optional_parameters_keep_their_type():
+    parameters = declaration(doc_id=(str, ...), offset=(Optional[int], None))["parameters"]
+    assert parameters["properties"]["offset"] == {"type": "integer", "nullable": True}
+    assert parameters["required"] == ["doc_id"]
+
+
+def test_optional_fields_of_nested_models_keep_their_type():
+    parameters = declaration(edits=(list[Replacement], ...))["parameters"]
+    item = parameters["properties"]["edits"]["items"]
+    assert item["properties"]["offset"] == {
+        "type": "integer",
+        "nullable": True,
+        "description": "Where the old string starts",
+    }
+    assert item["properties"]["old_string"] == {"type": "string"}
+
+
+def test_declarations_are_accepted_by_the_sdk():
+    tool = declaration(offset=(Optional[int], None), edits=(list[Replacement], ...))
+    proto = content_types.FunctionDeclaration(**tool).to_proto()
+    assert proto.parameters.properties["offset"].nullable
@@ -0,0 +1,270 @@
+import asyncio
+import os
+
+import anyio
+import pytest
+from mcp import types
+
+import mcp_client
+from mcp_client import MCPClient
+
+
+class FakeServer:
+    """What a fake session serves; shared by every connection to it."""
+
+    def __init__(self):
+        self.documents = {"a.md": "first"}
+        self.reads = 0
+        self.connections = 0
+        self.sessions: list["FakeSession"] = []
+
+
+class FakeSession:
+    def __init__(self, server: FakeServer):
+        self.server = server
+        # Set when the transport under the session breaks
+        self.broken = False
+        self._request_id = 0
+        self.cancelled: list[int] = []
+
+    def _check(self):
+        if self.broken:
+            raise anyio.BrokenResourceError()
+
+    async def read_resource(self, uri):
+        self.server.reads += 1
+        doc_id = str(uri)[len("docs://documents/"):]
+        contents = types.TextResourceContents(uri=uri, mimeType="text/plain", text=self.server.documents[doc_id])
+        return types.ReadResourceResult(contents=[contents])
+
+    async def subscribe_resource(self, uri):
+        return types.EmptyResult()
+
+    async def call_tool(self, name, arguments):
+        self._check()
+        self._request_id += 1
+        if name == "stall":
+            await asyncio.Event().wait()
+        return types.CallToolResult(content=[types.TextContent(type="text", text=f"{name} done")])
+
+    async def send_notification(self, notification):
+        self.cancelled.append(notification.root.params.requestId)
+
+    async def list_tools(self):
+        return types.ListToolsResult(tools=[types.Tool(name="echo", inputSchema={"type": "object"})])
+
+    async def list_prompts(self):
+        return types.ListPromptsResult(prompts=[])
+
+    async def send_ping(self):
+        self._check()
+        return types.EmptyResult()
+
+
+class FakeClient(MCPClient):
+    """An MCPClient whose connections are fake sessions to server."""
+
+    def __init__(self, server: FakeServer, **options):
+        super().__init__(command="fake-server", **options)
+        self.server = server
+
+    async def connect(self):
+        self.server.connections += 1
+        self._session = FakeSession(self.server)
+        self.server.sessions.append(self._session)
+        self.server_capabilities = types.ServerCapabilities(
+            resources=types.ResourcesCapability(subscribe=True),
+            tools=types.ToolsCapability(),
+        )
+
+
+def resource_updated(uri: str) -> types.ServerNotification:
+    return types.ServerNotification(
+        types.ResourceUpdatedNotification(
+            method="notifications/resources/updated",
+            params=types.ResourceUpdatedNotificationParams(uri=uri),
+        )
+    )
+
+
+async def wait_until(predicate, timeout: float = 2.0):
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout=timeout)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def test_subscribed_resources_are_dropped_on_update(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(mcp_client.time, "monotonic", clock.monotonic)
+    server = FakeServer()
+    client = FakeClient(server)
+    uri = "docs://documents/a.md"
+
+    async def run():
+        await client.connect()
+        assert await client.read_resource(uri) == "first"
+        server.documents["a.md"] = "second"
+        assert await client.read_resource(uri) == "first"
+        await client._handle_message(resource_updated(uri))
+        assert await client.read_resource(uri) == "second"
+
+    asyncio.run(run())
+    assert server.reads == 2
+
+
+def test_cached_resources_expire(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(mcp_client.time, "monotonic", clock.monotonic)
+    server = FakeServer()
+    client = FakeClient(server, resource_ttl=30, subscribed_resource_ttl=300)
+    uri = "docs://documents/a.md"
+
+    async def run():
+        await client.connect()
+        await client.read_resource(uri)
+        # Changed without a notification, as by another server process
+        server.documents["a.md"] = "second"
+        clock.now += 100
+        assert await client.read_resource(uri) == "first"
+        clock.now += 201
+        assert await client.read_resource(uri) == "second"
+
+        # Without subscriptions the shorter TTL applies
+        client.server_capabilities = types.ServerCapabilities()
+        client._subscribed.clear()
+        client.invalidate_resource()
+        await client.read_resource(uri)
+        server.documents["a.md"] = "third"
+        clock.now += 31
+        assert await client.read_resource(uri) == "third"
+
+    asyncio.run(run())
+    assert server.reads == 4
+
+
+def test_a_broken_connection_fails_pending_calls():
+    server = FakeServer()
+    client = FakeClient(server, health_check_interval=0.01)
+
+    async def run():
+        await client.start()
+        stalled = asyncio.create_task(client.call_tool("stall", {}))
+        await wait_until(lambda: client._inflight)
+        # The next health check fails and the supervisor reconnects
+        server.sessions[0].broken = True
+        with pytest.raises(ConnectionError):
+            await stalled
+        await wait_until(lambda: client._connected.is_set())
+        result = await client.call_tool("echo", {})
+        await client.stop()
+        return result
+
+    result = asyncio.run(run())
+    assert result.content[0].text == "echo done"
+    assert server.connections == 2
+    assert client.restarts == 1
+    # The server is told to drop the aborted call, if it can still hear it
+    assert server.sessions[0].cancelled == [0]
+
+
+def test_a_call_on_a_broken_pipe_is_retried_after_reconnect():
+    server = FakeServer()
+    client = FakeClient(server, health_check_interval=60)
+
+    async def run():
+        await client.start()
+        server.sessions[0].broken = True
+        result = await client.call_tool("echo", {})
+        await client.stop()
+        return result
+
+    result = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert result.content[0].text == "echo done"
+    assert server.connections == 2
+    assert client.restarts == 1
+
+
+def test_fail_fast_does_not_retry():
+    server = FakeServer()
+    client = FakeClient(server, health_check_interval=60, fail_fast=True)
+
+    async def run():
+        await client.start()
+        server.sessions[0].broken = True
+        with pytest.raises(ConnectionError):
+            await client.call_tool("echo", {})
+        await client.stop()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+
+def test_an_idle_lazy_server_is_shut_down_and_respawned(tmp_path):
+    server = FakeServer()
+    manifest_path = str(tmp_path / "manifest.json")
+    client = FakeClient(server, lazy=True, manifest_path=manifest_path, idle_timeout=0.05)
+
+    async def run():
+        # No manifest yet, so the server starts to fetch the catalogs
+        await client.start()
+        assert server.connections == 1
+        assert os.path.exists(manifest_path)
+
+        await wait_until(lambda: not client.running)
+        assert client._session is None
+        # The catalogs are still advertised while the server is down
+        assert [tool.name for tool in await client.list_tools()] == ["echo"]
+        assert server.connections == 1
+
+        result = await client.call_tool("echo", {})
+        assert client.running
+        await client.stop()
+        return result
+
+    result = asyncio.run(run())
+    assert result.content[0].text == "echo done"
+    assert server.connections == 2
+
+
+def test_a_lazy_client_starts_from_its_manifest(tmp_path):
+    server = FakeServer()
+    manifest_path = str(tmp_path / "manifest.json")
+    script = tmp_path / "server.py"
+    script.write_text("")
+
+    async def start_client() -> FakeClient:
+        client = FakeClient(server, args=[str(script)], lazy=True, manifest_path=manifest_path)
+        await client.start()
+        return client
+
+    async def run():
+        first = await start_client()
+        await first.stop()
+        assert server.connections == 1
+
+        # A usable manifest: no server until the first request
+        second = await start_client()
+        assert not second.running
+        assert [tool.name for tool in await second.list_tools()] == ["echo"]
+        assert server.connections == 1
+        assert await second.read_resource("docs://documents/a.md") == "first"
+        assert server.connections == 2
+        await second.stop()
+
+        # The server script changed, so the manifest is not trusted
+        os.utime(script, (0, 0))
+        third = await start_client()
+        assert third.running
+        assert server.connections == 3
+        await third.stop()
+
+    asyncio.run(run())
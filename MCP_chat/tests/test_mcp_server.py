@@ -0,0 +1,12 @@
+import os
+
+# Keep the server's store in memory rather than next to the script
+os.environ.setdefault("DOC_STORE_BACKEND", "memory")
+
+import mcp_server  # noqa: E402
+
+
+def test_sdk_patches_apply_to_the_pinned_version():
+    assert mcp_server.mcp_version == mcp_server.PATCHED_MCP_VERSION
+    options = mcp_server.mcp._mcp_server.create_initialization_options()
+    assert options.capabilities.resources.subscribe
@@ -0,0 +1,103 @@
+import random
+import re
+
+import pytest
+
+import piece_table
+from piece_table import PieceTable
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Small blocks and windows so a short text spans many of each
+    monkeypatch.setattr(piece_table, "BLOCK_PIECES", 4)
+    monkeypatch.setattr(piece_table, "SEARCH_WINDOW", 7)
+
+
+def edited(rng: random.Random, edits: int) -> tuple[PieceTable, str]:
+    """A table after random edits, and the string it should hold."""
+    text = "".join(rng.choice("ab \n") for _ in range(40))
+    table = PieceTable(text)
+    for _ in range(edits):
+        start = rng.randint(0, len(text))
+        end = rng.randint(start, min(len(text), start + 5))
+        new = "".join(rng.choice("ab") for _ in range(rng.randint(0, 4)))
+        table.replace(start, end - start, new)
+        text = text[:start] + new + text[end:]
+    return table, text
+
+
+def test_edits_and_slices_match_str():
+    rng = random.Random(0)
+    for _ in range(50):
+        table, text = edited(rng, 60)
+        assert table.text() == text
+        assert len(table) == len(text)
+        for _ in range(20):
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, len(text) + 3)
+            assert table.slice(start, end) == text[start:end]
+
+
+def test_insert_and_delete():
+    table = PieceTable("hello world")
+    table.insert(5, ",")
+    table.delete(0, 1)
+    table.insert(0, "J")
+    assert table.text() == "Jello, world"
+    assert table.piece_count > 1
+
+
+def test_find_matches_str_find():
+    rng = random.Random(1)
+    for _ in range(50):
+        table, text = edited(rng, 30)
+        for sub in ("a", "ab", "ba b", "aab", "b\na"):
+            start = rng.randint(0, len(text))
+            assert table.find(sub, start) == text.find(sub, start)
+
+
+def test_find_all_matches_str_replace():
+    rng = random.Random(2)
+    for _ in range(50):
+        table, text = edited(rng, 30)
+        for sub in ("a", "aa", "aba", "b a"):
+            offsets = list(table.find_all(sub))
+            assert offsets == [match.start() for match in re.finditer(re.escape(sub), text)]
+
+
+def test_find_any_takes_the_longest_match():
+    rng = random.Random(3)
+    for _ in range(50):
+        table, text = edited(rng, 30)
+        subs = ["a", "ab", "abab", "b b"]
+        pattern = re.compile("|".join(map(re.escape, sorted(subs, key=len, reverse=True))))
+        expected = [(match.start(), match.group()) for match in pattern.finditer(text)]
+        assert list(table.find_any(subs)) == expected
+
+
+def test_empty_search_is_rejected():
+    table = PieceTable("abc")
+    with pytest.raises(ValueError):
+        table.find("")
+    with pytest.raises(ValueError):
+        list(table.find_all(""))
+    with pytest.raises(ValueError):
+        list(table.find_any(["a", ""]))
+
+
+def test_line_offset_matches_str(monkeypatch):
+    monkeypatch.setattr(piece_table, "LINE_SCAN_CHUNK", 5)
+    rng = random.Random(4)
+    for _ in range(50):
+        table, text = edited(rng, 30)
+        for _ in range(20):
+            start = rng.randint(0, len(text))
+            lines = rng.randint(0, 12)
+            expected = start
+            for _ in range(lines):
+                expected = text.find("\n", expected) + 1
+                if not expected:
+                    expected = len(text)
+                    break
+            assert table.line_offset(lines, start) == expected
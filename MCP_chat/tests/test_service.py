@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+
+# main refuses to load without a key; none of these tests call the model
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import main  # noqa: E402
+import service  # noqa: E402
+from core.limiter import ModelCallLimiter  # noqa: E402
+
+
+class FakeChat:
+    session_id = "fake"
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def run_stream(self, query):
+        yield "thinking"
+        await self.release.wait()
+        yield " done"
+
+
+def message_request(app: Starlette, session_id: str, query: str) -> Request:
+    body = json.dumps({"query": query}).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "app": app,
+        "method": "POST",
+        "path": f"/sessions/{session_id}/messages",
+        "query_string": b"stream=1",
+        "headers": [],
+        "path_params": {"session_id": session_id},
+    }
+    return Request(scope, receive)
+
+
+def test_a_stream_reserves_its_session_before_it_starts():
+    app = Starlette()
+    app.state.service = service.ChatService({}, None, ModelCallLimiter())
+    chat = FakeChat()
+    app.state.service.sessions["s"] = session = service.Session(chat)
+
+    async def run():
+        first = await service.post_message(message_request(app, "s", "one"))
+        # The first answer has not started streaming yet
+        second = await service.post_message(message_request(app, "s", "two"))
+        assert second.status_code == 409
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        streaming = asyncio.create_task(first({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send))
+        await asyncio.sleep(0.01)
+        assert session.lock.locked()
+        chat.release.set()
+        await streaming
+        assert not session.lock.locked()
+        return b"".join(message.get("body", b"") for message in sent)
+
+    assert asyncio.run(run()) == b"thinking done"
+
+
+def test_session_summaries_wait_for_a_model_slot(monkeypatch):
+    monkeypatch.setattr(main, "context_summarize", True)
+    limiter = ModelCallLimiter(max_concurrent=1)
+    in_flight = []
+
+    class FakeGemini:
+        async def summarize(self, messages):
+            in_flight.append(limiter.in_flight)
+            return "summary"
+
+    chat_service = service.ChatService({"doc_client": None}, FakeGemini(), limiter)
+    session_id = chat_service.create_session()
+    budget = chat_service.sessions[session_id].chat.context_budget
+
+    assert asyncio.run(budget.summarizer([])) == "summary"
+    assert in_flight == [1]
+    assert limiter.in_flight == 0
@@ -0,0 +1,54 @@
+import pytest
+
+from core.spill import SpillStore
+from core.tools import ToolManager
+
+
+def test_pages_cover_the_text_without_splitting_characters(tmp_path):
+    store = SpillStore(str(tmp_path))
+    text = "naïve café ☕ 🎲 " * 50
+    handle = store.put(text)
+    assert store.size(handle) == len(text.encode("utf-8"))
+
+    for length in (1, 3, 7, 100):
+        pages, offset = [], 0
+        while offset is not None:
+            page = store.read(handle, offset, length)
+            assert page["offset"] == offset
+            # A page only goes over length to hold one whole character
+            assert len(page["text"].encode("utf-8")) <= max(length, 4)
+            assert "�" not in page["text"]
+            pages.append(page["text"])
+            offset = page["next_offset"]
+        assert "".join(pages) == text
+
+
+def test_large_tool_results_are_spilled_and_paged(tmp_path, monkeypatch):
+    monkeypatch.setattr(ToolManager, "spill_store", SpillStore(str(tmp_path)))
+    monkeypatch.setattr(ToolManager, "max_result_bytes", 1000)
+    monkeypatch.setattr(ToolManager, "result_preview_bytes", 100)
+    text = "".join(f"line {i}\n" for i in range(500))
+
+    result = ToolManager._tool_output_to_result([text])
+    assert result["truncated"]
+    assert text.startswith(result["preview"])
+    assert result["total_bytes"] == len(text)
+
+    pages = [result["preview"]]
+    offset = result["next_offset"]
+    while offset is not None:
+        # Asking for more than max_result_bytes gets a capped page
+        page = ToolManager._read_tool_result({"handle": result["handle"], "offset": offset, "length": 5000})
+        assert len(page["text"]) <= 1000
+        pages.append(page["text"])
+        offset = page["next_offset"]
+    assert "".join(pages) == text
+
+
+@pytest.mark.parametrize(
+    "args",
+    [{"handle": "missing"}, {"handle": "missing", "offset": "not a number"}],
+)
+def test_bad_read_tool_result_arguments_are_reported(tmp_path, monkeypatch, args):
+    monkeypatch.setattr(ToolManager, "spill_store", SpillStore(str(tmp_path)))
+    assert "error" in ToolManager._read_tool_result(args)